@@ -0,0 +1,356 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import argparse
+import importlib
+import inspect
+import json
+import multiprocessing as mp
+import platform
+import resource
+import subprocess
+import time
+import traceback
+from datetime import datetime
+from itertools import product
+
+import numpy as np
+
+"""
+Benchmark of the swarm environments: steps/sec, reset latency, time spent in each phase of a step and peak RSS,
+for every environment class, every map it can run and every agent and target count requested.
+
+Each configuration runs in its own process, so that the peak RSS and the GL context of a run do not leak into the
+next one. The results are written in a JSON file that can be given back with --baseline to compare two runs.
+
+Example Usage
+    cd src
+    python benchmarks/bench_envs.py --envs gym pettingzoo --agents 1 2 4 --targets 1 2 --steps 200
+    python benchmarks/bench_envs.py --output after.json --baseline before.json --tolerance 0.1
+"""
+
+# Environment classes, by short name: (module, class name)
+ENV_CLASSES = {
+    "single": ("swarm_env.single_env.single_agent", "SwarmEnv"),
+    "gym": ("swarm_env.multi_env.multi_agent_gym", "MultiSwarmEnv"),
+    "comm": ("swarm_env.multi_env.multi_agent_comm", "MASwarmTarget"),
+    "market": ("swarm_env.multi_env.multi_agent_market", "MASwarmMarket"),
+    "pettingzoo": ("swarm_env.multi_env.multi_agent_pettingzoo", "MultiSwarmEnv"),
+}
+
+# Phases recorded by the StepProfiler of the environments
+PHASES = ["physics", "sensors", "observation", "reward", "explored_map", "rendering", "info"]
+
+
+def available_maps(env_name):
+    """The maps an environment class can run are the keys of the map_dict of its module."""
+    module = importlib.import_module(ENV_CLASSES[env_name][0])
+    return list(module.map_dict.keys())
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def step_phases(profile, step_time):
+    """Seconds spent in each phase of the steps, the time not covered by a phase is reported as other."""
+    phases = {phase: profile["phases"].get(phase, 0.0) for phase in PHASES}
+    phases["other"] = step_time - sum(phases.values())
+    return phases
+
+
+class EnvDriver:
+    """
+    Steps the single agent, gym multi agent and pettingzoo environments through the same interface, with random
+    actions drawn from their action spaces.
+    """
+
+    def __init__(self, env, seed):
+        self.env = env
+        self.is_parallel_env = hasattr(env, "possible_agents")
+        self.is_multi_agent = isinstance(env.action_space, list)
+        if self.is_parallel_env:
+            self.spaces = {name: env.action_spaces[name] for name in env.possible_agents}
+        elif self.is_multi_agent:
+            self.spaces = dict(enumerate(env.action_space))
+        else:
+            self.spaces = {0: env.action_space}
+        for i, space in enumerate(self.spaces.values()):
+            space.seed(seed + i)
+
+    def reset(self, seed=None):
+        if self.is_multi_agent:
+            self.env.reset()
+        else:
+            self.env.reset(seed=seed)
+
+    def step(self):
+        """Step with random actions, returns True when the episode is over."""
+        actions = {key: space.sample() for key, space in self.spaces.items()}
+        if self.is_parallel_env:
+            _, _, terminations, truncations, _ = self.env.step(actions)
+            return any(terminations.values()) or any(truncations.values())
+        if self.is_multi_agent:
+            _, _, dones, _ = self.env.step(list(actions.values()))
+            return any(dones)
+        _, _, terminated, truncated, _ = self.env.step(actions[0])
+        return terminated or truncated
+
+
+def make_env(env_name, map_name, n_agents, n_targets, args):
+    module_name, class_name = ENV_CLASSES[env_name]
+    env_class = getattr(importlib.import_module(module_name), class_name)
+    kwargs = {
+        "map_name": map_name,
+        "n_agents": n_agents,
+        "n_targets": n_targets,
+        "render_mode": "rgb_array",
+        "max_episode_steps": args.episode_steps,
+        "max_steps": args.episode_steps,
+        "fixed_step": args.fixed_step,
+        "use_exp_map": args.use_exp_map,
+        "headless": not args.capture_frames,
+        "capture_frames": args.capture_frames,
+        "profile": True,
+    }
+    # The environments do not share all their arguments (max_steps or max_episode_steps, use_exp_map...)
+    accepted = inspect.signature(env_class.__init__).parameters
+    return env_class(**{key: value for key, value in kwargs.items() if key in accepted})
+
+
+def run_configuration(env_name, map_name, n_agents, n_targets, args):
+    np.random.seed(args.seed)
+    result = {
+        "env": env_name,
+        "map": map_name,
+        "n_agents": n_agents,
+        "n_targets": n_targets,
+    }
+
+    start = time.perf_counter()
+    env = make_env(env_name, map_name, n_agents, n_targets, args)
+    driver = EnvDriver(env, args.seed)
+    # The first reset builds the playground of the gym environments
+    driver.reset(seed=args.seed)
+    result["build_time"] = time.perf_counter() - start
+    rss_after_build = peak_rss_mb()
+
+    # Only the steps are profiled, the resets at the end of the episodes are left out
+    profiler = env.profiler
+    for _ in range(args.warmup):
+        if driver.step():
+            profiler.enabled = False
+            driver.reset()
+            profiler.enabled = True
+    profiler.reset()
+
+    step_time = 0.0
+    episodes = 0
+    for _ in range(args.steps):
+        start = time.perf_counter()
+        done = driver.step()
+        step_time += time.perf_counter() - start
+        if done:
+            episodes += 1
+            profiler.enabled = False
+            driver.reset()
+            profiler.enabled = True
+
+    profile = env.get_profile()
+    profiler.enabled = False
+    reset_times = []
+    for _ in range(args.resets):
+        start = time.perf_counter()
+        driver.reset()
+        reset_times.append(time.perf_counter() - start)
+
+    ticks = profile["counters"].get("physics_ticks", 0)
+    result.update(
+        {
+            "steps": args.steps,
+            "episodes": episodes,
+            "steps_per_sec": args.steps / step_time if step_time > 0 else None,
+            "ticks_per_sec": ticks / step_time if step_time > 0 else None,
+            "step_time_mean": step_time / args.steps if args.steps > 0 else None,
+            "reset_latency_mean": float(np.mean(reset_times)) if reset_times else None,
+            "reset_latency_max": float(np.max(reset_times)) if reset_times else None,
+            "phases": step_phases(profile, step_time),
+            "counters": profile["counters"],
+            "peak_rss_mb": peak_rss_mb(),
+            "rss_growth_mb": peak_rss_mb() - rss_after_build,
+        }
+    )
+    env.close()
+    return result
+
+
+def _run_in_process(queue, env_name, map_name, n_agents, n_targets, args):
+    try:
+        queue.put(run_configuration(env_name, map_name, n_agents, n_targets, args))
+    except Exception:
+        queue.put(
+            {
+                "env": env_name,
+                "map": map_name,
+                "n_agents": n_agents,
+                "n_targets": n_targets,
+                "error": traceback.format_exc(),
+            }
+        )
+
+
+def run_isolated(env_name, map_name, n_agents, n_targets, args):
+    """Run one configuration in a fresh process, its peak RSS is then its own."""
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(
+        target=_run_in_process,
+        args=(queue, env_name, map_name, n_agents, n_targets, args),
+    )
+    process.start()
+    try:
+        result = queue.get(timeout=args.timeout)
+    except Exception:
+        result = {
+            "env": env_name,
+            "map": map_name,
+            "n_agents": n_agents,
+            "n_targets": n_targets,
+            "error": f"no result after {args.timeout} s (exit code {process.exitcode})",
+        }
+    process.join(timeout=10)
+    if process.is_alive():
+        process.kill()
+    return result
+
+
+def configurations(args):
+    for env_name in args.envs:
+        maps = available_maps(env_name)
+        if args.maps:
+            maps = [map_name for map_name in maps if map_name in args.maps]
+        # The single agent environment only runs one drone
+        agents = [1] if env_name == "single" else args.agents
+        for map_name, n_agents, n_targets in product(maps, agents, args.targets):
+            yield env_name, map_name, n_agents, n_targets
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return result["env"], result["map"], result["n_agents"], result["n_targets"]
+
+
+def print_result(result):
+    name = "{env:>10} {map:>20} agents={n_agents} targets={n_targets}".format(**result)
+    if "error" in result:
+        print(f"{name}  ERROR\n{result['error']}")
+        return
+    phases = result["phases"]
+    step_time = max(sum(phases.values()), 1e-9)
+    shares = " ".join(
+        f"{phase}={100 * phases[phase] / step_time:.0f}%" for phase in PHASES + ["other"]
+    )
+    print(
+        f"{name}  {result['steps_per_sec'] or 0:8.1f} steps/s"
+        f"  reset {1000 * (result['reset_latency_mean'] or 0):7.2f} ms"
+        f"  peak {result['peak_rss_mb']:7.1f} MB  {shares}"
+    )
+
+
+def compare(results, baseline_path, tolerance):
+    """Print the speed of each configuration relative to the baseline, returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"] if "error" not in r}
+
+    regressions = 0
+    print(f"\nComparison with {baseline_path}:")
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous is None or "error" in result or not previous["steps_per_sec"]:
+            continue
+        ratio = result["steps_per_sec"] / previous["steps_per_sec"]
+        regressed = ratio < 1 - tolerance
+        regressions += regressed
+        reset_ratio = (
+            f" reset x{result['reset_latency_mean'] / previous['reset_latency_mean']:.2f}"
+            if result["reset_latency_mean"] and previous["reset_latency_mean"]
+            else ""
+        )
+        print(
+            "{:>10} {:>20} agents={} targets={}".format(*result_key(result)),
+            f" steps/s x{ratio:.2f}",
+            reset_ratio,
+            " REGRESSION" if regressed else "",
+        )
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark of the swarm environments.")
+    parser.add_argument("--envs", nargs="+", choices=list(ENV_CLASSES), default=list(ENV_CLASSES))
+    parser.add_argument("--maps", nargs="+", help="Only run these maps (default: every map of each environment)")
+    parser.add_argument("--agents", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--targets", nargs="+", type=int, default=[1, 2])
+    parser.add_argument("--steps", type=int, default=200, help="Timed environment steps per configuration")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--resets", type=int, default=20, help="Timed resets per configuration")
+    parser.add_argument("--episode_steps", type=int, default=100)
+    parser.add_argument("--fixed_step", type=int, default=20)
+    parser.add_argument("--use_exp_map", action="store_true", default=False)
+    parser.add_argument("--capture_frames", action="store_true", default=False)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds allowed per configuration")
+    parser.add_argument("--output", default=f"benchmark_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument("--baseline", help="Results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative drop of steps/sec")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    results = []
+    for configuration in configurations(args):
+        result = run_isolated(*configuration, args)
+        print_result(result)
+        results.append(result)
+
+    report = {
+        "date": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "args": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    failed = sum("error" in result for result in results)
+    regressions = compare(results, args.baseline, args.tolerance) if args.baseline else 0
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
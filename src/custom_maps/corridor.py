@@ -9,6 +9,7 @@ from spg_overlay.entities.drone_abstract import (
     DroneAbstract,
     drone_collision_wall,
     drone_collision_drone,
+    drone_touch_wounded,
 )
 from spg_overlay.entities.rescue_center import (
     RescueCenter,
@@ -74,5 +75,8 @@ class Corridor(MapAbstract):
         playground.add_interaction(
             CollisionTypes.PART, CollisionTypes.PART, drone_collision_drone
         )
+        playground.add_interaction(
+            CollisionTypes.PART, CollisionTypes.GEM, drone_touch_wounded
+        )
 
         return playground
@@ -31,6 +31,8 @@ from .map_base_class import BaseRLMap
 
 
 class MyMapIntermediate01(BaseRLMap):
+    random_rescue_center = False
+
     def __init__(
         self,
         zones_config: ZonesConfig = (),
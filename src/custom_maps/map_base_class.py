@@ -1,6 +1,6 @@
 import math
 import random
-from typing import List, Type
+from typing import List, Optional, Type
 
 from spg.playground import Playground
 from spg.utils.definitions import CollisionTypes
@@ -9,6 +9,7 @@ from spg_overlay.entities.drone_abstract import (
     DroneAbstract,
     drone_collision_wall,
     drone_collision_drone,
+    drone_touch_wounded,
 )
 from spg_overlay.entities.rescue_center import (
     wounded_rescue_center_collision,
@@ -17,6 +18,15 @@ from spg_overlay.entities.rescue_center import (
 from spg_overlay.entities.wounded_person import WoundedPerson
 from spg_overlay.gui_map.closed_playground import ClosedPlayground
 from spg_overlay.gui_map.map_abstract import MapAbstract
+from spg_overlay.gui_map.map_cache import (
+    add_walls_from_geometry,
+    compile_map_assets,
+    load_map_assets,
+    remove_walls,
+    simplify_geometry,
+    wall_geometry,
+)
+from spg_overlay.gui_map.spawn_sampler import Scenario, ScenarioBank, SpawnSampler
 from spg_overlay.reporting.evaluation import ZonesConfig
 from spg_overlay.utils.misc_data import MiscData
 import numpy as np
@@ -30,10 +40,21 @@ class BaseRLMap(MapAbstract):
     - self._size_area: (width, height)
     - self._rescue_center_pos and self._rescue_center
     - self._wounded_persons_pos and _wounded_persons
+
+    Once the playground is constructed, the resets place the entities with a SpawnSampler built from the image of the
+    walls: the entities never start in a wall or on each other, and a reset costs the same on every map. With a
+    ScenarioBank (set_scenario_bank()), the resets take the placements of the bank instead. The maps whose rescue
+    center does not move set random_rescue_center to False.
     """
 
+    random_rescue_center = True
+
     def __init__(self, zones_config: ZonesConfig = ()):
         super().__init__(zones_config)
+        self._spawn_sampler: Optional[SpawnSampler] = None
+        self._scenario_bank: Optional[ScenarioBank] = None
+        # Placement of the current reset, taken by reset_rescue_center(), reset_wounded_person() and reset_drone()
+        self._scenario: Optional[Scenario] = None
 
     def generate_position_v1(self):
         return (
@@ -45,28 +66,80 @@ class BaseRLMap(MapAbstract):
             ),
         )
 
+    @property
+    def spawn_sampler(self) -> Optional[SpawnSampler]:
+        return self._spawn_sampler
+
+    def seed_spawns(self, seed: Optional[int] = None):
+        """Seed the placements of the next resets, drawn by the spawn sampler or from the scenario bank"""
+        if self._spawn_sampler is not None:
+            self._spawn_sampler.seed(seed)
+        if self._scenario_bank is not None:
+            self._scenario_bank.seed(seed)
+
+    def set_scenario_bank(self, bank: Optional[ScenarioBank]):
+        if bank is not None and (bank.n_drones != self._number_drones
+                                 or bank.n_persons != self._number_wounded_persons):
+            raise ValueError(f"The scenario bank has {bank.n_drones} drones and {bank.n_persons} persons, the map has "
+                             f"{self._number_drones} drones and {self._number_wounded_persons} persons")
+        self._scenario_bank = bank
+        self._scenario = None
+
+    def build_scenario_bank(self, n_scenarios: int, seed: Optional[int] = None) -> ScenarioBank:
+        """A bank of n_scenarios placements for this map, the playground must be constructed"""
+        if self._spawn_sampler is None:
+            raise RuntimeError("The playground of the map must be constructed before building a scenario bank")
+        rescue_center = None if self.random_rescue_center else self._rescue_center_pos[0]
+        return ScenarioBank.generate(self._spawn_sampler, n_scenarios, self._number_drones,
+                                     self._number_wounded_persons, rescue_center=rescue_center, seed=seed)
+
+    def _current_scenario(self) -> Optional[Scenario]:
+        """The placement of the current reset, drawn at the first call of the reset"""
+        if self._scenario is None:
+            if self._scenario_bank is not None:
+                self._scenario = self._scenario_bank.draw()
+            elif self._spawn_sampler is not None:
+                rescue_center = None if self.random_rescue_center else self._rescue_center_pos[0]
+                self._scenario = self._spawn_sampler.sample_scenario(
+                    self._number_drones, self._number_wounded_persons, rescue_center=rescue_center
+                )
+        return self._scenario
+
     def reset_drone(self):
+        scenario = self._current_scenario()
         for i in range(self._number_drones):
-            pos = self.generate_position_v1()
-            angle = random.uniform(-math.pi, math.pi)
+            if scenario is None:
+                pos = self.generate_position_v1()
+                angle = random.uniform(-math.pi, math.pi)
+            else:
+                x, y, angle = scenario.drones[i].tolist()
+                pos = (x, y)
             self._drones[i].initial_coordinates = (pos, angle)
+        # The drones are placed last, the next reset draws a new placement
+        self._scenario = None
 
     def get_distance(self, pos_a, pos_b):
         return np.sqrt((pos_a[0] - pos_b[0]) ** 2 + (pos_a[1] - pos_b[1]) ** 2)
 
     def reset_rescue_center(self):
+        scenario = self._current_scenario()
+        position = self.generate_position_v1() if scenario is None else tuple(scenario.rescue_center.tolist())
         self._rescue_center_pos = (
-            self.generate_position_v1(),
+            position,
             0,
         )
         self._rescue_center.initial_coordinates = self._rescue_center_pos
         self._rescue_center.move_to(self._rescue_center_pos)
 
     def reset_wounded_person(self):
+        scenario = self._current_scenario()
         for i in range(self.number_wounded_persons):
-            new_position = self.generate_position_v1()
-            while self.get_distance(new_position, self._rescue_center_pos[0]) <= 120:
+            if scenario is None:
                 new_position = self.generate_position_v1()
+                while self.get_distance(new_position, self._rescue_center_pos[0]) <= 120:
+                    new_position = self.generate_position_v1()
+            else:
+                new_position = tuple(scenario.persons[i].tolist())
             pos = (new_position, 0)
             self._wounded_persons_pos[i] = pos
             self._wounded_persons[i].initial_coordinates = pos
@@ -76,6 +149,30 @@ class BaseRLMap(MapAbstract):
 
     def construct_playground(self, drone_type: Type[DroneAbstract]) -> Playground:
         playground = ClosedPlayground(size=self._size_area)
+
+        # WALLS, from the map cache when the map was already compiled for this size
+        assets = load_map_assets(self)
+        if assets is None:
+            elements = {id(e) for e in playground.elements}
+            self.add_wall_and_box(playground)
+            walls = [e for e in playground.elements if id(e) not in elements]
+            # The walls are replaced by the merged ones, which cover the same area
+            source_geometry = wall_geometry(walls)
+            geometry = simplify_geometry(source_geometry)
+            remove_walls(playground, walls)
+            add_walls_from_geometry(playground, geometry)
+            # Rendered before the rescue center is added: the image only holds the walls
+            self._explored_map.initialize_walls(playground)
+            compile_map_assets(self, self._explored_map.map_playground, geometry, source_geometry)
+        else:
+            add_walls_from_geometry(playground, assets.geometry)
+            self._explored_map.initialize_walls(playground, assets.walls)
+
+        # SPAWN SAMPLER, the free space of the entities is computed once from the image of the walls
+        self._spawn_sampler = SpawnSampler(
+            self._explored_map.map_playground, rescue_center_size=self._rescue_center.texture.size
+        )
+
         # RESCUE CENTER
         playground.add_interaction(
             CollisionTypes.GEM,
@@ -84,9 +181,6 @@ class BaseRLMap(MapAbstract):
         )
         playground.add(self._rescue_center, self._rescue_center_pos)
 
-        self.add_wall_and_box(playground)
-        self._explored_map.initialize_walls(playground)
-
         # POSITIONS OF THE WOUNDED PERSONS
         for i in range(self._number_wounded_persons):
             wounded_person = WoundedPerson(rescue_center=self._rescue_center)
@@ -109,5 +203,8 @@ class BaseRLMap(MapAbstract):
         playground.add_interaction(
             CollisionTypes.PART, CollisionTypes.PART, drone_collision_drone
         )
+        playground.add_interaction(
+            CollisionTypes.PART, CollisionTypes.GEM, drone_touch_wounded
+        )
 
         return playground
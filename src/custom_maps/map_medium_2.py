@@ -9,6 +9,8 @@ from spg_overlay.entities.rescue_center import RescueCenter
 
 
 class CustomMedium2(BaseRLMap):
+    random_rescue_center = False
+
     def __init__(
         self,
         zones_config: ZonesConfig = (),
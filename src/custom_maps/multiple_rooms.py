@@ -9,6 +9,7 @@ from spg_overlay.entities.drone_abstract import (
     DroneAbstract,
     drone_collision_wall,
     drone_collision_drone,
+    drone_touch_wounded,
 )
 from spg_overlay.gui_map.closed_playground import ClosedPlayground
 from spg_overlay.gui_map.map_abstract import MapAbstract
@@ -73,5 +74,8 @@ class MultiRoom(BaseRLMap):
         playground.add_interaction(
             CollisionTypes.PART, CollisionTypes.PART, drone_collision_drone
         )
+        playground.add_interaction(
+            CollisionTypes.PART, CollisionTypes.GEM, drone_touch_wounded
+        )
 
         return playground
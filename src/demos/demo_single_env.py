@@ -18,6 +18,7 @@ def main():
         fixed_step=20,
         n_targets=3,
         map_name="Easy",
+        capture_frames=True,
         # size_area=(350, 350),
     )
 
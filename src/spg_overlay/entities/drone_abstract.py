@@ -16,6 +16,7 @@ from spg_overlay.entities.drone_base import DroneBase
 from spg_overlay.entities.drone_distance_sensors import DroneLidar, DroneSemanticSensor
 from spg_overlay.entities.drone_sensors import DroneGPS, DroneCompass, DroneOdometer
 from spg_overlay.entities.normal_wall import NormalWall, NormalBox
+from spg_overlay.entities.wounded_person import WoundedPerson
 from spg_overlay.utils.constants import DRONE_INITIAL_HEALTH, RANGE_COMMUNICATION
 from spg_overlay.utils.misc_data import MiscData
 
@@ -60,6 +61,22 @@ def drone_collision_drone(arbiter, _, data):
     return True
 
 
+def drone_touch_wounded(arbiter, _, data):
+    playground: Playground = data["playground"]
+    (part, _), (element, _) = get_colliding_entities(playground, arbiter)
+
+    assert isinstance(part, DroneBase)
+
+    # CollisionTypes.PART
+    drone = part.agent
+
+    # The wounded person carried by the drone is not touched
+    if isinstance(element, WoundedPerson) and drone.base.grasper not in element.grasped_by:
+        drone.touch_wounded()
+
+    return True
+
+
 class DroneAbstract(Agent):
     """
     The DroneAbstract class is a parent class that should be used to create custom Drone classes. It inherits from the
@@ -102,6 +119,13 @@ class DroneAbstract(Agent):
         communicator: The communicator object used for communication with other drones.
         timer_collision_wall_or_drone: A timer used to track collision events.
         drone_health: The health of the drone, which is reduced upon collision events.
+        collision_count: The number of physics ticks where the drone hit a wall, a box or another drone.
+        touch_count: The number of physics ticks where the drone touched a wounded person it does not carry.
+        grasp_conflict_count: The number of physics ticks where the drone carried a wounded person also grasped by
+        another drone.
+
+    The three counters are updated by the collision handlers and post_step() at every physics tick, and are read in
+    O(1) by the rewards. They count since the last reset_contact_counters(), which the environments call at each step.
     """
 
     class SensorType(IntEnum):
@@ -154,6 +178,13 @@ class DroneAbstract(Agent):
         self.timer_collision_wall_or_drone = Timer(start_now=True)
         self.drone_health = DRONE_INITIAL_HEALTH
 
+        # Contacts of the current physics tick, set by the collision handlers and counted by post_step()
+        self._collided = False
+        self._touched = False
+        self.collision_count = 0
+        self.touch_count = 0
+        self.grasp_conflict_count = 0
+
     @property
     def size_area(self):
         return self._size_area
@@ -191,6 +222,35 @@ class DroneAbstract(Agent):
         """
         pass
 
+    def reset(self):
+        """
+        Reset the drone in place when its playground is reset, so that the same playground can be reused across
+        episodes: the parts are reset by spg (the grasper releases what it holds), the health and the collision timer
+        are restored here.
+        """
+        super().reset()
+        self.drone_health = DRONE_INITIAL_HEALTH
+        self.timer_collision_wall_or_drone.restart()
+        self.reset_contact_counters()
+
+    def post_step(self, **kwargs):
+        super().post_step(**kwargs)
+        self.collision_count += self._collided
+        self.touch_count += self._touched
+        self._collided = False
+        self._touched = False
+        for entity in self.base.grasper.grasped_entities:
+            if len(entity.grasped_by) > 1:
+                self.grasp_conflict_count += 1
+
+    def reset_contact_counters(self):
+        """Set the collision, touch and grasp conflict counters back to zero."""
+        self._collided = False
+        self._touched = False
+        self.collision_count = 0
+        self.touch_count = 0
+        self.grasp_conflict_count = 0
+
     def grasped_entities(self):
         """ Returns the entities currently grasped by the drone."""
         return self.base.grasper.grasped_entities
@@ -437,6 +497,7 @@ class DroneAbstract(Agent):
 
     def collide_wall(self):
         """Handles collision with walls and reduces drone health."""
+        self._collided = True
         if self.timer_collision_wall_or_drone.get_elapsed_time() > 1.0:
             # self.drone_health -= 1
             self.timer_collision_wall_or_drone.restart()
@@ -451,6 +512,7 @@ class DroneAbstract(Agent):
 
     def collide_drone(self):
         """Handles collision with other drones and reduces drone health."""
+        self._collided = True
         if self.timer_collision_wall_or_drone.get_elapsed_time() > 1.0:
             # self.drone_health -= 1
             self.timer_collision_wall_or_drone.restart()
@@ -462,3 +524,7 @@ class DroneAbstract(Agent):
             if not self.removed:
                 self.base.grasper._release_grasping()
                 self._playground.remove(self)
+
+    def touch_wounded(self):
+        """Handles the contact with a wounded person."""
+        self._touched = True
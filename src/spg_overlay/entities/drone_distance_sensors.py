@@ -5,7 +5,7 @@ from collections import namedtuple
 
 import arcade
 import numpy as np
-from enum import Enum, auto
+from enum import IntEnum, auto
 
 from spg.agent import Agent
 from spg.agent.sensor import DistanceSensor, SemanticSensor
@@ -23,7 +23,7 @@ from spg_overlay.utils.constants import (
     FOV_LIDAR_SENSOR,
     MAX_RANGE_LIDAR_SENSOR,
 )
-from spg_overlay.utils.utils_noise import GaussianNoise
+from spg_overlay.utils.utils_noise import GaussianNoise, noise_stream
 from spg_overlay.entities.wounded_person import WoundedPerson
 
 
@@ -105,7 +105,7 @@ class DroneDistanceSensor(DistanceSensor):
         return self._disabled
 
     def _apply_noise(self):
-        self._values = self._noise_model.add_noise(self._values)
+        self._values = self._noise_model.add_noise(self._values, noise_stream(self))
 
     def draw(self):
         """Draws the rays of lidar sensor."""
@@ -160,9 +160,9 @@ class DroneSemanticSensor(SemanticSensor):
     """
 
     # noinspection PyArgumentList
-    class TypeEntity(Enum):
+    class TypeEntity(IntEnum):
         """
-        Type of the entity detected
+        Type of the entity detected. The values are the codes stored in the entity_type field of the detections.
         """
 
         WALL = auto()
@@ -177,6 +177,17 @@ class DroneSemanticSensor(SemanticSensor):
 
     Data = namedtuple("Data", "distance angle entity_type grasped")
 
+    # One detection per ray that hit an entity which is not a wall, in the order of the rays
+    Detection = np.dtype(
+        [
+            ("uid", np.int64),
+            ("distance", np.float64),
+            ("angle", np.float64),
+            ("entity_type", np.int8),
+            ("grasped", np.bool_),
+        ]
+    )
+
     def __init__(
         self, playground: Playground, noise=True, invisible_elements=None, **kwargs
     ):
@@ -206,135 +217,124 @@ class DroneSemanticSensor(SemanticSensor):
             DroneBase: [64, 64, 255],
         }
 
-        null_data = self.Data(
-            distance=np.nan, angle=np.nan, entity_type=np.nan, grasped=False
-        )
-        self._null_sensor = [null_data] * self.resolution
+        self._null_sensor = np.zeros(self.resolution, dtype=self.Detection).view(np.recarray)
+        self._null_sensor.distance = np.nan
+        self._null_sensor.angle = np.nan
 
-        self._values = self._default_value
+        # Lookup table uid -> type of entity, sorted by uid, rebuilt when entities are added or removed
+        self._table_size = -1
+        self._table_uids = np.zeros(0, dtype=np.int64)
+        self._table_types = np.zeros(0, dtype=np.int8)
+        self._table_graspable = np.zeros(0, dtype=bool)
+        self._table_entities = []
 
-    def special_semantic(self):
-        super()._compute_raw_sensor()
-        id_detections = self._values[:, 0].astype(int)
-        # distances is the second column of self._values
-        distances = self._values[:, 1]
-        new_values = []
-        og_values = []
-
-        # print(self._values)
-        # input()
-
-        for index, id_detection in enumerate(id_detections):
-            if id_detection == 0:
-                continue
-            try:
-                entity = self._playground.get_entity_from_uid(id_detection)
-            except KeyError as error:
-                exc_type, exc_obj, exc_tb = sys.exc_info()
-                fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-                print(f"KeyError in file {fname} at line {exc_tb.tb_lineno}")
-                print("Wrong Key for detected entity:", error)
-                continue
-
-            if isinstance(entity, ColorWall):
-                entity_type = self.TypeEntity.WALL
-            elif isinstance(entity, NormalWall):
-                entity_type = self.TypeEntity.WALL
-            elif isinstance(entity, NormalBox):
-                entity_type = self.TypeEntity.WALL
-            elif isinstance(entity, WoundedPerson):
-                entity_type = self.TypeEntity.WOUNDED_PERSON
-            elif isinstance(entity, RescueCenter):
-                entity_type = self.TypeEntity.RESCUE_CENTER
-            elif isinstance(entity, Agent) or isinstance(entity, DroneBase):
-                entity_type = self.TypeEntity.DRONE
-            else:
-                entity_type = self.TypeEntity.OTHER
-                # print(__file__, type(entity))
-
-            grasped = False
-            grasped_by = None
-            if hasattr(entity, "graspable") and entity.graspable and entity.grasped_by:
-                grasped = True
-                grasped_by = entity.grasped_by
-
-            distance = distances[index]
-            angle = self.ray_angles[index]
-
-            # We remove the walls, so that it is not too easy
-            if entity_type == self.TypeEntity.WALL:
-                continue
-
-            new_detection = self.Data(
-                distance=distance,
-                angle=angle,
-                entity_type=entity_type,
-                grasped=grasped,
-            )
-            new_values.append((id_detection, new_detection, grasped_by))
-            og_values.append(new_detection)
-
-        self._values = og_values
-        return new_values
+        # Detections of the last hitpoints, computed once per physics tick
+        self._detections_hitpoints = None
+        self._detections_cache = self._null_sensor
 
-    def _compute_raw_sensor(self, *_):
-        super()._compute_raw_sensor()
-        # id_detections is the first column of self._values
-        id_detections = self._values[:, 0].astype(int)
-        # distances is the second column of self._values
-        distances = self._values[:, 1]
-        # print(id_detections)
-        # raise
-        new_values = []
-
-        for index, id_detection in enumerate(id_detections):
-            if id_detection == 0:
-                continue
-            try:
-                entity = self._playground.get_entity_from_uid(id_detection)
-            except KeyError as error:
-                exc_type, exc_obj, exc_tb = sys.exc_info()
-                fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-                print(f"KeyError in file {fname} at line {exc_tb.tb_lineno}")
-                print("Wrong Key for detected entity:", error)
-                continue
-
-            if isinstance(entity, ColorWall):
-                entity_type = self.TypeEntity.WALL
-            elif isinstance(entity, NormalWall):
-                entity_type = self.TypeEntity.WALL
-            elif isinstance(entity, NormalBox):
-                entity_type = self.TypeEntity.WALL
-            elif isinstance(entity, WoundedPerson):
-                entity_type = self.TypeEntity.WOUNDED_PERSON
-            elif isinstance(entity, RescueCenter):
-                entity_type = self.TypeEntity.RESCUE_CENTER
-            elif isinstance(entity, Agent) or isinstance(entity, DroneBase):
-                entity_type = self.TypeEntity.DRONE
-            else:
-                entity_type = self.TypeEntity.OTHER
-                # print(__file__, type(entity))
+        self._values = self._default_value
+
+    @classmethod
+    def entity_type(cls, entity) -> "DroneSemanticSensor.TypeEntity":
+        """
+        Type of an entity of the playground, as seen by the semantic sensor
+        """
+        if isinstance(entity, (ColorWall, NormalWall, NormalBox)):
+            return cls.TypeEntity.WALL
+        elif isinstance(entity, WoundedPerson):
+            return cls.TypeEntity.WOUNDED_PERSON
+        elif isinstance(entity, RescueCenter):
+            return cls.TypeEntity.RESCUE_CENTER
+        elif isinstance(entity, Agent) or isinstance(entity, DroneBase):
+            return cls.TypeEntity.DRONE
+        else:
+            return cls.TypeEntity.OTHER
 
-            grasped = False
-            if hasattr(entity, "graspable") and entity.graspable and entity.grasped_by:
-                grasped = True
+    def _update_entity_table(self):
+        """
+        Build the lookup table of the entities of the playground, sorted by uid
+        """
+        entities = self._playground._uids_to_entities
+        uids = np.fromiter(entities.keys(), dtype=np.int64, count=len(entities))
+        order = np.argsort(uids)
+        values = list(entities.values())
+
+        self._table_size = len(entities)
+        self._table_uids = uids[order]
+        self._table_entities = [values[i] for i in order]
+        self._table_types = np.array(
+            [self.entity_type(entity) for entity in self._table_entities], dtype=np.int8
+        )
+        self._table_graspable = np.array(
+            [bool(getattr(entity, "graspable", False)) for entity in self._table_entities],
+            dtype=bool,
+        )
 
-            distance = distances[index]
-            angle = self.ray_angles[index]
+    def _find_in_table(self, uids):
+        """
+        Index in the lookup table of each uid, and mask of the uids found in the table
+        """
+        if len(self._table_uids) == 0:
+            return np.zeros(len(uids), dtype=int), np.zeros(len(uids), dtype=bool)
+        indexes = np.searchsorted(self._table_uids, uids)
+        indexes[indexes == len(self._table_uids)] = 0
+        return indexes, self._table_uids[indexes] == uids
 
-            # We remove the walls, so that it is not too easy
-            if entity_type == self.TypeEntity.WALL:
-                continue
+    def _classify_rays(self, raw_values) -> np.recarray:
+        """
+        Classify all the rays of the raw values of the sensor (uid, distance) at once.
+        The rays without detection and the walls are removed.
+        """
+        uids = raw_values[:, 0].astype(np.int64)
+        rays = np.flatnonzero(uids)
+        uids = uids[rays]
+
+        if len(self._playground._uids_to_entities) != self._table_size:
+            self._update_entity_table()
+        indexes, found = self._find_in_table(uids)
+        if not found.all():
+            # An entity replaced another one, the number of entities did not change
+            self._update_entity_table()
+            indexes, found = self._find_in_table(uids)
+            for uid in np.unique(uids[~found]):
+                print("Wrong Key for detected entity:", uid)
+            rays, uids, indexes = rays[found], uids[found], indexes[found]
+
+        types = self._table_types[indexes]
+        # We remove the walls, so that it is not too easy
+        not_wall = types != self.TypeEntity.WALL
+        rays, uids, indexes, types = rays[not_wall], uids[not_wall], indexes[not_wall], types[not_wall]
+
+        detections = np.zeros(len(rays), dtype=self.Detection).view(np.recarray)
+        detections.uid = uids
+        detections.distance = raw_values[rays, 1]
+        detections.angle = self.ray_angles[rays]
+        detections.entity_type = types
+        for i in np.flatnonzero(self._table_graspable[indexes]):
+            if self._table_entities[indexes[i]].grasped_by:
+                detections.grasped[i] = True
+
+        return detections
+
+    def _detections(self) -> np.recarray:
+        """
+        Detections of the current hitpoints. The playground gives new hitpoints at each physics tick, they are
+        classified only once.
+        """
+        if self._detections_hitpoints is not self._hitpoints:
+            self._detections_cache = self._classify_rays(self._hitpoints[:, 8:10])
+            self._detections_hitpoints = self._hitpoints
+        return self._detections_cache
 
-            new_detection = self.Data(
-                distance=distance,
-                angle=angle,
-                entity_type=entity_type,
-                grasped=grasped,
-            )
-            new_values.append(new_detection)
+    def special_semantic(self) -> np.recarray:
+        """
+        Detections of the sensor at the current tick, without noise, with the uid of the entity detected by each ray.
+        The array is shared by all the calls of the tick and must not be modified.
+        """
+        return self._detections()
 
-        self._values = new_values
+    def _compute_raw_sensor(self, *_):
+        self._values = self._detections()
 
     def fov_rad(self):
         """Field of view in radians"""
@@ -362,17 +362,10 @@ class DroneSemanticSensor(SemanticSensor):
 
     def _apply_noise(self):
         """Applies noise to the lidar sensor values."""
-        for index, data in enumerate(self._values):
-            new_data = self.Data(
-                distance=max(
-                    0.0, data.distance + np.random.normal(self._std_dev_noise)
-                ),
-                angle=data.angle,
-                entity_type=data.entity_type,
-                grasped=data.grasped,
-            )
-
-            self._values[index] = new_data
+        noise = noise_stream(self).normal(self._std_dev_noise, size=len(self._values))
+        # The detections without noise stay in the cache of the tick
+        self._values = self._values.copy()
+        self._values.distance = np.maximum(0.0, self._values.distance + noise)
 
     def draw(self):
         """Draws the lidar sensor rays."""
@@ -5,7 +5,7 @@ import numpy as np
 
 from spg.agent.sensor.internal import InternalSensor
 from spg_overlay.utils.utils import deg2rad, normalize_angle
-from spg_overlay.utils.utils_noise import AutoregressiveModelNoise, GaussianNoise
+from spg_overlay.utils.utils_noise import AutoregressiveModelNoise, noise_stream
 
 
 class DroneGPS(InternalSensor, ABC):
@@ -66,7 +66,7 @@ class DroneGPS(InternalSensor, ABC):
         Overload of an internal function of _apply_noise of the class InternalSensor
         We use a noise that follow an autoregressive model of order 1 : https://en.wikipedia.org/wiki/Autoregressive_model#AR(1)
         """
-        self._values = self._noise_model.add_noise(self._values)
+        self._values = self._noise_model.add_noise(self._values, noise_stream(self))
 
     def is_disabled(self):
         return self._disabled
@@ -118,7 +118,7 @@ class DroneCompass(InternalSensor):
         Overload of an internal function of _apply_noise of the class InternalSensor
         We use a noise that follow an autoregressive model of order 1 : https://en.wikipedia.org/wiki/Autoregressive_model#AR(1)
         """
-        angle = self._noise_model.add_noise(self._values)
+        angle = self._noise_model.add_noise(self._values, noise_stream(self))
         self._values = normalize_angle(angle)
 
     def is_disabled(self):
@@ -138,13 +138,10 @@ class DroneOdometer(InternalSensor):
         self._noise = True
 
         self.std_dev_dist_travel = 0.2
-        self._noise_dist_travel_model = GaussianNoise(std_dev_noise=self.std_dev_dist_travel)
-
         self.std_dev_alpha = deg2rad(8.0)
-        self._noise_alpha_model = GaussianNoise(std_dev_noise=self.std_dev_alpha)
-
         self.std_dev_theta = deg2rad(1.0)
-        self._noise_theta_model = GaussianNoise(std_dev_noise=self.std_dev_theta)
+        # The three noises are drawn at once
+        self._std_dev_noises = np.array([self.std_dev_dist_travel, self.std_dev_alpha, self.std_dev_theta])
 
         self._null_sensor = np.empty(self.shape)
         self._null_sensor[:] = np.nan
@@ -202,16 +199,10 @@ class DroneOdometer(InternalSensor):
         """
         Overload of an internal function of _apply_noise of the class InternalSensor
         """
-        noisy_dist_travel = self._noise_dist_travel_model.add_noise(self._values[0])
-        # print("travel: {:2f}, noisy_dist_travel: {:2f}".format(dist_travel, noisy_dist_travel))
-
-        noisy_alpha = self._noise_alpha_model.add_noise(self._values[1])
-        noisy_alpha = normalize_angle(noisy_alpha)
-
-        noisy_theta = self._noise_theta_model.add_noise(self._values[2])
-        noisy_theta = normalize_angle(noisy_theta)
-
-        self._values = np.array([noisy_dist_travel, noisy_alpha, noisy_theta])
+        values = self._values + self._std_dev_noises * noise_stream(self).standard_normal(3)
+        values[1] = normalize_angle(values[1])
+        values[2] = normalize_angle(values[2])
+        self._values = values
 
     def is_disabled(self):
         return self._disabled
@@ -1,14 +1,18 @@
-import random
 from typing import Tuple, Union
 
 import math
 import numpy as np
 import pymunk
-from arcade.texture import Texture, load_texture
-from PIL import Image
-
 from spg.element import PhysicalElement
 
+from spg_overlay.utils.texture_cache import (
+    FLAT_WALL_COLOR,
+    crop_origin,
+    flat_rectangle_texture,
+    flat_textures,
+    load_cropped_texture,
+)
+
 from resources import path_resources
 
 
@@ -23,6 +27,9 @@ class SrColorWall(PhysicalElement):
 
         # Creating a textured wall
         wall = SrColorWall(pos_start=(0, 0), pos_end=(10, 0), width=2, file_name="wall_texture.png")
+
+    The crop of the texture only depends on the size of the wall, so the walls of the same size share one texture. When
+    use_flat_textures() was called, the textured walls are built with the flat colour FLAT_WALL_COLOR instead.
     """
     def __init__(self,
                  pos_start: Union[Tuple[float, float], pymunk.Vec2d],
@@ -39,23 +46,16 @@ class SrColorWall(PhysicalElement):
         self.wall_coordinates = position, angle
 
         if color is not None:
-            img = Image.new("RGBA", (int(width), int(height)), color)
-            texture = Texture(
-                name=f"Barrier_{width}_{height}_{color}",
-                image=img,
-                hit_box_algorithm="Detailed",
-                hit_box_detail=1,
-            )
+            texture = flat_rectangle_texture(width, height, color, hit_box_algorithm="Detailed", hit_box_detail=1)
+        elif file_name is not None and flat_textures():
+            texture = flat_rectangle_texture(width, height, FLAT_WALL_COLOR)
         elif file_name is not None:
-            w_img = 2000
-            h_img = 2000
-            x = random.randint(0, int(w_img - width - 1))
-            y = random.randint(0, int(h_img - height - 1))
-            texture = load_texture(file_name=file_name,
-                                   x=x,
-                                   y=y,
-                                   width=width,
-                                   height=height)
+            x, y = crop_origin(file_name, width, height)
+            texture = load_cropped_texture(file_name=file_name,
+                                           x=x,
+                                           y=y,
+                                           width=width,
+                                           height=height)
         else:
             raise ValueError('Either color or file_name must be provided')
 
@@ -71,12 +71,18 @@ class NormalWall(SrColorWall):
         wall = NormalWall(pos_start=(0, 0), pos_end=(10, 0))
     """
 
+    # Width of the wall, the wall spans from pos_start to pos_end
+    WIDTH = 6
+
     def __init__(self, pos_start: Union[Tuple[float, float], pymunk.Vec2d],
                  pos_end: Union[Tuple[float, float], pymunk.Vec2d],
                  **kwargs):
-        width_wall = 6
+        width_wall = self.WIDTH
 
         self.color = (200, 240, 230)
+        # Arguments of the wall, kept to store the geometry of the map (see map_cache)
+        self.pos_start = tuple(pos_start)
+        self.pos_end = tuple(pos_end)
 
         p_start = np.asarray(pos_start)
         p_end = np.asarray(pos_end)
@@ -110,6 +116,9 @@ class NormalBox(SrColorWall):
     def __init__(self, up_left_point: Union[Tuple[float, float], pymunk.Vec2d], width: float, height: float,
                  **kwargs):
         # self.color = (200, 240, 230)
+        # Arguments of the box, kept to store the geometry of the map (see map_cache)
+        self.up_left_point = tuple(up_left_point)
+        self.box_size = (width, height)
 
         if width > height:  # horizontal box
             correction = 0.5 * height
@@ -2,6 +2,9 @@ from spg.utils.definitions import CollisionTypes
 from spg.entity import Graspable
 from spg.element import PhysicalElement, RewardElement
 
+from spg_overlay.utils.texture_cache import FLAT_WOUNDED_COLOR, flat_circle_texture, flat_textures, \
+    load_cropped_texture
+
 from resources import path_resources
 
 
@@ -20,9 +23,17 @@ class WoundedPerson(PhysicalElement, RewardElement):
     """
 
     def __init__(self, rescue_center):
+        # The texture is shared by all the wounded persons, see texture_cache
+        if flat_textures():
+            texture = flat_circle_texture(24, FLAT_WOUNDED_COLOR)
+        else:
+            texture = load_cropped_texture(path_resources + "/character_v2.png",
+                                           hit_box_algorithm="Detailed",
+                                           hit_box_detail=1)
+
         super().__init__(
             mass=5,
-            filename=path_resources + "/character_v2.png",
+            texture=texture,
             shape_approximation="circle",
             radius=12,
         )
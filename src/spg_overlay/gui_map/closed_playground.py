@@ -1,9 +1,17 @@
 import platform
-from typing import Tuple
+from typing import Dict, List, Tuple
 
+import numpy as np
+import pymunk
+from spg.agent.interactor import Grasper
+from spg.agent.sensor import ExternalSensor
+from spg.entity import Graspable
 from spg.playground import Playground
 
+from spg_overlay.entities.drone_distance_sensors import DroneSemanticSensor
 from spg_overlay.entities.normal_wall import NormalWall
+from spg_overlay.utils.step_profiler import StepProfiler
+from spg_overlay.utils.utils_noise import NoiseStream
 
 
 class ClosedPlayground(Playground):
@@ -20,9 +28,30 @@ class ClosedPlayground(Playground):
         walls surrounding it and a default background color. The playground can then be used for various purposes, such
         as simulating physics or rendering graphics.
 
+    The time spent in the sensors and the number of physics ticks and semantic rays are recorded in the profiler of
+    the playground, which is disabled unless the environment gives its own (see StepProfiler).
+
+    The environments only read the sensors after the last physics tick of a step. While skip_external_sensors is
+    True, the ticks do not compute the lidar and the semantic sensor, which are most of the time of a tick, and only
+    update the internal sensors (GPS, compass, odometer), whose noise and integration depend on every tick.
+    update_external_sensors() then computes them once, for the last tick. The events the rewards need (rescue,
+    grasp, collisions) come from the collision handlers and are not affected.
+
+        playground.skip_external_sensors = True
+        for _ in range(20):
+            playground.step(commands)
+        playground.skip_external_sensors = False
+        playground.update_external_sensors()
+
     Fields
         _width: The width of the playground.
         _height: The height of the playground.
+        profiler: The StepProfiler recording the sensors phase and the physics_ticks and semantic_rays counters.
+        noise_stream: The NoiseStream of the noise of the sensors of the drones, seeded by the environments.
+        skip_external_sensors: Whether the physics ticks skip the lidar and the semantic sensor.
+        _external_sensors_outdated: Whether the external sensors were skipped at the last tick.
+        _invisible_update_pending: Whether a grasp changed the invisible elements of a ray sensor during a skipped
+            tick, the ray compute has to update them before the next ray cast.
     """
     def __init__(self, size: Tuple[int, int]):
         background = (220, 220, 220)
@@ -38,10 +67,186 @@ class ClosedPlayground(Playground):
         assert isinstance(self._width, int)
         assert isinstance(self._height, int)
 
+        self.profiler = StepProfiler()
+        self.noise_stream = NoiseStream()
+        self.skip_external_sensors = False
+        self._external_sensors_outdated = False
+        self._invisible_update_pending = False
+
         self._walls_creation()
 
         # print(f"Version OpenGL : {self._window.ctx.gl_version}")
 
+    def _post_step(self):
+        super()._post_step()
+        if self.profiler.enabled:
+            self.profiler.count("physics_ticks")
+
+    def _compute_observations(self):
+        if not self.profiler.enabled:
+            return self._update_sensors()
+
+        with self.profiler.phase("sensors"):
+            observations = self._update_sensors()
+
+        if not self._external_sensors_outdated:
+            self._count_semantic_rays()
+        return observations
+
+    def _update_sensors(self):
+        if not self.skip_external_sensors:
+            self._external_sensors_outdated = False
+            self._restore_invisible_update()
+            return super()._compute_observations()
+
+        for agent in self.agents:
+            for sensor in agent.sensors:
+                if isinstance(sensor, ExternalSensor):
+                    # The flag is cleared by the pre_step of the next tick, before the ray compute could see it
+                    if getattr(sensor, "require_invisible_update", False):
+                        self._invisible_update_pending = True
+                else:
+                    sensor.update()
+        self._external_sensors_outdated = True
+        return {agent: None for agent in self.agents}
+
+    def update_external_sensors(self):
+        """Compute the external sensors skipped at the last tick, nothing is done if they are up to date"""
+        if not self._external_sensors_outdated:
+            return
+
+        with self.profiler.phase("sensors"):
+            self._restore_invisible_update()
+            if self._ray_compute:
+                self._ray_compute.update_sensors()
+            for agent in self.agents:
+                for sensor in agent.external_sensors:
+                    sensor.update()
+            self._external_sensors_outdated = False
+
+        self._count_semantic_rays()
+
+    def _restore_invisible_update(self):
+        if not self._invisible_update_pending:
+            return
+        for agent in self.agents:
+            for sensor in agent.external_sensors:
+                if hasattr(sensor, "require_invisible_update"):
+                    sensor._require_invisible_update = True
+        self._invisible_update_pending = False
+
+    def _count_semantic_rays(self):
+        if not self.profiler.enabled:
+            return
+        semantic_rays = 0
+        for agent in self.agents:
+            for sensor in agent.sensors:
+                if isinstance(sensor, DroneSemanticSensor) and not sensor.is_disabled():
+                    semantic_rays += sensor.resolution
+        self.profiler.count("semantic_rays", semantic_rays)
+
+    def _state_entities(self) -> List:
+        """The entities whose body moves: the parts of the drones and the movable elements, in a fixed order"""
+        entities = [part for agent in self._agents for part in agent.parts]
+        entities += [element for element in self._elements
+                     if getattr(element, "pm_body", None) is not None
+                     and element.pm_body.body_type == pymunk.Body.DYNAMIC]
+        return entities
+
+    def _graspers(self) -> List[Grasper]:
+        return [device for agent in self._agents for part in agent.parts for device in part.devices
+                if isinstance(device, Grasper)]
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """
+        The state of the simulation, as arrays by name: the bodies, the elements removed (the persons rescued), the
+        grasps with the length of their joints, the sensors (values, autoregressive noise, odometer), the noise
+        stream and the timestep. set_state() restores it on this playground.
+        """
+        bodies = [entity.pm_body for entity in self._state_entities()]
+        state = {
+            "bodies": np.array([(b.position.x, b.position.y, b.angle, b.velocity.x, b.velocity.y, b.angular_velocity)
+                                for b in bodies], dtype=np.float64).reshape(-1, 6),
+            "removed": np.array([element.removed for element in self._elements], dtype=bool),
+            "timestep": np.array(self._timestep),
+            "done": np.array(self._done),
+        }
+
+        element_index = {id(element): j for j, element in enumerate(self._elements)}
+        graspers = self._graspers()
+        grasps = []
+        for i, grasper in enumerate(graspers):
+            for entity in grasper.grasped_entities:
+                distances = [joint.distance for joint in grasper._grasp_joints[entity]]
+                grasps.append((i, element_index[id(entity)], *distances))
+        state["grasps"] = np.array(grasps, dtype=np.float64).reshape(-1, 6)
+        state["grasper_flags"] = np.array([(grasper._can_grasp, getattr(grasper, "_is_grasping", False))
+                                           for grasper in graspers], dtype=bool).reshape(-1, 2)
+
+        for i, agent in enumerate(self._agents):
+            for j, sensor in enumerate(agent.sensors):
+                for name, value in _sensor_state(sensor).items():
+                    state[f"sensor_{i}_{j}_{name}"] = value
+
+        for name, value in self.noise_stream.get_state().items():
+            state["noise_" + name] = value
+        return state
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        """
+        Restores a state given by get_state() of this playground. The lidar and the semantic sensor are computed again
+        from the restored bodies, then the values and the noise of the sensors are restored, so the next ticks draw the
+        same noise as the ticks which followed get_state(). The contact impulses cached by pymunk are not restored.
+        The GL context of the playground must be the active one.
+        """
+        for element, removed in zip(self._elements, state["removed"]):
+            if removed and not element.removed:
+                self.remove(element)
+            elif not removed and element.removed:
+                self.add(element, from_removed=True)
+
+        graspers = self._graspers()
+        for grasper in graspers:
+            grasper._release_grasping()
+
+        for entity, (x, y, angle, vx, vy, angular_velocity) in zip(self._state_entities(), state["bodies"]):
+            body = entity.pm_body
+            body.position, body.angle = (x, y), angle
+            body.velocity, body.angular_velocity = (vx, vy), angular_velocity
+            if body.space:
+                body.space.reindex_shapes_for_body(body)
+            # The sprites of the views are updated from the moved entities
+            entity._moved = True
+
+        for i, j, *distances in state["grasps"]:
+            grasper, entity = graspers[int(i)], self._elements[int(j)]
+            graspable = next(interactive for interactive in entity.interactives
+                             if isinstance(interactive, Graspable))
+            grasper._can_grasp = True
+            grasper.grasps(graspable)
+            for joint, distance in zip(grasper._grasp_joints[entity], distances):
+                joint.distance = distance
+        for grasper, (can_grasp, is_grasping) in zip(graspers, state["grasper_flags"]):
+            grasper._can_grasp = bool(can_grasp)
+            if hasattr(grasper, "_is_grasping"):
+                grasper._is_grasping = bool(is_grasping)
+
+        self._timestep = int(state["timestep"])
+        self._done = bool(state["done"])
+
+        # The ray sensors see the restored bodies and grasps, their noise is overwritten below
+        self._external_sensors_outdated = True
+        self._invisible_update_pending = False
+        self.update_external_sensors()
+        for i, agent in enumerate(self._agents):
+            for j, sensor in enumerate(agent.sensors):
+                prefix = f"sensor_{i}_{j}_"
+                _set_sensor_state(sensor, {key[len(prefix):]: value for key, value in state.items()
+                                           if key.startswith(prefix)})
+
+        self.noise_stream.set_state({key[len("noise_"):]: value for key, value in state.items()
+                                     if key.startswith("noise_")})
+
     def _walls_creation(self):
         h = self._height / 2
         w = self._width / 2
@@ -55,3 +260,47 @@ class ClosedPlayground(Playground):
         for begin_pt, end_pt in pts:
             wall = NormalWall(begin_pt, end_pt)
             self.add(wall, wall.wall_coordinates)
+
+
+def _optional_array(value) -> np.ndarray:
+    """None is saved as an empty array"""
+    return np.zeros(0) if value is None else np.array(value, dtype=np.float64)
+
+
+def _from_optional_array(array: np.ndarray):
+    if array.size == 0:
+        return None
+    return float(array) if array.ndim == 0 else array.copy()
+
+
+def _sensor_state(sensor) -> Dict[str, np.ndarray]:
+    """
+    The values of a sensor and the state of its noise. The noisy detections of the semantic sensor are saved as a
+    structured array.
+    """
+    state = {}
+    values = getattr(sensor, "_values", None)
+    if isinstance(values, np.ndarray) and values.dtype.names is not None:
+        state["detections"] = np.array(values.view(np.ndarray))
+    elif isinstance(values, (float, np.ndarray)):
+        state["values"] = np.array(values, dtype=np.float64)
+    noise_model = getattr(sensor, "_noise_model", None)
+    if hasattr(noise_model, "_last_noise"):
+        state["last_noise"] = _optional_array(noise_model._last_noise)
+    if hasattr(sensor, "prev_position"):
+        state["prev_position"] = _optional_array(sensor.prev_position)
+        state["prev_angle"] = _optional_array(sensor.prev_angle)
+    return state
+
+
+def _set_sensor_state(sensor, state: Dict[str, np.ndarray]):
+    if "values" in state:
+        sensor._values = _from_optional_array(state["values"])
+    if "detections" in state:
+        sensor._values = np.array(state["detections"]).view(np.recarray)
+    if "last_noise" in state:
+        sensor._noise_model._last_noise = _from_optional_array(state["last_noise"])
+    if "prev_position" in state:
+        prev_position = _from_optional_array(state["prev_position"])
+        sensor.prev_position = None if prev_position is None else pymunk.Vec2d(*prev_position)
+        sensor.prev_angle = _from_optional_array(state["prev_angle"])
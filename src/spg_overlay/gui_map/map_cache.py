@@ -0,0 +1,304 @@
+import hashlib
+import inspect
+import os
+import shutil
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+from spg.playground import Playground
+
+from spg_overlay.entities.normal_wall import NormalWall, NormalBox
+
+"""
+On disk cache of the compiled assets of the maps: the image of the walls, the free space and the geometry of the
+walls and boxes. The assets are stored as .npy files, loaded memory-mapped, so that the workers running the same map
+share the same pages instead of rendering and keeping their own copy.
+
+When a map is compiled, its walls and boxes are simplified: the collinear walls that touch or overlap are merged, the
+boxes sharing a side are merged, and the walls and boxes inside a box are removed. The union of the shapes is the
+same, but there are fewer static shapes for the ray casts of the sensors and the collision broadphase.
+"""
+
+# Directory of the cache, set SWARMRL_MAP_CACHE to an empty string to disable it
+MAP_CACHE_DIR = os.environ.get(
+    "SWARMRL_MAP_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "swarmrl", "maps")
+)
+# Changed when the content of the assets changes, to ignore the older caches
+MAP_CACHE_VERSION = 2
+
+# Minimal distance, in pixels, between a point of the free space and the walls
+FREE_SPACE_MARGIN = 30
+
+# Kind of the rows of the geometry
+GEOMETRY_WALL = 0
+GEOMETRY_BOX = 1
+
+# Tolerance, in pixels, of the comparisons of the simplification
+GEOMETRY_EPSILON = 1e-6
+
+
+class MapAssets:
+    """
+    The MapAssets class holds the compiled assets of a map, for one size of the map.
+
+    Example Usage
+        assets = load_map_assets(my_map)
+        if assets is None:
+            assets = compile_map_assets(my_map, explored_map.map_playground, walls)
+        add_walls_from_geometry(playground, assets.geometry)
+
+    Fields
+        walls: (height, width) uint8 image of the walls, the walls are white (255), as in ExploredMap.
+        free_space: (height, width) bool image, True farther than FREE_SPACE_MARGIN pixels from any wall.
+        geometry: (n, 5) float64 array, one row per wall (GEOMETRY_WALL, x_start, y_start, x_end, y_end) or box
+            (GEOMETRY_BOX, x_up_left, y_up_left, width, height), as given to NormalWall and NormalBox, once simplified.
+        source_geometry: the geometry as added by the map, before the simplification.
+    """
+
+    FILES = ("walls", "free_space", "geometry", "source_geometry")
+
+    def __init__(self, walls: np.ndarray, free_space: np.ndarray, geometry: np.ndarray,
+                 source_geometry: np.ndarray):
+        self.walls = walls
+        self.free_space = free_space
+        self.geometry = geometry
+        self.source_geometry = source_geometry
+
+    def simplification_report(self) -> Dict[str, int]:
+        return simplification_report(self.source_geometry, self.geometry)
+
+    def save(self, directory: str):
+        for name in self.FILES:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str) -> "MapAssets":
+        arrays = [np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in cls.FILES]
+        return cls(*arrays)
+
+
+def _source_hash(map_object) -> str:
+    """
+    Hash of the source of the map module and of the modules of the functions it uses from the same package
+    (add_walls, add_boxes...), so that the cache is compiled again when the map is edited.
+    """
+    module = sys.modules[type(map_object).__module__]
+    package = module.__name__.rpartition(".")[0]
+    files = {inspect.getsourcefile(module)}
+    for value in vars(module).values():
+        if inspect.isfunction(value) and value.__module__.rpartition(".")[0] == package:
+            files.add(inspect.getsourcefile(value))
+
+    digest = hashlib.sha1(str(MAP_CACHE_VERSION).encode())
+    for file in sorted(files):
+        with open(file, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def map_cache_path(map_object) -> Optional[str]:
+    """Directory of the assets of a map, None when the cache is disabled"""
+    if not MAP_CACHE_DIR:
+        return None
+    width, height = map_object.size_area
+    name = f"{type(map_object).__name__}_{width}x{height}_{_source_hash(map_object)}"
+    return os.path.join(MAP_CACHE_DIR, name)
+
+
+def load_map_assets(map_object) -> Optional[MapAssets]:
+    """Returns the cached assets of the map, or None if they were not compiled yet"""
+    path = map_cache_path(map_object)
+    if path is None or not os.path.isdir(path):
+        return None
+    try:
+        return MapAssets.load(path)
+    except (OSError, ValueError):
+        return None
+
+
+def wall_geometry(walls: List) -> np.ndarray:
+    """Geometry of the NormalWall and NormalBox of the list, the other entities are ignored"""
+    rows = []
+    for wall in walls:
+        if isinstance(wall, NormalWall):
+            rows.append((GEOMETRY_WALL, *wall.pos_start, *wall.pos_end))
+        elif isinstance(wall, NormalBox):
+            rows.append((GEOMETRY_BOX, *wall.up_left_point, *wall.box_size))
+    return np.array(rows, dtype=np.float64).reshape((-1, 5))
+
+
+def add_walls_from_geometry(playground: Playground, geometry: np.ndarray):
+    """Adds to the playground the walls and boxes described by a geometry array"""
+    for row in geometry.tolist():
+        # The maps give integer coordinates, they are given back as int as the textures are cropped with them
+        kind, a, b, c, d = (int(v) if v.is_integer() else v for v in row)
+        if kind == GEOMETRY_WALL:
+            wall = NormalWall(pos_start=(a, b), pos_end=(c, d))
+        else:
+            wall = NormalBox(up_left_point=(a, b), width=c, height=d)
+        playground.add(wall, wall.wall_coordinates)
+
+
+def remove_walls(playground: Playground, walls: List):
+    """Removes from the playground the NormalWall and NormalBox of the list, the other entities are kept"""
+    for wall in walls:
+        if isinstance(wall, (NormalWall, NormalBox)):
+            playground.remove(wall, definitive=True)
+
+
+def _wall_corners(x_start: float, y_start: float, x_end: float, y_end: float) -> np.ndarray:
+    """Corners of the rectangle covered by a NormalWall, it spans its points along the wall"""
+    v = np.array((x_end - x_start, y_end - y_start), dtype=np.float64)
+    n = np.array((-v[1], v[0])) / np.linalg.norm(v) * NormalWall.WIDTH / 2
+    p_start = np.array((x_start, y_start), dtype=np.float64)
+    p_end = np.array((x_end, y_end), dtype=np.float64)
+    return np.array((p_start + n, p_start - n, p_end + n, p_end - n))
+
+
+def _box_contains(box: tuple, points: np.ndarray) -> bool:
+    x_min, y_min, x_max, y_max = box
+    return bool(np.all((points[:, 0] >= x_min - GEOMETRY_EPSILON) & (points[:, 0] <= x_max + GEOMETRY_EPSILON)
+                       & (points[:, 1] >= y_min - GEOMETRY_EPSILON) & (points[:, 1] <= y_max + GEOMETRY_EPSILON)))
+
+
+def _merge_walls(walls: List[tuple]) -> List[tuple]:
+    """
+    Merges the collinear walls which touch or overlap. The walls are grouped by line, each line being its direction
+    and its distance to the origin, then the intervals covered on each line are merged. The points of the merged walls
+    are points of the original walls, so that they keep their exact coordinates.
+    """
+    lines = {}
+    merged = []
+    for x_start, y_start, x_end, y_end in walls:
+        v = np.array((x_end - x_start, y_end - y_start), dtype=np.float64)
+        length = np.linalg.norm(v)
+        if length <= GEOMETRY_EPSILON:
+            merged.append((x_start, y_start, x_end, y_end))
+            continue
+        u = v / length
+        if u[0] < -GEOMETRY_EPSILON or (abs(u[0]) <= GEOMETRY_EPSILON and u[1] < 0):
+            u = -u
+        offset = u[0] * y_start - u[1] * x_start
+        key = (round(u[0], 6), round(u[1], 6), round(offset, 6))
+        t_start = u[0] * x_start + u[1] * y_start
+        t_end = u[0] * x_end + u[1] * y_end
+        ends = sorted(((t_start, (x_start, y_start)), (t_end, (x_end, y_end))), key=lambda end: end[0])
+        lines.setdefault(key, []).append(ends)
+
+    for intervals in lines.values():
+        intervals.sort(key=lambda ends: ends[0][0])
+        (_, p_low), (t_high, p_high) = intervals[0]
+        for (t_start, p_start), (t_end, p_end) in intervals[1:]:
+            if t_start <= t_high + GEOMETRY_EPSILON:
+                if t_end > t_high:
+                    t_high, p_high = t_end, p_end
+            else:
+                merged.append((*p_low, *p_high))
+                (_, p_low), (t_high, p_high) = (t_start, p_start), (t_end, p_end)
+        merged.append((*p_low, *p_high))
+    return merged
+
+
+def _merge_boxes(boxes: List[tuple]) -> List[tuple]:
+    """
+    Merges the boxes, given as (x_min, y_min, x_max, y_max), until no two boxes can be merged: a box inside another is
+    removed, and two boxes with the same side which touch or overlap are replaced by their union.
+    """
+    boxes = list(boxes)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(boxes)):
+            for j in range(len(boxes)):
+                if i == j:
+                    continue
+                a, b = boxes[i], boxes[j]
+                corners_b = np.array(((b[0], b[1]), (b[2], b[3])), dtype=np.float64)
+                same_x = abs(a[0] - b[0]) <= GEOMETRY_EPSILON and abs(a[2] - b[2]) <= GEOMETRY_EPSILON
+                same_y = abs(a[1] - b[1]) <= GEOMETRY_EPSILON and abs(a[3] - b[3]) <= GEOMETRY_EPSILON
+                if _box_contains(a, corners_b):
+                    union = a
+                elif same_x and b[1] <= a[3] + GEOMETRY_EPSILON and a[1] <= b[3] + GEOMETRY_EPSILON:
+                    union = (a[0], min(a[1], b[1]), a[2], max(a[3], b[3]))
+                elif same_y and b[0] <= a[2] + GEOMETRY_EPSILON and a[0] <= b[2] + GEOMETRY_EPSILON:
+                    union = (min(a[0], b[0]), a[1], max(a[2], b[2]), a[3])
+                else:
+                    continue
+                boxes[i] = union
+                del boxes[j]
+                changed = True
+                break
+            if changed:
+                break
+    return boxes
+
+
+def simplify_geometry(geometry: np.ndarray) -> np.ndarray:
+    """
+    Returns a geometry covering the same area with fewer walls and boxes: the collinear walls which touch or overlap
+    are merged, the boxes are merged (see _merge_boxes), and the walls inside a box are removed.
+    """
+    walls = [tuple(row[1:]) for row in geometry.tolist() if row[0] == GEOMETRY_WALL]
+    boxes = [(x, y - height, x + width, y)
+             for kind, x, y, width, height in geometry.tolist() if kind == GEOMETRY_BOX]
+
+    boxes = _merge_boxes(boxes)
+    walls = [wall for wall in _merge_walls(walls)
+             if not any(_box_contains(box, _wall_corners(*wall)) for box in boxes)]
+
+    rows = [(GEOMETRY_WALL, *wall) for wall in walls]
+    rows += [(GEOMETRY_BOX, x_min, y_max, x_max - x_min, y_max - y_min) for x_min, y_min, x_max, y_max in boxes]
+    return np.array(rows, dtype=np.float64).reshape((-1, 5))
+
+
+def simplification_report(source_geometry: np.ndarray, geometry: np.ndarray) -> Dict[str, int]:
+    """Numbers of walls and boxes before and after the simplification, and the number of shapes removed"""
+    return {
+        "source_walls": int(np.sum(source_geometry[:, 0] == GEOMETRY_WALL)),
+        "source_boxes": int(np.sum(source_geometry[:, 0] == GEOMETRY_BOX)),
+        "walls": int(np.sum(geometry[:, 0] == GEOMETRY_WALL)),
+        "boxes": int(np.sum(geometry[:, 0] == GEOMETRY_BOX)),
+        "removed": len(source_geometry) - len(geometry),
+    }
+
+
+def compile_map_assets(map_object, walls_image: np.ndarray, geometry: np.ndarray,
+                       source_geometry: np.ndarray) -> MapAssets:
+    """
+    Builds the assets of a map from the image of its walls (ExploredMap.map_playground) and the geometry of its walls
+    and boxes, simplified and as added by the map, and stores them in the cache. The assets are returned even if they
+    could not be stored.
+    """
+    walls_image = np.ascontiguousarray(walls_image, dtype=np.uint8)
+    distance = cv2.distanceTransform(
+        np.where(walls_image == 255, 0, 255).astype(np.uint8), cv2.DIST_L2, 5
+    )
+    assets = MapAssets(
+        walls=walls_image,
+        free_space=distance >= FREE_SPACE_MARGIN,
+        geometry=geometry,
+        source_geometry=source_geometry,
+    )
+
+    report = assets.simplification_report()
+    print(f"Map cache: compiled {type(map_object).__name__}, {report['removed']} shapes removed by the simplification "
+          f"(walls: {report['source_walls']} -> {report['walls']}, boxes: {report['source_boxes']} -> {report['boxes']})")
+
+    path = map_cache_path(map_object)
+    if path is None:
+        return assets
+    try:
+        os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+        # Written aside then renamed, the workers compiling the same map at the same time keep the first one
+        tmp_path = tempfile.mkdtemp(dir=MAP_CACHE_DIR)
+        assets.save(tmp_path)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    except OSError as e:
+        print(f"Map cache: could not store the assets of {type(map_object).__name__} ({e})")
+    return assets
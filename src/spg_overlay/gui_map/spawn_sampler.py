@@ -0,0 +1,247 @@
+import math
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+"""
+Placement of the drones, the wounded persons and the rescue center at the reset of a map, drawn from the free space of
+the image of its walls, and banks of such placements saved on disk.
+"""
+
+# Radius, in pixels, of the drones and of the wounded persons
+DRONE_RADIUS = 10
+PERSON_RADIUS = 12
+# Clearance, in pixels, kept between the entities placed and the walls or the other entities
+SPAWN_MARGIN = 5
+# Minimal distance, in pixels, between a wounded person and the rescue center
+MIN_PERSON_RESCUE_CENTER_DISTANCE = 120
+
+
+class Scenario(NamedTuple):
+    """
+    The placement of the entities of one episode, in the coordinates of the playground.
+    rescue_center: (2,) position of the rescue center.
+    persons: (n_persons, 2) positions of the wounded persons.
+    drones: (n_drones, 3) positions and angles of the drones.
+    """
+    rescue_center: np.ndarray
+    persons: np.ndarray
+    drones: np.ndarray
+
+
+class SpawnSampler:
+    """
+    The SpawnSampler class draws the placements of the entities of a map in its free space. The distance of each pixel
+    to the walls is computed once from the image of the walls, and the pixels far enough from the walls for each kind
+    of entity (its radius plus SPAWN_MARGIN) are kept in an index: a position is one random integer, whatever the
+    shape of the map. The candidates are drawn in batches of batch_size and checked against the distance constraints
+    with numpy, at most max_batches times, so that the cost of a placement is bounded: a ValueError is raised when
+    the map cannot hold the entities, instead of looping forever.
+
+    The constraints of a scenario:
+    - all the entities are clear of the walls,
+    - the wounded persons are farther than MIN_PERSON_RESCUE_CENTER_DISTANCE from the rescue center,
+    - the wounded persons do not overlap each other, nor the drones, and the drones do not overlap each other nor the
+      rescue center.
+
+    Example Usage
+        sampler = SpawnSampler(explored_map.map_playground, rescue_center_size=(60, 60), seed=0)
+        scenario = sampler.sample_scenario(n_drones=4, n_persons=3)
+        # or with a rescue center which does not move
+        scenario = sampler.sample_scenario(n_drones=4, n_persons=3, rescue_center=(295, 205))
+
+    Inputs
+        walls: (height, width) uint8 image of the walls, the walls are white (255), as in ExploredMap.
+        rescue_center_size: (width, height) of the rescue center, it must fit entirely in the free space.
+        seed: seed of the random generator.
+        batch_size: number of candidates drawn at once.
+        max_batches: number of batches drawn before giving up.
+
+    Fields
+        width, height: size of the map, in pixels.
+        radii: the clearance to the walls of each kind of entity, "drone", "person" and "rescue_center".
+        rng: the numpy random generator of the placements.
+    """
+
+    def __init__(self,
+                 walls: np.ndarray,
+                 rescue_center_size: Tuple[int, int],
+                 seed: Optional[int] = None,
+                 batch_size: int = 256,
+                 max_batches: int = 16):
+        self.height, self.width = walls.shape[:2]
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.radii = {
+            "drone": DRONE_RADIUS + SPAWN_MARGIN,
+            "person": PERSON_RADIUS + SPAWN_MARGIN,
+            "rescue_center": math.hypot(*rescue_center_size) / 2 + SPAWN_MARGIN,
+        }
+        self.rng = np.random.default_rng(seed)
+
+        walls = np.ascontiguousarray(walls, dtype=np.uint8)
+        distance = cv2.distanceTransform(np.where(walls == 255, 0, 255).astype(np.uint8), cv2.DIST_L2, 5)
+        # Flat indices of the pixels where each kind of entity fits
+        self._free: Dict[str, np.ndarray] = {}
+        for name, radius in self.radii.items():
+            free = np.flatnonzero(distance.ravel() >= radius)
+            if free.size == 0:
+                raise ValueError(f"No free space for the {name} in a map of size {self.width}x{self.height}")
+            self._free[name] = free
+
+    def seed(self, seed: Optional[int] = None):
+        self.rng = np.random.default_rng(seed)
+
+    def free_space(self, name: str) -> np.ndarray:
+        """(height, width) bool image, True where an entity of kind name fits"""
+        mask = np.zeros(self.height * self.width, dtype=bool)
+        mask[self._free[name]] = True
+        return mask.reshape(self.height, self.width)
+
+    def _candidates(self, name: str, n: int) -> np.ndarray:
+        """n positions of the free space of name, drawn uniformly, in the coordinates of the playground"""
+        free = self._free[name]
+        rows, cols = np.divmod(free[self.rng.integers(free.size, size=n)], self.width)
+        return np.column_stack((cols - self.width / 2, self.height / 2 - rows)).astype(np.float64)
+
+    def sample(self,
+               name: str,
+               n: int,
+               min_distance: float = 0.0,
+               avoid: Optional[np.ndarray] = None,
+               avoid_distance=0.0) -> np.ndarray:
+        """
+        (n, 2) positions where the entities of kind name fit, at least min_distance from each other and farther than
+        avoid_distance from the (m, 2) positions avoid, one distance for all of them or an (m,) array
+        """
+        chosen = np.zeros((n, 2))
+        n_chosen = 0
+        if avoid is not None:
+            avoid = np.asarray(avoid, dtype=np.float64).reshape(-1, 2)
+            avoid_distance = np.broadcast_to(np.asarray(avoid_distance, dtype=np.float64), (len(avoid),))
+        for _ in range(self.max_batches):
+            if n_chosen == n:
+                break
+            candidates = self._candidates(name, self.batch_size)
+            if avoid is not None and len(avoid) > 0:
+                distances = ((candidates[:, None, :] - avoid[None, :, :]) ** 2).sum(axis=2)
+                candidates = candidates[(distances > avoid_distance ** 2).all(axis=1)]
+            if min_distance <= 0:
+                taken = candidates[:n - n_chosen]
+                chosen[n_chosen:n_chosen + len(taken)] = taken
+                n_chosen += len(taken)
+                continue
+            # Greedy selection of the candidates, in order, which do not overlap the ones chosen before
+            for candidate in candidates:
+                distances = ((chosen[:n_chosen] - candidate) ** 2).sum(axis=1)
+                if n_chosen == 0 or distances.min() >= min_distance ** 2:
+                    chosen[n_chosen] = candidate
+                    n_chosen += 1
+                    if n_chosen == n:
+                        break
+        if n_chosen == n:
+            return chosen
+        raise ValueError(f"Could not place {n} entities of kind {name} in {self.max_batches} batches of "
+                         f"{self.batch_size} candidates, the map is too crowded")
+
+    def sample_scenario(self,
+                        n_drones: int,
+                        n_persons: int,
+                        rescue_center: Optional[Tuple[float, float]] = None) -> Scenario:
+        """
+        A placement of all the entities of an episode, which satisfies all the constraints. When rescue_center is
+        given, the rescue center does not move and the persons are placed far from it.
+        """
+        if rescue_center is None:
+            rescue_center = self.sample("rescue_center", 1)[0]
+        rescue_center = np.asarray(rescue_center, dtype=np.float64)
+        persons = self.sample("person", n_persons,
+                              min_distance=2 * PERSON_RADIUS + SPAWN_MARGIN,
+                              avoid=rescue_center[None, :],
+                              avoid_distance=MIN_PERSON_RESCUE_CENTER_DISTANCE)
+        # The rescue center is solid, and it is not in the image of the walls
+        drones = self.sample("drone", n_drones,
+                             min_distance=2 * DRONE_RADIUS + SPAWN_MARGIN,
+                             avoid=np.vstack((persons, rescue_center)),
+                             avoid_distance=np.append(np.full(n_persons, DRONE_RADIUS + PERSON_RADIUS + SPAWN_MARGIN),
+                                                      self.radii["rescue_center"] + DRONE_RADIUS))
+        angles = self.rng.uniform(-math.pi, math.pi, size=n_drones)
+        return Scenario(rescue_center=rescue_center, persons=persons, drones=np.column_stack((drones, angles)))
+
+
+class ScenarioBank:
+    """
+    The ScenarioBank class holds scenarios drawn in advance by a SpawnSampler, so that a reset only picks one of them.
+    The same seed gives the same bank, and the same sequence of draws; a bank saved to disk gives the same episodes to
+    every run and every worker.
+
+    Example Usage
+        bank = ScenarioBank.generate(sampler, n_scenarios=10000, n_drones=4, n_persons=3, seed=0)
+        bank.save("easy_4_drones.npz")
+        ...
+        bank = ScenarioBank.load("easy_4_drones.npz", seed=1)
+        scenario = bank.draw()
+
+    Inputs
+        rescue_centers: (n_scenarios, 2) positions of the rescue center.
+        persons: (n_scenarios, n_persons, 2) positions of the wounded persons.
+        drones: (n_scenarios, n_drones, 3) positions and angles of the drones.
+        seed: seed of the random generator of draw().
+
+    Fields
+        n_drones, n_persons: number of drones and of wounded persons of the scenarios.
+    """
+
+    def __init__(self,
+                 rescue_centers: np.ndarray,
+                 persons: np.ndarray,
+                 drones: np.ndarray,
+                 seed: Optional[int] = None):
+        self.rescue_centers = np.asarray(rescue_centers, dtype=np.float64).reshape(-1, 2)
+        self.persons = np.asarray(persons, dtype=np.float64).reshape(len(self.rescue_centers), -1, 2)
+        self.drones = np.asarray(drones, dtype=np.float64).reshape(len(self.rescue_centers), -1, 3)
+        if len(self.rescue_centers) == 0:
+            raise ValueError("A scenario bank needs at least one scenario")
+        self.n_persons = self.persons.shape[1]
+        self.n_drones = self.drones.shape[1]
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def generate(cls,
+                 sampler: SpawnSampler,
+                 n_scenarios: int,
+                 n_drones: int,
+                 n_persons: int,
+                 rescue_center: Optional[Tuple[float, float]] = None,
+                 seed: Optional[int] = None) -> "ScenarioBank":
+        """Draw n_scenarios scenarios with sampler, seeded with seed"""
+        sampler.seed(seed)
+        scenarios = [sampler.sample_scenario(n_drones, n_persons, rescue_center) for _ in range(n_scenarios)]
+        return cls(
+            rescue_centers=np.array([scenario.rescue_center for scenario in scenarios]),
+            persons=np.array([scenario.persons for scenario in scenarios]).reshape(n_scenarios, n_persons, 2),
+            drones=np.array([scenario.drones for scenario in scenarios]).reshape(n_scenarios, n_drones, 3),
+            seed=seed,
+        )
+
+    def __len__(self) -> int:
+        return len(self.rescue_centers)
+
+    def __getitem__(self, i: int) -> Scenario:
+        return Scenario(rescue_center=self.rescue_centers[i], persons=self.persons[i], drones=self.drones[i])
+
+    def seed(self, seed: Optional[int] = None):
+        self.rng = np.random.default_rng(seed)
+
+    def draw(self) -> Scenario:
+        """A scenario of the bank, drawn uniformly"""
+        return self[int(self.rng.integers(len(self)))]
+
+    def save(self, path: str):
+        np.savez(path, rescue_centers=self.rescue_centers, persons=self.persons, drones=self.drones)
+
+    @classmethod
+    def load(cls, path: str, seed: Optional[int] = None) -> "ScenarioBank":
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(arrays["rescue_centers"], arrays["persons"], arrays["drones"], seed=seed)
@@ -2,7 +2,7 @@ import math
 
 import cv2
 import numpy as np
-from typing import List
+from typing import Dict, List
 # from spg.engine import Engine
 from spg.playground import Playground
 from spg.view import TopDownView
@@ -11,6 +11,12 @@ from spg_overlay.entities.drone_abstract import DroneAbstract
 from spg_overlay.utils.utils import bresenham, circular_kernel
 
 
+# Radius, in pixels, of the zone explored around the path of the drones
+RADIUS_EXPLO = 200
+# Radius of the kernel of one erosion step, it should be equal to the width(+1 because of bug in SPG)
+ONE_TIME_RADIUS_KERNEL = 5
+
+
 def _create_black_white_image(img_playground):
     map_color = cv2.normalize(src=img_playground, dst=None, alpha=0, beta=255,
                               norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8U)
@@ -19,6 +25,43 @@ def _create_black_white_image(img_playground):
     return map_playground
 
 
+def _erode_around_walls(map_explo_lines, map_playground):
+    """
+    Erodes several times the map of the explored lines (black lines on a white background) and corrects each time the
+    walls, so that the explored zone grows around the lines without going through the walls.
+    In the returned image, the explored zone is black.
+    """
+    eroded_image = map_explo_lines.copy()
+    walls = map_playground == 255
+    remain_radius = RADIUS_EXPLO
+    one_time_radius_kernel = ONE_TIME_RADIUS_KERNEL
+
+    kernel = circular_kernel(one_time_radius_kernel)
+
+    while remain_radius != 0:
+        # Creating kernel
+        if remain_radius < one_time_radius_kernel:
+            one_time_radius_kernel = remain_radius
+            remain_radius = 0
+        else:
+            remain_radius -= one_time_radius_kernel
+
+        # Using cv2.erode() method
+        eroded_image = cv2.erode(eroded_image, kernel, cv2.BORDER_REFLECT)
+
+        # The pixels of the eroded_image where there are walls (map_playground == 255) should stay white (255)
+        eroded_image[walls] = 255
+
+    return eroded_image
+
+
+def _area(box):
+    """
+    Area of a box (x0, y0, x1, y1)
+    """
+    return max(box[2] - box[0], 0) * max(box[3] - box[1], 0)
+
+
 class ExploredMap:
     """
      The ExploredMap class is used to keep track of which parts of the map have been explored by drones. It provides
@@ -65,6 +108,8 @@ class ExploredMap:
         self._explo_pts = dict()
         # Dictionary to store the last position of each drone
         self._last_position = dict()
+        # Segments drawn in _map_explo_lines since the last update of _map_explo_zones
+        self._new_segments = []
 
         self._count_pixel_walls = 0
         self._count_pixel_explored = 0
@@ -85,9 +130,44 @@ class ExploredMap:
         self._map_explo_zones = np.zeros(self._map_playground.shape, np.uint8)
         self._explo_pts = dict()
         self._last_position = dict()
-        self._count_pixel_walls = 0
+        self._new_segments = []
         self._count_pixel_explored = 0
-        self._count_pixel_total = 0
+
+    def get_state(self, drones: List[DroneAbstract]) -> Dict[str, np.ndarray]:
+        """
+        The maps and the positions of the drones, to be given back to set_state(). The maps only hold 0 and 255, they
+        are packed to one bit per pixel. The drones are saved by index in the list.
+        """
+        last_position = np.full((len(drones), 2), -1, dtype=np.int32)
+        explo_pts = []
+        for i, drone in enumerate(drones):
+            if drone in self._last_position:
+                last_position[i] = self._last_position[drone]
+            explo_pts.append(np.array(self._explo_pts.get(drone, []), dtype=np.int32).reshape(-1, 2))
+        return {
+            "explo_lines": np.packbits(self._map_explo_lines == 255),
+            "explo_zones": np.packbits(self._map_explo_zones == 255),
+            "last_position": last_position,
+            "explo_pts": np.concatenate(explo_pts) if explo_pts else np.zeros((0, 2), dtype=np.int32),
+            "explo_pts_count": np.array([len(pts) for pts in explo_pts], dtype=np.int64),
+            "new_segments": np.array(self._new_segments, dtype=np.int32).reshape(-1, 4),
+            "count_pixel_explored": np.array(self._count_pixel_explored),
+        }
+
+    def set_state(self, state: Dict[str, np.ndarray], drones: List[DroneAbstract]):
+        """Restores a state given by get_state(), with the same drones"""
+        shape = self._map_playground.shape
+        size = shape[0] * shape[1]
+        self._map_explo_lines = np.unpackbits(state["explo_lines"], count=size).reshape(shape) * np.uint8(255)
+        self._map_explo_zones = np.unpackbits(state["explo_zones"], count=size).reshape(shape) * np.uint8(255)
+
+        self._last_position = {drone: tuple(int(v) for v in position)
+                               for drone, position in zip(drones, state["last_position"]) if position[0] >= 0}
+        bounds = np.cumsum(state["explo_pts_count"])[:-1]
+        self._explo_pts = {drone: [tuple(int(v) for v in pt) for pt in pts]
+                           for drone, pts in zip(drones, np.split(state["explo_pts"], bounds)) if len(pts)}
+        self._new_segments = [((int(x0), int(y0)), (int(x1), int(y1))) for x0, y0, x1, y1 in state["new_segments"]]
+        self._count_pixel_explored = int(state["count_pixel_explored"])
 
     def _create_image_walls(self, playground: Playground):
         """
@@ -101,17 +181,20 @@ class ExploredMap:
         self._img_playground = cv2.cvtColor(self._img_playground, cv2.COLOR_BGR2RGB)
         return self._img_playground
 
-    def initialize_walls(self, playground: Playground):
+    def initialize_walls(self, playground: Playground, map_playground: np.ndarray = None):
         """
         From _img_playground, it creates a black and white image of the walls saved in _map_playground.
         Creates an image of the playground without drones and wounded persons
+        If map_playground is given (the walls loaded from the map cache), it is used as is and nothing is rendered.
         """
         self.initialized = True
-        img_playground = self._create_image_walls(playground)
+        if map_playground is None:
+            img_playground = self._create_image_walls(playground)
 
-        # cv2.imshow("img_playground", img_playground)
-        # cv2.waitKey(0)
-        self._map_playground = _create_black_white_image(img_playground)
+            # cv2.imshow("img_playground", img_playground)
+            # cv2.waitKey(0)
+            map_playground = _create_black_white_image(img_playground)
+        self._map_playground = map_playground
 
         # _map_explo_lines : map of the point visited by drones (all positions of the drones)
         # Initialize _map_explo_lines with 255 (white)
@@ -119,6 +202,18 @@ class ExploredMap:
         # _map_explo_zones : map of the zone explored by drones
         # Initialize _map_explo_zones with zeros (black)
         self._map_explo_zones = np.zeros(self._map_playground.shape, np.uint8)
+        self._new_segments = []
+
+        # The walls do not move, their pixels are counted once
+        d = self._map_playground.shape
+        self._count_pixel_total = d[0] * d[1]
+        self._count_pixel_walls = cv2.countNonZero(self._map_playground)
+        self._count_pixel_explored = 0
+
+    @property
+    def map_playground(self):
+        """Black and white image of the walls, the walls are white (255)"""
+        return self._map_playground
 
     def update_drones(self, drones: [List[DroneAbstract]]):
         """
@@ -137,6 +232,7 @@ class ExploredMap:
                 if drone in self._last_position.keys():
                     cv2.line(img=self._map_explo_lines, pt1=self._last_position[drone], pt2=position_ocv,
                              color=(0, 0, 0))
+                    self._new_segments.append((self._last_position[drone], position_ocv))
                 if drone in self._explo_pts:
                     self._explo_pts[drone].append(position_ocv)
                 else:
@@ -145,6 +241,13 @@ class ExploredMap:
             # else:
             #     print("Error")
 
+    def update(self, drones: [List[DroneAbstract]]):
+        """
+        Update the positions of the drones and the map of the explored zones
+        """
+        self.update_drones(drones)
+        self._process_new_segments()
+
     def get_pretty_map_explo_lines(self):
         """
         Returns a map with the explored lines highlighted
@@ -178,38 +281,61 @@ class ExploredMap:
 
     def _process_positions(self):
         """
-        Process the list of the positions of the drones to draw the map of the explored zones
+        Process the list of the positions of the drones to draw the map of the explored zones, on the whole map
         """
-        radius_explo = 200
-
-        # we will erode several time the self._map_explo_lines and correct each times the wall
         # In eroded_image, the explored zone is black
-        eroded_image = self._map_explo_lines.copy()
-        remain_radius = radius_explo
-        # one_time_radius_kernel should be equal to the width(+1 because of bug in SPG)
-        one_time_radius_kernel = 5
+        eroded_image = _erode_around_walls(self._map_explo_lines, self._map_playground)
+        self._map_explo_zones = cv2.bitwise_not(eroded_image)
+        self._new_segments = []
+        self._count_pixel_explored = cv2.countNonZero(self._map_explo_zones)
 
-        kernel = circular_kernel(one_time_radius_kernel)
+    def _process_new_segments(self):
+        """
+        Update the map of the explored zones with the segments drawn since the last update only.
+        The explored zone of a set of lines is the union of the explored zones of each line, and a pixel can only be
+        explored from a line closer than RADIUS_EXPLO. So only the region around the new segments, enlarged by
+        RADIUS_EXPLO, is processed, and the result is exactly the one of _process_positions().
+        """
+        if not self._new_segments:
+            return
 
-        while remain_radius != 0:
-            # Creating kernel
-            if remain_radius < one_time_radius_kernel:
-                one_time_radius_kernel = remain_radius
-                remain_radius = 0
-            else:
-                remain_radius -= one_time_radius_kernel
+        height, width = self._map_playground.shape
+        margin = RADIUS_EXPLO + 1
+
+        # One region per segment, two regions are merged when their bounding box is not larger than both of them
+        regions = []
+        for pt1, pt2 in self._new_segments:
+            box = (max(min(pt1[0], pt2[0]) - margin, 0), max(min(pt1[1], pt2[1]) - margin, 0),
+                   min(max(pt1[0], pt2[0]) + margin + 1, width), min(max(pt1[1], pt2[1]) + margin + 1, height))
+            merged = True
+            while merged:
+                merged = False
+                for i, other in enumerate(regions):
+                    union = (min(box[0], other[0]), min(box[1], other[1]),
+                             max(box[2], other[2]), max(box[3], other[3]))
+                    if _area(union) <= _area(box) + _area(other):
+                        box = union
+                        del regions[i]
+                        merged = True
+                        break
+            regions.append(box)
 
-            # Using cv2.erode() method
-            eroded_image = cv2.erode(eroded_image, kernel, cv2.BORDER_REFLECT)
+        # When the regions cover more than the map, processing the whole map is cheaper
+        if sum(_area(box) for box in regions) >= width * height:
+            self._process_positions()
+            return
 
-            # The pixels of the eroded_image where there are walls (map_playground == 255) should stay white (255)
-            eroded_image[self._map_playground == 255] = 255
+        for x0, y0, x1, y1 in regions:
+            # The older lines of the region are processed again, their explored zone is already in _map_explo_zones
+            eroded_image = _erode_around_walls(self._map_explo_lines[y0:y1, x0:x1],
+                                               self._map_playground[y0:y1, x0:x1])
 
-            # cv2.imshow("eroded_image", eroded_image)
-            # cv2.imshow("_map_explo_lines", self._map_explo_lines)
-            # cv2.waitKey(0)
+            zones = self._map_explo_zones[y0:y1, x0:x1]
+            count_before = cv2.countNonZero(zones)
+            cv2.bitwise_or(zones, cv2.bitwise_not(eroded_image), dst=zones)
+            self._count_pixel_explored += cv2.countNonZero(zones) - count_before
 
-        self._map_explo_zones = cv2.bitwise_not(eroded_image)
+        self._new_segments = []
 
     def _process_positions_bresenham(self):
         """
@@ -282,30 +408,15 @@ class ExploredMap:
 
     def score(self):
         """
-        Computes a score of the exploration of all the drones based on the percentage of explored area
+        Computes a score of the exploration of all the drones based on the percentage of explored area.
+        Only the segments travelled since the last call are processed, so the cost depends on the motion of the drones
+        and not on the size of the map.
         """
         if not self.initialized:
             return 0
 
-        # Computing map
-        self._process_positions()
-
-        # Computation of the score by counting pixels in the resulting map
-        d = self._map_playground.shape
-        self._count_pixel_total = d[0] * d[1]
-
-        # Compute count_pixel_walls
-        self._count_pixel_walls = cv2.countNonZero(self._map_playground)
-        self._count_pixel_walls += 1592  # cross on rescue center
-        # print("self._count_pixel_walls=", self._count_pixel_walls)
-
-        # Compute count_pixel_explored
-        self._count_pixel_explored = cv2.countNonZero(self._map_explo_zones)
-        # print("self._count_pixel_explored=", self._count_pixel_explored)
-
-        # Compute percentage_walls
-        # percentage_walls = self._count_pixel_walls / self._count_pixel_total * 100.0
-        # print("total pix=", self._count_pixel_total, " percentage walls=", percentage_walls)
+        # Updating map
+        self._process_new_segments()
 
         # Compute percentage_explored
         count_explorable = self._count_pixel_total - self._count_pixel_walls
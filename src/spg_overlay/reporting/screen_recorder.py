@@ -1,12 +1,19 @@
 import cv2
 from spg.view import TopDownView
 
+from spg_overlay.reporting.video_encoder import BackgroundVideoWriter
+
 
 class ScreenRecorder:
     """
         The ScreenRecorder class is used to record a view and save it to a video file. It initializes the recorder
         with the parameters of the view, captures frames from the view, and stops the recording when needed.
 
+        With background=True, which is the default, the frames are encoded by a BackgroundVideoWriter in another
+        process: capture_frame() only reads the view and copies it to shared memory, and the frames arriving while
+        queue_size frames wait to be encoded are dropped. The counts of frames and the encoding time are printed by
+        end_recording() and returned by stats().
+
         Example Usage
             # Create a ScreenRecorder object with the desired parameters
             recorder = ScreenRecorder(width=640, height=480, fps=30, out_file='output.avi')
@@ -18,23 +25,31 @@ class ScreenRecorder:
             recorder.end_recording()
     """
 
-    def __init__(self, width, height, fps, out_file):
+    def __init__(self, width, height, fps, out_file, background=True, queue_size=8):
         """
         Initialize the recorder with parameters of the view.
         :param width: Width of the view to capture
         :param height: Height of the view to capture
         :param fps: Frames per second
         :param out_file: Output file to save the recording
+        :param background: Encode the frames in another process, dropping them when it falls behind
+        :param queue_size: Number of frames which can wait to be encoded in the background
         """
 
+        self.video = None
+        self._writer = None
         if out_file is None:
-            self.video = None
             return
 
         self._out_file = out_file
 
         print("Initializing ScreenRecorder with parameters : width:{}, height:{}, fps:{}.".format(width, height, fps))
 
+        if background:
+            # The images read from the view are upside down, the worker flips them
+            self._writer = BackgroundVideoWriter(out_file, width, height, fps, queue_size=queue_size, flip=True)
+            return
+
         # define the codec and create a video writer object
         four_cc = cv2.VideoWriter_fourcc(*'XVID')
         self.video = cv2.VideoWriter(out_file, four_cc, float(fps), (width, height))
@@ -46,6 +61,11 @@ class ScreenRecorder:
         :return: None
         """
 
+        if self._writer is not None:
+            gui.update()
+            self._writer.submit(gui.get_np_img())
+            return
+
         if self.video is None:
             return
 
@@ -63,6 +83,11 @@ class ScreenRecorder:
         Call this method to stop recording.
         :return: None
         """
+        if self._writer is not None:
+            self._writer.close()
+            print("Output of the screen recording saved to {}, {}.".format(self._out_file, self.stats()))
+            return
+
         if self.video is None:
             return
 
@@ -70,6 +95,15 @@ class ScreenRecorder:
         self.video.release()
         print("Output of the screen recording saved to {}.".format(self._out_file))
 
+    def stats(self):
+        """
+        Counts of the frames submitted, dropped and encoded, and seconds spent encoding, when encoding in background.
+        :return: dict, empty when the frames are encoded in this process
+        """
+        if self._writer is None:
+            return {}
+        return self._writer.stats()
+
 # References
 #   For more tutorials on cv2.VideoWriter, go to:
 #   - https://opencv-python-tutroals.readthedocs.io/en/latest/py_tutorials/py_gui/py_video_display/py_video_display.html#display-video
@@ -0,0 +1,165 @@
+import multiprocessing as mp
+import queue
+import time
+from collections import deque
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+
+def _video_encoder_worker(out_file: str, four_cc: str, fps: float, width: int, height: int, flip: bool,
+                          convert: bool, shm_name: str, n_slots: int, filled, free, frames_encoded, encode_time) -> None:
+    shm = SharedMemory(name=shm_name)
+    frames = np.ndarray((n_slots, height, width, 3), dtype=np.uint8, buffer=shm.buf)
+    video = cv2.VideoWriter(out_file, cv2.VideoWriter_fourcc(*four_cc), float(fps), (width, height))
+    frame = None
+    try:
+        while True:
+            slot = filled.get()
+            if slot is None:
+                break
+            start = time.perf_counter()
+            frame = cv2.flip(frames[slot], 0) if flip else frames[slot]
+            video.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) if convert else frame)
+            free.put(slot)
+            frames_encoded.value += 1
+            encode_time.value += time.perf_counter() - start
+    except KeyboardInterrupt:
+        pass
+    finally:
+        video.release()
+        del frames, frame
+        shm.close()
+
+
+class BackgroundVideoWriter:
+    """
+    The BackgroundVideoWriter class encodes RGB frames into a video file in a worker process, so that the simulation
+    loop never waits for the encoder. The frames are copied into a ring of queue_size slots of shared memory, and only
+    the index of the slot goes through the queue of the worker. When all the slots are waiting to be encoded, the
+    frame is dropped instead of waiting: submit() returns False and frames_dropped is incremented. The flip and the
+    conversion of the colors to BGR, for the frames read from the GL buffers, are done by the worker too.
+
+    Example Usage
+        writer = BackgroundVideoWriter("episode.avi", width=1660, height=1122, fps=30)
+        for _ in range(1000):
+            playground.step(commands)
+            writer.submit(gui.get_playground_image())
+        writer.close()
+        print(writer.stats())
+        # {"frames_submitted": 1000, "frames_dropped": 12, "frames_encoded": 988, "encode_time": 4.1}
+
+    Inputs
+        out_file: the video file.
+        width, height: size of the frames, in pixels.
+        fps: frames per second of the video.
+        queue_size: number of frames which can wait to be encoded.
+        flip: the frames are flipped vertically before being encoded, for the images read from the GL buffers.
+        convert: the colors of the frames are converted from RGB to BGR before being encoded, False for the frames
+            already in the order of OpenCV, as given by GuiSR.get_playground_image().
+        four_cc: codec of the video.
+        start_method: start method of the process, "forkserver" by default when available, "spawn" otherwise.
+
+    Fields
+        frames_submitted: number of frames given to submit().
+        frames_dropped: number of frames dropped because the queue was full.
+        closed: whether close() was called, the worker may still encode the last frames.
+    """
+
+    def __init__(self,
+                 out_file: str,
+                 width: int,
+                 height: int,
+                 fps: float = 30,
+                 queue_size: int = 8,
+                 flip: bool = False,
+                 convert: bool = True,
+                 four_cc: str = "XVID",
+                 start_method: Optional[str] = None):
+        if queue_size <= 0:
+            raise ValueError("queue_size must be a positive integer.")
+        if start_method is None:
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.out_file = out_file
+        self.shape = (height, width, 3)
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.closed = False
+
+        self._shm = SharedMemory(create=True, size=queue_size * height * width * 3)
+        self._frames = np.ndarray((queue_size,) + self.shape, dtype=np.uint8, buffer=self._shm.buf)
+        # The free slots are tracked here, the worker sends back the slots it encoded
+        self._free_slots = deque(range(queue_size))
+        self._filled = ctx.Queue()
+        self._free = ctx.Queue()
+        self._frames_encoded = ctx.Value("q", 0, lock=False)
+        self._encode_time = ctx.Value("d", 0.0, lock=False)
+
+        args = (out_file, four_cc, fps, width, height, flip, convert, self._shm.name, queue_size, self._filled,
+                self._free, self._frames_encoded, self._encode_time)
+        # daemon=True: if the main process crashes, we should not cause things to hang
+        self._process = ctx.Process(target=_video_encoder_worker, args=args, daemon=True)
+        self._process.start()
+
+    def _collect_free_slots(self):
+        while True:
+            try:
+                self._free_slots.append(self._free.get_nowait())
+            except queue.Empty:
+                return
+
+    def submit(self, frame: np.ndarray) -> bool:
+        """Hand a (height, width, 3) uint8 frame to the encoder, returns False if it was dropped"""
+        if self.closed:
+            raise RuntimeError("The video writer is closed")
+        if frame.shape != self.shape:
+            raise ValueError(f"Invalid frame shape {frame.shape}, expected {self.shape}")
+
+        self.frames_submitted += 1
+        if not self._free_slots:
+            self._collect_free_slots()
+        if not self._free_slots:
+            self.frames_dropped += 1
+            return False
+
+        slot = self._free_slots.popleft()
+        np.copyto(self._frames[slot], frame)
+        self._filled.put(slot)
+        return True
+
+    def close(self, wait: bool = True):
+        """
+        The worker encodes the frames submitted and closes the video. With wait=False, close() returns at once and
+        join() must be called later to release the shared memory.
+        """
+        if not self.closed:
+            self.closed = True
+            self._filled.put(None)
+        if wait:
+            self.join()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the worker to finish the video, returns whether it did"""
+        self._process.join(timeout)
+        if self._process.is_alive():
+            return False
+        if self._shm is not None:
+            del self._frames
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        """The counts of frames and the seconds spent by the worker encoding them"""
+        return {
+            "frames_submitted": self.frames_submitted,
+            "frames_dropped": self.frames_dropped,
+            "frames_encoded": self._frames_encoded.value,
+            "encode_time": self._encode_time.value,
+        }
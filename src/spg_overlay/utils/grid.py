@@ -4,6 +4,7 @@ import cv2
 import numpy as np
 
 from spg_overlay.utils.pose import Pose
+from spg_overlay.utils.utils import bresenham_batch
 
 
 class Grid:
@@ -11,14 +12,34 @@ class Grid:
 
     def __init__(self,
                  size_area_world,
-                 resolution: float):
+                 resolution: float,
+                 dtype=np.float64):
         self.size_area_world = size_area_world
         self.resolution = resolution
+        self.dtype = dtype
 
         self.x_max_grid: int = int(self.size_area_world[0] / self.resolution + 0.5)
         self.y_max_grid: int = int(self.size_area_world[1] / self.resolution + 0.5)
 
-        self.grid = np.zeros((self.x_max_grid, self.y_max_grid))
+        self._allocate()
+
+    def _allocate(self):
+        """Allocate the storage of the cells, the whole grid at once"""
+        self.grid = np.zeros((self.x_max_grid, self.y_max_grid), dtype=self.dtype)
+
+    def _add_to_cells(self, x_px, y_px, val):
+        """
+        Add a value to cells, the same as self.grid[x_px, y_px] += val: a cell given several times gets the value once
+        """
+        self.grid[x_px, y_px] += val
+
+    def _accumulate_cells(self, x_px: np.ndarray, y_px: np.ndarray, vals: np.ndarray):
+        """
+        Add values to cells, in order: a cell given several times gets all its values
+        """
+        # np.add.at is much faster on flat indices
+        cells = np.ravel_multi_index((x_px, y_px), self.grid.shape)
+        np.add.at(self.grid.reshape(-1), cells, vals)
 
     def _conv_world_to_grid(self, x_world, y_world):
         """
@@ -110,7 +131,37 @@ class Grid:
         points = np.array(points).T
 
         # add value to the points
-        self.grid[points[0], points[1]] += val
+        self._add_to_cells(points[0], points[1], val)
+
+    def add_values_along_lines(self, x_0, y_0, x_1, y_1, val):
+        """
+        Add values along many lines at once using a vectorized Bresenham algorithm, input in world coordinates.
+        The grid is the same as after calling add_value_along_line() for each line: the lines with a NaN coordinate
+        or with an end outside of the grid are ignored, and the values of the lines crossing the same cell add up.
+        x_0, y_0 : arrays of the starting points coordinates in m
+        x_1, y_1 : arrays of the end points coordinates in m
+        val : value to add to each cell of the lines, the same for all the lines or an array with one value per line
+        """
+        x_0, y_0, x_1, y_1 = (np.asarray(c, dtype=float).ravel() for c in (x_0, y_0, x_1, y_1))
+        val = np.broadcast_to(np.asarray(val, dtype=float), x_0.shape)
+
+        select = ~(np.isnan(x_0) | np.isnan(y_0) | np.isnan(x_1) | np.isnan(y_1))
+        x_0, y_0, x_1, y_1, val = x_0[select], y_0[select], x_1[select], y_1[select], val[select]
+
+        # convert to pixels
+        x_start, y_start = self._conv_world_to_grid(x_0, y_0)
+        x_end, y_end = self._conv_world_to_grid(x_1, y_1)
+
+        select = np.logical_and.reduce((x_start >= 0, x_start < self.x_max_grid,
+                                        y_start >= 0, y_start < self.y_max_grid,
+                                        x_end >= 0, x_end < self.x_max_grid,
+                                        y_end >= 0, y_end < self.y_max_grid))
+
+        points, line_index = bresenham_batch(np.stack((x_start[select], y_start[select]), axis=1),
+                                             np.stack((x_end[select], y_end[select]), axis=1))
+
+        # add the values to the points, in the order of the lines, the values of the repeated cells add up
+        self._accumulate_cells(points[:, 0], points[:, 1], val[select][line_index])
 
     def add_points(self, points_x, points_y, val):
         """
@@ -123,13 +174,13 @@ class Grid:
 
         if isinstance(points_x, int):
             if 0 <= x_px < self.x_max_grid and 0 <= y_px < self.y_max_grid:
-                self.grid[x_px, y_px] += val
+                self._add_to_cells(x_px, y_px, val)
         elif isinstance(points_x, np.ndarray):
             select = np.logical_and(np.logical_and(x_px >= 0, x_px < self.x_max_grid),
                                     np.logical_and(y_px >= 0, y_px < self.y_max_grid))
             x_px = x_px[select]
             y_px = y_px[select]
-            self.grid[x_px, y_px] += val
+            self._add_to_cells(x_px, y_px, val)
 
     def display(self, grid_to_display: np.ndarray, robot_pose: Pose, title="grid"):
         """
@@ -0,0 +1,118 @@
+from contextlib import nullcontext
+from typing import Dict, List
+
+from spg_overlay.utils.timer import Timer
+
+
+class _Phase:
+    """Context manager of one phase of a StepProfiler, reused for every entry in the phase."""
+
+    __slots__ = ("_profiler", "_name")
+
+    def __init__(self, profiler: "StepProfiler", name: str):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._profiler.start(self._name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler.stop()
+
+
+_NULL_PHASE = nullcontext()
+
+
+class StepProfiler:
+    """
+    The StepProfiler class records the cumulative wall time spent in each phase of the steps of an environment, and
+    counters of the work done (physics ticks, frames captured, semantic rays...). Each phase is a Timer that is kept
+    paused outside of the phase, so its elapsed time is the total time spent in the phase.
+
+    Phases can be nested: entering a phase pauses the enclosing one, so the time of each phase excludes the phases
+    it contains (the sensors are measured inside the physics loop, the rendering inside the capture of the frames).
+
+    When the profiler is disabled, which is the default, start(), stop() and count() return at once and phase()
+    returns a shared no-op context manager: nothing is timed nor allocated.
+
+    Example Usage
+        profiler = StepProfiler(enabled=True)
+
+        profiler.start("physics")
+        for _ in range(20):
+            playground.step(commands)
+            with profiler.phase("rendering"):
+                frame = gui.get_playground_image()
+            profiler.count("frames_captured")
+        profiler.stop()
+
+        print(profiler.report())
+        # {"phases": {"physics": 0.031, "rendering": 0.004}, "counters": {"frames_captured": 20}}
+
+    Fields
+        enabled: whether the phases and the counters are recorded, it can be changed between two phases.
+        _timers: the Timer of each phase, by name.
+        _stack: the names of the phases currently entered, the last one is the running one.
+        _counters: the counters, by name.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._timers: Dict[str, Timer] = {}
+        self._phases: Dict[str, _Phase] = {}
+        self._stack: List[str] = []
+        self._counters: Dict[str, int] = {}
+
+    def _timer(self, name: str) -> Timer:
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = Timer(start_now=True)
+            timer.pause_on()
+            self._timers[name] = timer
+        return timer
+
+    def start(self, name: str):
+        """Enter a phase, the phase currently running is paused until this one is stopped."""
+        if not self.enabled:
+            return
+        if self._stack:
+            self._timers[self._stack[-1]].pause_on()
+        self._stack.append(name)
+        self._timer(name).pause_off()
+
+    def stop(self):
+        """Leave the phase entered last, the enclosing phase runs again."""
+        if not self.enabled or not self._stack:
+            return
+        self._timers[self._stack.pop()].pause_on()
+        if self._stack:
+            self._timers[self._stack[-1]].pause_off()
+
+    def phase(self, name: str):
+        """Context manager entering a phase, the same as start() and stop()."""
+        if not self.enabled:
+            return _NULL_PHASE
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = _Phase(self, name)
+            self._phases[name] = phase
+        return phase
+
+    def count(self, name: str, value: int = 1):
+        """Add a value to a counter."""
+        if not self.enabled:
+            return
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        """Set all the phases and the counters back to zero."""
+        self._timers.clear()
+        self._stack.clear()
+        self._counters.clear()
+
+    def report(self) -> dict:
+        """Returns the seconds spent in each phase and the counters."""
+        return {
+            "phases": {name: timer.get_elapsed_time() for name, timer in self._timers.items()},
+            "counters": dict(self._counters),
+        }
@@ -0,0 +1,115 @@
+import os
+import random
+from typing import Dict, Tuple
+
+import arcade
+from arcade.texture import Texture
+from PIL import Image
+
+"""
+Process wide cache of the textures of the walls and of the wounded persons. The source images are decoded once per
+file and the textures are kept by file and crop, so that building a map again, or building the same map in another
+environment of the process, does not crop, convert nor compute the hit boxes again.
+
+The textures can also be replaced by flat colours, for the headless training where nothing is displayed.
+"""
+
+# Set SWARMRL_FLAT_TEXTURES to 1 to build the walls and the wounded persons with flat colours
+_flat_textures = os.environ.get("SWARMRL_FLAT_TEXTURES", "0") not in ("", "0")
+
+# Flat colour of the walls, dark enough to be seen as a wall by ExploredMap
+FLAT_WALL_COLOR = (80, 80, 80)
+# Flat colour of the wounded persons
+FLAT_WOUNDED_COLOR = (230, 60, 60)
+
+_source_images: Dict[str, Image.Image] = {}
+_textures: Dict[tuple, Texture] = {}
+
+
+def use_flat_textures(enabled: bool = True):
+    """Build the next walls and wounded persons with flat colours instead of the textures of the resources"""
+    global _flat_textures
+    _flat_textures = enabled
+
+
+def flat_textures() -> bool:
+    return _flat_textures
+
+
+def clear_texture_cache():
+    """Forget the source images and the textures, the entities already built keep theirs"""
+    _source_images.clear()
+    _textures.clear()
+
+
+def source_image(file_name: str) -> Image.Image:
+    """The image of a file, decoded and converted to RGBA once per process"""
+    image = _source_images.get(file_name)
+    if image is None:
+        image = Image.open(file_name).convert("RGBA")
+        _source_images[file_name] = image
+    return image
+
+
+def load_cropped_texture(file_name: str,
+                         x: int = 0,
+                         y: int = 0,
+                         width: int = 0,
+                         height: int = 0,
+                         hit_box_algorithm: str = "Simple",
+                         hit_box_detail: float = 4.5) -> Texture:
+    """
+    The same as arcade's load_texture() without the flips, the whole image being used when the crop is empty.
+    Unlike load_texture(), which keeps every crop in its own cache, the crops are only kept here, by file and crop.
+    """
+    key = (file_name, x, y, width, height, hit_box_algorithm, hit_box_detail)
+    texture = _textures.get(key)
+    if texture is None:
+        image = source_image(file_name)
+        if x != 0 or y != 0 or width != 0 or height != 0:
+            image = image.crop((x, y, x + width, y + height))
+        texture = Texture(name=f"{file_name}-{x}-{y}-{width}-{height}-{hit_box_algorithm}",
+                          image=image,
+                          hit_box_algorithm=hit_box_algorithm,
+                          hit_box_detail=hit_box_detail)
+        _textures[key] = texture
+    return texture
+
+
+def crop_origin(file_name: str, width: float, height: float) -> Tuple[int, int]:
+    """
+    Origin of the crop of a wall texture. It only depends on the file and the size of the wall, so that the walls of
+    the same size share their texture, and the global random generator is left untouched.
+    """
+    w_img, h_img = source_image(file_name).size
+    rng = random.Random(f"{file_name}-{width}-{height}")
+    x = rng.randint(0, int(w_img - width - 1))
+    y = rng.randint(0, int(h_img - height - 1))
+    return x, y
+
+
+def flat_rectangle_texture(width: float,
+                           height: float,
+                           color: Tuple[int, int, int],
+                           hit_box_algorithm: str = "Simple",
+                           hit_box_detail: float = 4.5) -> Texture:
+    """A rectangle of one colour, kept by size and colour"""
+    key = ("rectangle", int(width), int(height), tuple(color), hit_box_algorithm, hit_box_detail)
+    texture = _textures.get(key)
+    if texture is None:
+        texture = Texture(name=f"Barrier_{int(width)}_{int(height)}_{tuple(color)}_{hit_box_algorithm}",
+                          image=Image.new("RGBA", (int(width), int(height)), tuple(color)),
+                          hit_box_algorithm=hit_box_algorithm,
+                          hit_box_detail=hit_box_detail)
+        _textures[key] = texture
+    return texture
+
+
+def flat_circle_texture(diameter: int, color: Tuple[int, int, int]) -> Texture:
+    """A disc of one colour, kept by diameter and colour"""
+    key = ("circle", diameter, tuple(color))
+    texture = _textures.get(key)
+    if texture is None:
+        texture = arcade.make_circle_texture(diameter, color)
+        _textures[key] = texture
+    return texture
@@ -0,0 +1,114 @@
+from typing import Dict, Tuple
+
+import numpy as np
+
+from spg_overlay.utils.grid import Grid
+
+
+class TiledGrid(Grid):
+    """
+    The TiledGrid class is a Grid whose cells are stored in square tiles of tile_size x tile_size cells, allocated
+    only when a value is first written in them. The memory used grows with the area where values were written, and
+    not with the size of the map, which is what a grid per drone needs on the large maps.
+
+    It has the same API as Grid: add_points(), add_value_along_line(), add_values_along_lines() and
+    _conv_world_to_grid() give the same cells the same values. The cells never written are 0. There is no grid
+    attribute: to_dense() builds a new dense array, for display() and get_rgb_img().
+
+    Example Usage
+        grid = TiledGrid(size_area_world=(1660, 1122), resolution=2, dtype=np.float32)
+        grid.add_values_along_lines(x_drone, y_drone, x_hits, y_hits, -0.4)
+        grid.add_points(x_hits, y_hits, 2.0)
+        values = grid.get_values(x_px, y_px)
+        grid.display(grid.to_dense(), robot_pose)
+        print(grid.nbytes, grid.dense_nbytes)
+
+    Fields
+        tile_size: number of cells of the side of a tile.
+        tiles: the allocated tiles, by (x, y) index of the tile.
+    """
+
+    def __init__(self,
+                 size_area_world,
+                 resolution: float,
+                 dtype=np.float32,
+                 tile_size: int = 64):
+        self.tile_size = tile_size
+        super().__init__(size_area_world, resolution, dtype=dtype)
+
+    def _allocate(self):
+        self.tiles: Dict[Tuple[int, int], np.ndarray] = {}
+        self._n_tiles_y = -(-self.y_max_grid // self.tile_size)
+
+    def clear(self):
+        """Set all the cells back to 0, the tiles are freed"""
+        self.tiles.clear()
+
+    def _tile(self, key: int) -> np.ndarray:
+        index = divmod(int(key), self._n_tiles_y)
+        tile = self.tiles.get(index)
+        if tile is None:
+            tile = np.zeros((self.tile_size, self.tile_size), dtype=self.dtype)
+            self.tiles[index] = tile
+        return tile
+
+    def _by_tile(self, x_px, y_px, vals):
+        """
+        Splits the cells by tile, keeping their order, and yields the tile, the cells in the tile and their values
+        """
+        x_px = np.atleast_1d(np.asarray(x_px, dtype=np.int64))
+        y_px = np.atleast_1d(np.asarray(y_px, dtype=np.int64))
+        vals = np.broadcast_to(np.asarray(vals, dtype=self.dtype), x_px.shape)
+        if len(x_px) == 0:
+            return
+
+        keys = (x_px // self.tile_size) * self._n_tiles_y + y_px // self.tile_size
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        x_tile, y_tile, vals = x_px[order] % self.tile_size, y_px[order] % self.tile_size, vals[order]
+
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+        for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(keys)]))):
+            yield self._tile(keys[start]), x_tile[start:end], y_tile[start:end], vals[start:end]
+
+    def _add_to_cells(self, x_px, y_px, val):
+        for tile, x_tile, y_tile, vals in self._by_tile(x_px, y_px, val):
+            tile[x_tile, y_tile] += vals
+
+    def _accumulate_cells(self, x_px: np.ndarray, y_px: np.ndarray, vals: np.ndarray):
+        for tile, x_tile, y_tile, tile_vals in self._by_tile(x_px, y_px, vals):
+            np.add.at(tile.reshape(-1), x_tile * self.tile_size + y_tile, tile_vals)
+
+    def get_values(self, x_px, y_px) -> np.ndarray:
+        """Values of cells, given by index in the grid, 0 in the tiles never written"""
+        x_px = np.atleast_1d(np.asarray(x_px, dtype=np.int64))
+        y_px = np.atleast_1d(np.asarray(y_px, dtype=np.int64))
+        values = np.zeros(x_px.shape, dtype=self.dtype)
+        keys = (x_px // self.tile_size) * self._n_tiles_y + y_px // self.tile_size
+        for key in np.unique(keys):
+            tile = self.tiles.get(divmod(int(key), self._n_tiles_y))
+            if tile is not None:
+                select = keys == key
+                values[select] = tile[x_px[select] % self.tile_size, y_px[select] % self.tile_size]
+        return values
+
+    def to_dense(self) -> np.ndarray:
+        """
+        A new dense (x_max_grid, y_max_grid) array of the cells, built from the tiles. It allocates the whole grid:
+        it is meant for display, not for each step
+        """
+        dense = np.zeros((self.x_max_grid, self.y_max_grid), dtype=self.dtype)
+        for (i, j), tile in self.tiles.items():
+            x, y = i * self.tile_size, j * self.tile_size
+            dense[x:x + self.tile_size, y:y + self.tile_size] = tile[:self.x_max_grid - x, :self.y_max_grid - y]
+        return dense
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the allocated tiles"""
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    @property
+    def dense_nbytes(self) -> int:
+        """Memory a dense Grid of the same size and dtype would use"""
+        return self.x_max_grid * self.y_max_grid * np.dtype(self.dtype).itemsize
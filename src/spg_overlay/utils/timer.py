@@ -112,9 +112,9 @@ class Timer:
         if self._state is not StateTimer.running:
             return
 
-        self._state = StateTimer.pause
-
+        # Measured while still running, get_elapsed_time() returns the previous pause value once paused
         self._durationBeforePause = self.get_elapsed_time()
+        self._state = StateTimer.pause
         self._start_time_pause = time.perf_counter()
 
     def pause_off(self):
@@ -170,6 +170,63 @@ def bresenham(start, end):
     return points
 
 
+def bresenham_batch(starts, ends):
+    """
+    Vectorized version of bresenham(): rasterizes many lines at once, without a Python loop over the lines or the
+    points. The points of each line are the same, and in the same order, as the ones given by bresenham().
+
+    The points of the lines are concatenated, line_index gives the line of each point:
+    points, line_index = bresenham_batch([(4, 4), (0, 0)], [(6, 10), (2, 0)])
+    points[line_index == 0] is bresenham((4, 4), (6, 10))
+    points[line_index == 1] is bresenham((0, 0), (2, 0))
+
+    Bresenham's algorithm moves one cell along the major axis at each point, and one cell along the minor axis each
+    time its error, starting at int(dx / 2) and decreased by |dy| at each point, goes below zero. So the offset along
+    the minor axis of the k-th point is the number of times it went below zero, ceil((k * |dy| - int(dx / 2)) / dx).
+
+    Inputs
+        starts (array_like): (n, 2) integer coordinates of the starting points of the lines.
+        ends (array_like): (n, 2) integer coordinates of the ending points of the lines.
+    Returns
+        points (np.array): (m, 2) points of all the lines, line after line.
+        line_index (np.array): (m,) index of the line of each point.
+    """
+    starts = np.asarray(starts, dtype=np.int64).reshape((-1, 2))
+    ends = np.asarray(ends, dtype=np.int64).reshape((-1, 2))
+    x1, y1 = starts[:, 0], starts[:, 1]
+    x2, y2 = ends[:, 0], ends[:, 1]
+
+    # along the major axis (a) and the minor axis (b), from the lower to the higher major coordinate
+    is_steep = np.abs(y2 - y1) > np.abs(x2 - x1)
+    a1, b1 = np.where(is_steep, y1, x1), np.where(is_steep, x1, y1)
+    a2, b2 = np.where(is_steep, y2, x2), np.where(is_steep, x2, y2)
+    swapped = a1 > a2
+    a_low, b_low = np.where(swapped, a2, a1), np.where(swapped, b2, b1)
+    a_high, b_high = np.where(swapped, a1, a2), np.where(swapped, b1, b2)
+    dx = a_high - a_low
+    abs_dy = np.abs(b_high - b_low)
+    error = dx // 2
+    b_step = np.where(b_low < b_high, 1, -1)
+
+    # rank of each point on its line, the per line values are repeated for each point of the line
+    nb_points = dx + 1
+    line_index = np.repeat(np.arange(len(nb_points)), nb_points)
+    first_point = np.cumsum(nb_points) - nb_points
+    k = np.arange(len(line_index)) - np.repeat(first_point, nb_points)
+    # bresenham() reverses the points of the swapped lines
+    if np.any(swapped):
+        k = np.repeat(np.where(swapped, dx, 0), nb_points) + np.repeat(np.where(swapped, -1, 1), nb_points) * k
+
+    a = np.repeat(a_low, nb_points) + k
+    b = np.repeat(b_low, nb_points) - np.repeat(b_step, nb_points) * (
+        (np.repeat(error, nb_points) - k * np.repeat(abs_dy, nb_points)) // np.repeat(np.maximum(dx, 1), nb_points)
+    )
+
+    steep = np.repeat(is_steep, nb_points)
+    points = np.stack((np.where(steep, b, a), np.where(steep, a, b)), axis=1)
+    return points, line_index
+
+
 def circular_kernel(radius):
     """
     The function cv2.getStructuringElement(cv2.MORPH_ELLIPSE, ...) of OpenCV is not satisfying because
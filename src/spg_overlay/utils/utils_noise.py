@@ -1,7 +1,97 @@
+import json
 import math
-from typing import Union, Type
+from typing import Dict, Optional, Union, Type
 import numpy as np
 
+# Number of values drawn at once by a NoiseStream
+NOISE_BLOCK_SIZE = 1 << 16
+
+
+class NoiseStream:
+    """
+    The NoiseStream class serves the noise of the sensors from blocks of standard normal values drawn at once from its
+    own np.random.Generator, instead of one call of the global random generator per sensor and per physics tick.
+
+    Each ClosedPlayground has its own stream, which the sensors find with noise_stream(). Seeded with the seed given
+    to the reset of an environment, the noise of the environment is reproducible, and the environments seeded
+    differently, as the workers of a vectorized environment, get independent streams.
+
+    Example Usage
+        stream = NoiseStream(seed=42)
+        lidar_noise = stream.normal(0, 2.5, size=181)
+        compass_noise = stream.normal(0, 0.07)
+        stream.seed(43)
+
+    Fields
+        block_size: number of values drawn at once.
+        _block: the values drawn, served in order.
+        _index: index of the next value of the block to serve.
+        _block_state: state of the generator before the block was drawn, get_state() saves it instead of the block.
+    """
+
+    def __init__(self, seed: Optional[int] = None, block_size: int = NOISE_BLOCK_SIZE):
+        self.block_size = block_size
+        self.seed(seed)
+
+    def seed(self, seed: Optional[int] = None):
+        """Start the stream again from a seed, from fresh entropy when the seed is None"""
+        self._rng = np.random.default_rng(seed)
+        self._draw_block(self.block_size)
+
+    def _draw_block(self, size: int):
+        self._block_state = self._rng.bit_generator.state
+        self._block = self._rng.standard_normal(size)
+        self._index = 0
+
+    def standard_normal(self, size: int) -> np.ndarray:
+        """
+        size values of the standard normal distribution. It is a view on the block, valid until the next call.
+        """
+        index = self._index
+        if index + size > len(self._block):
+            self._draw_block(max(size, self.block_size))
+            index = 0
+        self._index = index + size
+        return self._block[index:index + size]
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """The position in the stream, a few bytes: the block is drawn again by set_state()"""
+        return {
+            "block_state": np.frombuffer(json.dumps(self._block_state).encode(), dtype=np.uint8),
+            "block_length": np.array(len(self._block)),
+            "index": np.array(self._index),
+        }
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        """Go back to a position of the stream given by get_state()"""
+        self._rng.bit_generator.state = json.loads(state["block_state"].tobytes().decode())
+        self._draw_block(int(state["block_length"]))
+        self._index = int(state["index"])
+
+    def normal(self, loc: float = 0.0, scale: float = 1.0, size=None) -> Union[np.ndarray, float]:
+        """The same as np.random.normal(), a float when size is None"""
+        if size is None:
+            return loc + scale * float(self.standard_normal(1)[0])
+        if isinstance(size, tuple):
+            if len(size) == 1:
+                size = size[0]
+            else:
+                return loc + scale * self.standard_normal(int(np.prod(size))).reshape(size)
+        values = self.standard_normal(size) * scale
+        if loc != 0:
+            values += loc
+        return values
+
+
+# Stream of the sensors which are not in a ClosedPlayground
+DEFAULT_NOISE_STREAM = NoiseStream()
+
+
+def noise_stream(entity) -> NoiseStream:
+    """The noise stream of the playground of an entity (a sensor), DEFAULT_NOISE_STREAM if it has none"""
+    stream = getattr(entity.playground, "noise_stream", None)
+    return stream if stream is not None else DEFAULT_NOISE_STREAM
+
 
 def vector_gaussian_noise(size: int, mean_noise: float = 0,
                           std_dev_noise: float = 1.0) -> np.ndarray:
@@ -64,9 +154,11 @@ class GaussianNoise:
 
         self._shape: Union[tuple, Type[None]] = None
 
-    def add_noise(self, values: Union[np.ndarray, float]):
+    def add_noise(self, values: Union[np.ndarray, float], stream: Optional[NoiseStream] = None):
         if values is None:
             return None
+        if stream is None:
+            stream = DEFAULT_NOISE_STREAM
 
         values2 = values
         gaussian_noise: Union[np.ndarray, float, Type[None]] = None
@@ -79,12 +171,12 @@ class GaussianNoise:
                 self._shape = values2.shape
             assert (self._shape == values2.shape)
 
-            gaussian_noise = np.random.normal(loc=self._mean_noise,
-                                              scale=self._std_dev_noise,
-                                              size=values2.shape)
+            gaussian_noise = stream.normal(loc=self._mean_noise,
+                                           scale=self._std_dev_noise,
+                                           size=values2.shape)
         elif isinstance(values, float):
-            gaussian_noise = np.random.normal(loc=self._mean_noise,
-                                              scale=self._std_dev_noise)
+            gaussian_noise = stream.normal(loc=self._mean_noise,
+                                           scale=self._std_dev_noise)
         return values2 + gaussian_noise
 
 
@@ -111,9 +203,11 @@ class AutoregressiveModelNoise:
         self._last_noise: Union[np.ndarray, float, Type[None]] = None
         self._shape: Union[tuple, Type[None]] = None
 
-    def add_noise(self, values: Union[np.ndarray, float, Type[None]]):
+    def add_noise(self, values: Union[np.ndarray, float, Type[None]], stream: Optional[NoiseStream] = None):
         if values is None:
             return None
+        if stream is None:
+            stream = DEFAULT_NOISE_STREAM
 
         values2 = values
         white_noise: Union[np.ndarray, float, Type[None]] = None
@@ -122,8 +216,8 @@ class AutoregressiveModelNoise:
             #     # change shape from (n,) to (n, 1), ie a column vector
             #     values2 = values[:, np.newaxis]
 
-            white_noise = np.random.normal(0, self._std_dev_wn,
-                                           size=values2.shape)
+            white_noise = stream.normal(0, self._std_dev_wn,
+                                        size=values2.shape)
 
             if self._last_noise is None:
                 self._last_noise = np.zeros(values2.shape)
@@ -133,7 +227,7 @@ class AutoregressiveModelNoise:
             assert white_noise.all()
 
         elif isinstance(values, float):
-            white_noise = np.random.normal(0, self._std_dev_wn)
+            white_noise = stream.normal(0, self._std_dev_wn)
             if self._last_noise is None:
                 self._last_noise = 0
 
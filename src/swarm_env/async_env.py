@@ -0,0 +1,179 @@
+import asyncio
+import multiprocessing as mp
+import traceback
+from typing import Any, Callable, Optional
+
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+
+"""
+Asyncio front end running one swarm environment in a worker process
+"""
+
+
+def _async_worker(remote, parent_remote, env_fn_wrapper: CloudpickleWrapper) -> None:
+    parent_remote.close()
+    env = None
+    try:
+        env = env_fn_wrapper.var()
+        while True:
+            request_id, cmd, data = remote.recv()
+            if cmd == "close":
+                break
+            try:
+                if cmd == "step":
+                    result = env.step(data)
+                elif cmd == "reset":
+                    seed, options = data
+                    result = env.reset(seed=seed, options=options)
+                elif cmd == "get_attr":
+                    result = getattr(env, data)
+                elif cmd == "env_method":
+                    result = getattr(env, data[0])(*data[1], **data[2])
+                else:
+                    raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+            except Exception:
+                remote.send((request_id, False, traceback.format_exc()))
+            else:
+                remote.send((request_id, True, result))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        if env is not None:
+            env.close()
+        remote.close()
+
+
+class AsyncSwarmEnv:
+    """
+    The AsyncSwarmEnv class runs one environment (MultiSwarmEnv, SwarmEnv, MASwarmTarget...) in a worker process, and
+    exposes its reset() and step() as coroutines, so that one event loop can keep many environments busy at the same
+    time: while an environment steps in its process, the loop awaits the others. async_reset() and async_step() return
+    exactly what reset() and step() of the environment return.
+
+    Each request is numbered. When the coroutine awaiting a request is cancelled, the worker still finishes it, and its
+    result is dropped when it arrives, so the environment can be used again at once. When a request takes more than
+    its timeout, asyncio.TimeoutError is raised and the worker is killed and started again with a new environment,
+    which must be reset before it is stepped. The requests to one environment are served one at a time.
+
+    Example Usage
+        envs = [AsyncSwarmEnv(partial(MultiSwarmEnv, map_name="Easy", n_agents=2, headless=True))
+                for _ in range(100)]
+
+        async def run(env):
+            observation = await env.async_reset(seed=0)
+            for _ in range(100):
+                observation, rewards, dones, infos = await env.async_step(policy(observation), timeout=10)
+                if any(dones):
+                    observation = await env.async_reset()
+
+        await asyncio.gather(*(run(env) for env in envs))
+        for env in envs:
+            env.close()
+
+    Inputs
+        env_fn: function creating the environment, it is called in the worker.
+        start_method: start method of the process, "forkserver" by default when available, "spawn" otherwise.
+    """
+
+    def __init__(self, env_fn: Callable[[], Any], start_method: Optional[str] = None):
+        if start_method is None:
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        self._ctx = mp.get_context(start_method)
+        self._env_fn = env_fn
+        self._request_id = 0
+        self._lock: Optional[asyncio.Lock] = None
+        self.closed = False
+        self._start()
+
+    def _start(self):
+        self._remote, work_remote = self._ctx.Pipe()
+        args = (work_remote, self._remote, CloudpickleWrapper(self._env_fn))
+        # daemon=True: if the main process crashes, we should not cause things to hang
+        self._process = self._ctx.Process(target=_async_worker, args=args, daemon=True)
+        self._process.start()
+        work_remote.close()
+
+    def _kill(self):
+        self._process.terminate()
+        self._process.join()
+        self._remote.close()
+
+    async def _readable(self):
+        """Wait until a result can be read from the worker, without blocking the event loop"""
+        if self._remote.poll():
+            return
+        loop = asyncio.get_running_loop()
+        fd = self._remote.fileno()
+        readable = loop.create_future()
+        try:
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        except NotImplementedError:
+            # Event loops without add_reader (the proactor of Windows) wait in a thread
+            await loop.run_in_executor(None, self._remote.poll, None)
+            return
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+
+    async def _receive(self, request_id: int):
+        while True:
+            await self._readable()
+            try:
+                response_id, ok, result = self._remote.recv()
+            except (EOFError, OSError):
+                raise RuntimeError("The worker of the environment exited") from None
+            # The results of the requests whose coroutine was cancelled are dropped
+            if response_id == request_id:
+                break
+        if not ok:
+            raise RuntimeError(f"The environment raised an exception in its worker:\n{result}")
+        return result
+
+    async def _request(self, cmd: str, data, timeout: Optional[float]):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.closed:
+                raise RuntimeError("The environment is closed")
+            self._request_id += 1
+            request_id = self._request_id
+            self._remote.send((request_id, cmd, data))
+            try:
+                return await asyncio.wait_for(self._receive(request_id), timeout)
+            except asyncio.TimeoutError:
+                # The worker may be stuck, it is replaced by a new one
+                self._kill()
+                self._start()
+                raise
+
+    async def async_reset(self, seed: Optional[int] = None, options: Optional[dict] = None,
+                          timeout: Optional[float] = None):
+        """The same as env.reset(seed, options), awaited"""
+        return await self._request("reset", (seed, options), timeout)
+
+    async def async_step(self, actions, timeout: Optional[float] = None):
+        """The same as env.step(actions), awaited"""
+        return await self._request("step", actions, timeout)
+
+    async def async_get_attr(self, name: str, timeout: Optional[float] = None):
+        return await self._request("get_attr", name, timeout)
+
+    async def async_env_method(self, name: str, *args, timeout: Optional[float] = None, **kwargs):
+        return await self._request("env_method", (name, args, kwargs), timeout)
+
+    def close(self):
+        """Stop the worker, it is killed if it does not stop within a few seconds"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._remote.send((0, "close", None))
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._remote.close()
@@ -1,7 +1,11 @@
 import arcade
+import gc
+import os
 import time
+from collections import deque
 from typing import Optional, Tuple, List, Dict, Union, Type
 import cv2
+import pyglet
 
 from spg.agent.controller.controller import Command, Controller
 from spg.playground import Playground
@@ -15,9 +19,144 @@ from spg_overlay.utils.fps_display import FpsDisplay
 from spg_overlay.gui_map.map_abstract import MapAbstract
 from spg_overlay.utils.mouse_measure import MouseMeasure
 from spg_overlay.reporting.screen_recorder import ScreenRecorder
+from spg_overlay.reporting.video_encoder import BackgroundVideoWriter
 from spg_overlay.utils.visu_noises import VisuNoises
 
 
+def activate_playground_context(playground: Playground):
+    """
+    Make the GL context of the playground current. The ray sensors of spg are computed on the hidden window owned by
+    the playground, so its context must be the active one before stepping when several environments share a process.
+    The switch is skipped when the context is already current, which is the usual case with a single environment.
+    """
+    window = playground.window
+    if pyglet.gl.current_context is not window.context:
+        window.switch_to()
+
+
+def close_playground_window(playground: Optional[Playground]):
+    """
+    Close the hidden window owned by the playground. arcade.close_window() closes the last window created in the
+    process, which belongs to another environment as soon as several of them are alive.
+    """
+    if playground is None:
+        return
+
+    window = playground.window
+    try:
+        if arcade.get_window() is window:
+            arcade.set_window(None)
+    except RuntimeError:
+        pass
+    window.close()
+    # Same as arcade.close_window(): collect now, pyglet crashes if many closed windows pile up
+    gc.collect()
+
+
+def collect_playground_gl_objects(playground: Playground):
+    """
+    Delete the GL objects released by the playground since the last call. arcade only deletes the buffers dropped by
+    the ray sensors (a new one every physics tick) when the window flips, which the hidden window of the playground
+    never does, so they pile up over the steps and the episodes unless they are collected here.
+    The context of the playground must be the active one.
+    """
+    playground.window.ctx.gc()
+
+
+class FrameBuffer:
+    """
+    The FrameBuffer class keeps the frames captured by an environment during an episode. Capture is opt-in: when it is
+    disabled, should_capture() is always False and the step loop does no rendering work at all. When it is enabled,
+    one frame is kept every `stride` physics ticks, in a ring buffer that only holds the last `max_frames` frames.
+
+    When video_dir is given, the frames are not kept: the frames of each episode are encoded into
+    video_dir/episode_00000.avi, episode_00001.avi... by a BackgroundVideoWriter, and clear() closes the video of the
+    episode without waiting for the encoder. get_frames() is then empty.
+
+    Example Usage
+        frame_buffer = FrameBuffer(enabled=True, stride=5, max_frames=200)
+        if frame_buffer.should_capture(tick):
+            frame_buffer.append(gui.get_playground_image())
+        frames = frame_buffer.get_frames()
+
+        frame_buffer = FrameBuffer(enabled=True, stride=5, video_dir="videos")
+        ...
+        frame_buffer.close()
+        print(frame_buffer.video_stats())
+    """
+
+    def __init__(self, enabled: bool = False, stride: int = 5, max_frames: Optional[int] = 500,
+                 video_dir: Optional[str] = None, fps: float = 30):
+        if stride <= 0:
+            raise ValueError("stride must be a positive integer.")
+
+        self.enabled = enabled
+        self.stride = stride
+        self._frames = deque(maxlen=max_frames)
+
+        self.video_dir = video_dir
+        self.fps = fps
+        self._writer: Optional[BackgroundVideoWriter] = None
+        # The writers of the previous episodes still encoding, and the stats of the videos finished
+        self._closing: List[BackgroundVideoWriter] = []
+        self._video_count = 0
+        self._finished_stats: Dict[str, float] = {}
+        if video_dir is not None:
+            os.makedirs(video_dir, exist_ok=True)
+
+    def should_capture(self, tick: int) -> bool:
+        return self.enabled and tick % self.stride == 0
+
+    def append(self, frame):
+        if self.video_dir is None:
+            self._frames.append(frame)
+            return
+        if self._writer is None:
+            out_file = os.path.join(self.video_dir, f"episode_{self._video_count:05d}.avi")
+            # The frames of get_playground_image() are already flipped and in the order of OpenCV
+            self._writer = BackgroundVideoWriter(out_file, frame.shape[1], frame.shape[0], self.fps, convert=False)
+            self._video_count += 1
+        self._writer.submit(frame)
+
+    def clear(self):
+        self._frames.clear()
+        if self._writer is not None:
+            self._writer.close(wait=False)
+            self._closing.append(self._writer)
+            self._writer = None
+        self._join_videos(timeout=0)
+
+    def _join_videos(self, timeout: Optional[float]):
+        closing = []
+        for writer in self._closing:
+            if writer.join(timeout):
+                for name, value in writer.stats().items():
+                    self._finished_stats[name] = self._finished_stats.get(name, 0) + value
+            else:
+                closing.append(writer)
+        self._closing = closing
+
+    def close(self):
+        """Wait for the videos to be encoded"""
+        self.clear()
+        self._join_videos(timeout=None)
+
+    def video_stats(self) -> Dict[str, float]:
+        """The counts of frames and the encoding time of all the videos, see BackgroundVideoWriter.stats()"""
+        total = dict(self._finished_stats, videos=self._video_count)
+        writers = self._closing + ([self._writer] if self._writer is not None else [])
+        for writer in writers:
+            for name, value in writer.stats().items():
+                total[name] = total.get(name, 0) + value
+        return total
+
+    def get_frames(self) -> list:
+        return list(self._frames)
+
+    def __len__(self):
+        return len(self._frames)
+
+
 class GuiSR(TopDownView):
     """
     The GuiSR class is a subclass of TopDownView and provides a graphical user interface for the simulation. It handles
@@ -65,8 +204,7 @@ class GuiSR(TopDownView):
         self._playground.window.run()
 
     def update_explore_map(self):
-        self._the_map.explored_map.update_drones(self._drones)
-        self._the_map.explored_map._process_positions()
+        self._the_map.explored_map.update(self._drones)
 
     def on_update(self):
         pass
@@ -12,6 +12,7 @@ import numpy as np
 
 
 from spg_overlay.entities.drone_abstract import DroneAbstract
+from spg_overlay.entities.drone_distance_sensors import DroneSemanticSensor
 from spg_overlay.utils.misc_data import MiscData
 
 # from spg_overlay.utils.utils import normalize_angle
@@ -28,6 +29,8 @@ from spg_overlay.utils.constants import (
 )
 from ..constants import *
 
+TypeEntity = DroneSemanticSensor.TypeEntity
+
 
 class Color:
     BLACK = "\033[30m"
@@ -93,6 +96,8 @@ class MultiAgentDrone(DroneAbstract):
         self.show_log_warning = False
         self.show_log_error = False
         self.semantic_data = None
+        # (detections of the semantic sensor, items computed from them), computed once per physics tick
+        self._semantic_items = (None, None)
 
         self.log_info("Drone is initialized")
 
@@ -124,10 +129,10 @@ class MultiAgentDrone(DroneAbstract):
         if len(semantic) == 0:
             return dist < 30
 
-        idx = np.argmin([x.distance for x in semantic])
+        idx = np.argmin(semantic.distance)
         # dist = semantic[idx].distance
 
-        if dist < 30 and str(semantic[idx].entity_type) != "TypeEntity.WOUNDED_PERSON":
+        if dist < 30 and semantic.entity_type[idx] != TypeEntity.WOUNDED_PERSON:
             collided = True
         return collided
 
@@ -137,11 +142,8 @@ class MultiAgentDrone(DroneAbstract):
         if semantic is None:
             return False
 
-        for x in semantic:
-            if x.distance < 30 and str(x.entity_type) == "TypeEntity.WOUNDED_PERSON":
-                return True
-
-        return False
+        touched = (semantic.distance < 30) & (semantic.entity_type == TypeEntity.WOUNDED_PERSON)
+        return bool(np.any(touched))
 
     def get_distance(self, pos_a, pos_b):
         return np.sqrt((pos_a[0] - pos_b[0]) ** 2 + (pos_a[1] - pos_b[1]) ** 2)
@@ -155,31 +157,33 @@ class MultiAgentDrone(DroneAbstract):
         return None
 
     def process_special_semantic(self):
-        semantic = self.semantic().special_semantic()
-        data = {}
-        for k, v, _ in semantic:
-            if k in data or str(v.entity_type) == "TypeEntity.WALL":
-                continue
-            data[k] = v
-
-        center = []
-        human = []
-        drone = []
-        for i, d in data.items():
-            item = np.zeros((3,), dtype=np.float32)
-            item[0] = d.distance / LIDAR_MAX_RANGE
-            item[1] = d.angle
-            item[2] = d.grasped
-            if str(d.entity_type) == "TypeEntity.RESCUE_CENTER":
-                center.append(item)
-            elif str(d.entity_type) == "TypeEntity.WOUNDED_PERSON":
-                human.append(item)
-            elif str(d.entity_type) == "TypeEntity.DRONE":
-                drone.append(item)
+        """
+        One semantic item (distance / LIDAR_MAX_RANGE, angle, grasped) per entity detected, from the first ray that
+        detected it. Returns the rescue center (zeros if not detected), and the humans and the drones sorted by
+        distance, as float32 arrays of shape (n, 3).
+        The result is cached until the next physics tick and must not be modified.
+        """
+        detections = self.semantic().special_semantic()
+        if self._semantic_items[0] is detections:
+            return self._semantic_items[1]
+
+        _, first = np.unique(detections.uid, return_index=True)
+        semantic = detections[np.sort(first)]
+
+        items = np.empty((len(semantic), 3), dtype=np.float32)
+        items[:, 0] = semantic.distance / LIDAR_MAX_RANGE
+        items[:, 1] = semantic.angle
+        items[:, 2] = semantic.grasped
+
+        center = items[semantic.entity_type == TypeEntity.RESCUE_CENTER][:1]
         if len(center) == 0:
-            center = [np.zeros((3,))]
-        human = sorted(human, key=lambda i: i[0])
-        drone = sorted(drone, key=lambda i: i[0])
+            center = np.zeros((1, 3), dtype=np.float32)
+        human = items[semantic.entity_type == TypeEntity.WOUNDED_PERSON]
+        human = human[np.argsort(human[:, 0], kind="stable")]
+        drone = items[semantic.entity_type == TypeEntity.DRONE]
+        drone = drone[np.argsort(drone[:, 0], kind="stable")]
+
+        self._semantic_items = (detections, (center, human, drone))
         return center, human, drone
 
     def log_info(self, log=""):
@@ -5,8 +5,21 @@ import pygame
 import gymnasium as gym
 from gymnasium import spaces
 import cv2
-from swarm_env.env_renderer import GuiSR
+from spg_overlay.utils.step_profiler import StepProfiler
+from swarm_env.env_renderer import (
+    FrameBuffer,
+    GuiSR,
+    activate_playground_context,
+    close_playground_window,
+    collect_playground_gl_objects,
+)
 from swarm_env.multi_env.ma_drone import MultiAgentDrone
+from swarm_env.observation import ObservationBuilder
+from swarm_env.occupancy_mapping import OccupancyGridMapper
+from swarm_env.reward import RewardEngine
+from swarm_env.snapshot import restore_simulation, snapshot_simulation
+from swarm_env.trajectory import TrajectoryRecorder
+from spg_overlay.gui_map.spawn_sampler import ScenarioBank
 import gc
 from custom_maps.intermediate01 import MyMapIntermediate01
 from custom_maps.easy import EasyMap
@@ -14,7 +27,6 @@ from typing import Any, Dict, Generic, Iterable, Iterator, TypeVar
 from pettingzoo import ParallelEnv
 from gymnasium.utils import EzPickle, seeding
 from swarm_env.constants import *
-import arcade
 
 """
 Environment for multi agent
@@ -62,6 +74,16 @@ class MASwarmTarget(gym.Env):
         share_reward=True,
         use_exp_map=False,
         use_conflict_reward=False,
+        headless=False,
+        capture_frames=False,
+        frame_stride=5,
+        max_frames=500,
+        video_dir=None,
+        profile=False,
+        occupancy_map=None,
+        record_dir=None,
+        record_stride=1,
+        scenario_bank=None,
     ):
         EzPickle.__init__(
             self,
@@ -72,9 +94,19 @@ class MASwarmTarget(gym.Env):
             max_episode_steps=max_episode_steps,
             continuous_action=continuous_action,
             fixed_step=fixed_step,
+            headless=headless,
+            capture_frames=capture_frames,
+            frame_stride=frame_stride,
+            max_frames=max_frames,
+            video_dir=video_dir,
             share_reward=share_reward,
             use_exp_map=use_exp_map,
             use_conflict_reward=use_conflict_reward,
+            profile=profile,
+            occupancy_map=occupancy_map,
+            record_dir=record_dir,
+            record_stride=record_stride,
+            scenario_bank=scenario_bank,
         )
 
         if map_name in map_dict:
@@ -97,20 +129,50 @@ class MASwarmTarget(gym.Env):
         self.persons = None
         self.use_exp_map = use_exp_map
         self.use_conflict_reward = use_conflict_reward
-        self.frames = []
+        self.headless = headless
+        self._frame_buffer = FrameBuffer(
+            enabled=capture_frames,
+            stride=frame_stride,
+            max_frames=max_frames,
+            video_dir=video_dir,
+        )
+        self.profiler = StepProfiler(enabled=profile)
+        self._recorder = (
+            None
+            if record_dir is None
+            else TrajectoryRecorder(record_dir, stride=record_stride)
+        )
+        self._scenario_bank = (
+            ScenarioBank.load(scenario_bank)
+            if isinstance(scenario_bank, str)
+            else scenario_bank
+        )
+        self._rewards = RewardEngine(
+            n_agents=self.n_agents,
+            rescue_reward=50,
+            truncation_penalty=20,
+            use_conflict_reward=self.use_conflict_reward,
+            shared_floor=-10 * self.n_agents,
+        )
 
         ### OBSERVATION
 
         """
         Lidar: 180 + semantic: (1 + 3 + 2) * 3 + pose: 3 + velocity: 2 = 203
         """
-        single_observation_dim = (
-            180
-            + (self.n_targets + self.n_agents) * 3
-            + 5
-            + (self.n_agents * self.n_targets)
-            + 1  # encoding for the message from other drones
+        self._obs_builder = ObservationBuilder(
+            n_agents=self.n_agents,
+            n_humans=self.n_targets,
+            n_drones=self.n_agents - 1,
+            use_grasper=True,
+            message_dim=self.n_targets,  # encoding for the message from other drones
+            occupancy_mapper=(
+                None
+                if occupancy_map is None
+                else OccupancyGridMapper(self.n_agents, mode=occupancy_map)
+            ),
         )
+        single_observation_dim = self._obs_builder.obs_dim
         self.observation_space = [
             spaces.Box(low=-np.inf, high=np.inf, shape=(single_observation_dim,))
             for _ in range(self.n_agents)
@@ -154,12 +216,9 @@ class MASwarmTarget(gym.Env):
         return obs_array
 
     def state(self) -> ndarray:
-        observations = self._get_obs()
-        state_array = []
-        for agent_id in self.agents:
-            obs_array = self.flatten_obs(observations[agent_id])
-            state_array.append(obs_array)
-        return np.array(state_array)
+        # Observations of the last reset or step, without computing them again.
+        # This is the buffer itself, overwritten at the next step
+        return self._obs_builder.buffer
 
     def construct_action(self, action):
         com_target = np.zeros(MAX_NUM_PERSONS)
@@ -172,56 +231,53 @@ class MASwarmTarget(gym.Env):
             "grasper": 1 if action[3] > 0.5 else 0,
         }, com_target
 
-    def get_all_frames(self):
-        return self.frames
-
-    def observe(self, agent_id):
-        agent = self._agents[agent_id]
-        observation = {}
-        observation["lidar"] = (
-            agent.lidar_values()[:-1].astype(np.float32) / LIDAR_MAX_RANGE
+    def snapshot(self):
+        """
+        Snapshot of the simulation in the middle of an episode, a binary buffer to give to restore(). Restoring it is
+        much faster than a reset followed by the replay of the actions, see swarm_env.snapshot.
+        """
+        return snapshot_simulation(
+            self._playground,
+            self._map,
+            self._obs_builder,
+            current_step=self.current_step,
+            current_rescue_count=self.current_rescue_count,
+            last_exp_score=self.last_exp_score,
         )
-        observation["velocity"] = agent.measured_velocity().astype(np.float32)
-        normalized_position = (
-            agent.true_position()[0] / self.map_size[0],
-            agent.true_position()[1] / self.map_size[1],
+
+    def restore(self, snapshot):
+        """Go back to the simulation of a snapshot(), returns the observations of the snapshot"""
+        activate_playground_context(self._playground)
+        counters = restore_simulation(
+            self._playground, self._map, snapshot, self._obs_builder
         )
-        observation["pose"] = np.concatenate(
-            (normalized_position, [agent.true_angle()]), axis=0
-        ).astype(np.float32)
-        semantic = np.zeros((1 + self.n_targets + (self.n_agents - 1), 3)).astype(
-            np.float32
+        self.current_step = counters["current_step"]
+        self.current_rescue_count = counters["current_rescue_count"]
+        self.last_exp_score = counters["last_exp_score"]
+        self._rewards.reset(
+            self._agents, self._map._wounded_persons, self._map._rescue_center_pos[0]
         )
-        center, human, drone = agent.process_special_semantic()
+        collect_playground_gl_objects(self._playground)
+        return self._obs_builder.buffer.copy()
 
-        semantic[0] = center[0]
-        for i in range(min(len(human), self.n_targets)):
-            semantic[1 + i] = human[i]
-
-        for i in range(min(len(drone), self.n_agents - 1)):
-            semantic[1 + self.n_targets + i] = drone[i]
+    def get_all_frames(self):
+        return self._frame_buffer.get_frames()
 
-        observation["semantic"] = semantic
+    def get_video_stats(self):
+        return self._frame_buffer.video_stats()
 
-        observation["grasper"] = (
-            np.array([1])
-            if len(self._agents[agent_id].grasped_entities()) > 0
-            else np.array([0])
-        )
+    def get_trajectory_dir(self):
+        return None if self._recorder is None else self._recorder.episode_dir
 
-        observation["message"] = np.zeros((self.n_agents, self.n_targets))
-        for i, agent in enumerate(self._agents):
-            if str(i) == agent_id:
-                continue
-            observation["message"][i] = agent.state["message"]
+    def get_profile(self):
+        return self.profiler.report()
 
-        return self.flatten_obs(observation)
+    def observe(self, agent_id):
+        return self._obs_builder.buffer[agent_id].copy()
 
     def _get_obs(self):
-        observations = []
-        for name in self.agents:
-            observations.append(self.observe(agent_id=name))
-        return observations
+        # The buffer is overwritten at the next step, the caller gets its own copy
+        return self._obs_builder.build(self._agents, self.map_size).copy()
 
     def seed(self, seed=None):
         if seed is None:
@@ -255,28 +311,49 @@ class MASwarmTarget(gym.Env):
         )
         self.map_size = self._map._size_area
         self._playground = self._map.construct_playground(drone_type=MultiAgentDrone)
+        self._map.set_scenario_bank(self._scenario_bank)
+        self._playground.profiler = self.profiler
         self._agents = self._map.drones
-        self.gui = GuiSR(self._playground, self._map)
+        self.gui = None if self.headless else GuiSR(self._playground, self._map)
 
     def reset(self, seed=None, options=None):
-        # Reinit GUI
-        if (
-            self.ep_count == 0
-        ):  # change to self.ep_count % 1 == 0 to avoid mem leak, but hurt performance
+        # The playground is only built for the first episode, it is reset in place afterwards
+        if self.ep_count == 0:
+            close_playground_window(self._playground)
             del self._map
             del self._agents
             del self._playground
             del self.gui
-            arcade.close_window()
             self.re_init()
         self.ep_count += 1
-        self._playground.window.switch_to()
+        if seed is not None:
+            # The noise of the sensors and the placements are reproducible from the seed of the episode
+            self._playground.noise_stream.seed(seed)
+            self._map.seed_spawns(seed)
+        activate_playground_context(self._playground)
         self.reset_map()
         self._playground.reset()
+        collect_playground_gl_objects(self._playground)
+        self._frame_buffer.clear()
         for agent in self._agents:
             agent.state["message"] = np.zeros((self.n_targets,))
         self.current_step = 0
         self.current_rescue_count = 0
+        self._rewards.reset(
+            self._agents, self._map._wounded_persons, self._map._rescue_center_pos[0]
+        )
+        if self._recorder is not None:
+            self._recorder.start_episode(
+                self.map_name,
+                self.map_size,
+                self._map.explored_map.map_playground,
+                self._agents,
+                self._map._wounded_persons,
+                self._map._rescue_center_pos[0],
+                self._map._rescue_center.texture.size,
+                action_dim=self.action_space[0].shape[0],
+            )
+        self._obs_builder.reset(self.map_size)
         observation = self._get_obs()
         # info = self._get_info()
         return observation
@@ -289,35 +366,16 @@ class MASwarmTarget(gym.Env):
     def get_map(self):
         return self._map
 
-    def reward(self, agent, action):
-        rew = -np.abs(action[2])
-        conflict = 0
-        if agent.is_collided():
-            rew -= 1
-        if agent.touch_human():
-            rew += 1
-        for human in self._map._wounded_persons:
-            magnets = set(human.grasped_by)
-            if len(magnets) > 1 and agent.base.grasper in magnets:
-                if self.use_conflict_reward:
-                    rew -= 1
-                conflict += 1
-                # print("Conflict!!")
-        return rew, conflict
-
     def step(self, actions):
-        self._playground.window.switch_to()
-        frame_skip = 5
+        activate_playground_context(self._playground)
+        frame_skip = self._frame_buffer.stride
         counter = 0
         done = False
         steps = self.fixed_step
-        prev_distances = [0] * self.n_agents
-        for i, person in enumerate(self._map._wounded_persons):
-            position = person.position
-            prev_distances[i] = self.get_distance(
-                (position[0], position[1]),
-                self._map._rescue_center_pos[0],
-            )
+        self.profiler.count("steps")
+        self.profiler.start("reward")
+        self._rewards.begin_step(actions)
+        self.profiler.stop()
 
         # rotate value from -1 to 1, do this to discourage it from rotate to much
 
@@ -328,58 +386,42 @@ class MASwarmTarget(gym.Env):
             commands[agent] = move
 
         terminated, truncated = False, False
-        rewards = [-0.5 for _ in range(self.n_agents)]
 
+        self.profiler.start("physics")
+        # The lidar and the semantic sensor are only computed for the last tick, the one _get_obs() reads
+        self._playground.skip_external_sensors = True
         while counter < steps and not done:
             _, _, _, done = self._playground.step(commands)
-            if counter % frame_skip == 0:
-                self.frames.append(self._render_frame())
 
-            for i, agent in enumerate(self._agents):
-                if agent.reward != 0:
-                    self.current_rescue_count += agent.reward
-                    rewards[i] += 50
+            self.current_rescue_count += self._rewards.record_rescues()
+            if self._recorder is not None:
+                self._recorder.record(actions)
 
             if self.current_rescue_count >= self._map._number_wounded_persons:
                 terminated = True
                 self.current_rescue_count = 0
                 break
 
-            if self.render_mode == "human" and counter % frame_skip == 0:
+            if self._frame_buffer.should_capture(counter):
+                self._frame_buffer.append(self._render_frame())
+                self.profiler.count("frames_captured")
+            elif self.render_mode == "human" and counter % frame_skip == 0:
                 self._render_frame()
             counter += 1
+        self._playground.skip_external_sensors = False
+        self._playground.update_external_sensors()
+        collect_playground_gl_objects(self._playground)
+        self.profiler.stop()
 
-        conflicts = [0] * self.n_agents
-        for i, agent in enumerate(self._agents):
-            reward, conflict = self.reward(agent, actions[i])
-            rewards[i] += reward
-            conflicts[i] += conflict
-
+        self.profiler.start("reward")
         self.current_step += 1
         if self.current_step >= self.max_episode_steps:
             truncated = True
-            for i in range(len(rewards)):
-                rewards[i] -= 20
-
-        # SHARED REWARD DEFINITION
-        shared_reward = sum(rewards)
-        if not truncated:
-            shared_reward = max(shared_reward, -10 * self.n_agents)
-
-        delta_distances = 0
-        for i, person in enumerate(self._map._wounded_persons):
-            position = person.position
-            delta_distances += (
-                self.get_distance(
-                    (position[0], position[1]),
-                    self._map._rescue_center_pos[0],
-                )
-                - prev_distances[i]
-            )
-
-        shared_reward -= delta_distances / 5
+        self._rewards.end_step(terminated, truncated)
+        self.profiler.stop()
 
         if self.use_exp_map:
+            self.profiler.start("explored_map")
             current_exp_score = self._map.explored_map.score()
             if self.last_exp_score is not None:
                 delta_exp_score = current_exp_score - self.last_exp_score
@@ -388,32 +430,44 @@ class MASwarmTarget(gym.Env):
 
             self.last_exp_score = current_exp_score
             # print(f"score {delta_exp_score}, {current_exp_score}")
-            self.gui.update_explore_map()
+            self._map.explored_map.update(self._agents)
+            self.profiler.stop()
 
             # REWARD
-            shared_reward += 50 * delta_exp_score
+            self._rewards.add_exploration(delta_exp_score)
 
         if self.share_reward:
-            final_rewards = [[shared_reward]] * self.n_agents
+            final_rewards = [[self._rewards.shared]] * self.n_agents
         else:
-            final_rewards = rewards
+            final_rewards = self._rewards.individual.tolist()
         # terminations = [terminated] * self.n_agents
         # truncations = [truncated] * self.n_agents
         dones = [terminated or truncated] * self.n_agents
 
-        observations = self._get_obs()
-        infos = self._get_info()
+        with self.profiler.phase("observation"):
+            observations = self._get_obs()
+        with self.profiler.phase("info"):
+            infos = self._get_info()
 
-        infos["conflict_count"] = conflicts
+        infos["conflict_count"] = self._rewards.conflicts.tolist()
+        infos["reward_terms"] = self._rewards.info()
 
         if self.render_mode == "human":
             self._render_frame()
 
         return observations, final_rewards, dones, infos
 
+    def _get_gui(self):
+        # The GUI view is only built when a frame is requested, headless envs never create it otherwise
+        if self.gui is None:
+            self.gui = GuiSR(self._playground, self._map)
+        activate_playground_context(self._playground)
+        return self.gui
+
     def _render_frame(self):
         # Capture the frame
-        image = self.gui.get_playground_image()
+        with self.profiler.phase("rendering"):
+            image = self._get_gui().get_playground_image()
 
         if self.render_mode == "human":
             for name in self.agents:
@@ -452,6 +506,9 @@ class MASwarmTarget(gym.Env):
         return actions
 
     def close(self):
+        if self._recorder is not None:
+            self._recorder.close()
+        self._frame_buffer.close()
         gc.collect()
         cv2.destroyAllWindows()
 
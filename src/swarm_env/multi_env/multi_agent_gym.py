@@ -5,16 +5,27 @@ import pygame
 import gymnasium as gym
 from gymnasium import spaces
 import cv2
-from swarm_env.env_renderer import GuiSR
+from spg_overlay.utils.step_profiler import StepProfiler
+from swarm_env.env_renderer import (
+    FrameBuffer,
+    GuiSR,
+    activate_playground_context,
+    close_playground_window,
+    collect_playground_gl_objects,
+)
 from swarm_env.multi_env.ma_drone import MultiAgentDrone
+from swarm_env.observation import ObservationBuilder
+from swarm_env.occupancy_mapping import OccupancyGridMapper
+from swarm_env.reward import RewardEngine
+from swarm_env.snapshot import restore_simulation, snapshot_simulation
+from swarm_env.trajectory import TrajectoryRecorder
+from spg_overlay.gui_map.spawn_sampler import ScenarioBank
 import gc
 from custom_maps.intermediate01 import MyMapIntermediate01
 from custom_maps.easy import EasyMap
 from typing import Any, Dict, Generic, Iterable, Iterator, TypeVar
 from pettingzoo import ParallelEnv
 from gymnasium.utils import EzPickle, seeding
-from swarm_env.constants import *
-import arcade
 
 """
 Environment for multi agent
@@ -62,6 +73,16 @@ class MultiSwarmEnv(gym.Env):
         share_reward=True,
         use_exp_map=False,
         use_conflict_reward=False,
+        headless=False,
+        capture_frames=False,
+        frame_stride=5,
+        max_frames=500,
+        video_dir=None,
+        profile=False,
+        occupancy_map=None,
+        record_dir=None,
+        record_stride=1,
+        scenario_bank=None,
     ):
         EzPickle.__init__(
             self,
@@ -72,6 +93,16 @@ class MultiSwarmEnv(gym.Env):
             max_episode_steps=max_episode_steps,
             continuous_action=continuous_action,
             fixed_step=fixed_step,
+            headless=headless,
+            capture_frames=capture_frames,
+            frame_stride=frame_stride,
+            max_frames=max_frames,
+            video_dir=video_dir,
+            profile=profile,
+            occupancy_map=occupancy_map,
+            record_dir=record_dir,
+            record_stride=record_stride,
+            scenario_bank=scenario_bank,
         )
 
         if map_name in map_dict:
@@ -93,13 +124,25 @@ class MultiSwarmEnv(gym.Env):
         self.fixed_step = fixed_step
         self.use_exp_map = use_exp_map
         self.use_conflict_reward = use_conflict_reward
+        self.headless = headless
 
         ### OBSERVATION
 
         """
         Lidar: 180 + semantic: (1 + n_targets + n_agents - 1) * 3 + pose: 3 + velocity: 2 + grasper: 1  
         """
-        single_obs_dim = 180 + (self.n_targets + self.n_agents) * 3 + 5 + 1
+        self._obs_builder = ObservationBuilder(
+            n_agents=self.n_agents,
+            n_humans=self.n_targets,
+            n_drones=self.n_agents - 1,
+            use_grasper=True,
+            occupancy_mapper=(
+                None
+                if occupancy_map is None
+                else OccupancyGridMapper(self.n_agents, mode=occupancy_map)
+            ),
+        )
+        single_obs_dim = self._obs_builder.obs_dim
         self.observation_space = [
             spaces.Box(low=-np.inf, high=np.inf, shape=(single_obs_dim,))
             for _ in range(self.n_agents)
@@ -130,7 +173,30 @@ class MultiSwarmEnv(gym.Env):
         self.render_mode = render_mode
         self.gui = None
         self.clock = None
-        self.frames = []
+        self._frame_buffer = FrameBuffer(
+            enabled=capture_frames,
+            stride=frame_stride,
+            max_frames=max_frames,
+            video_dir=video_dir,
+        )
+        self.profiler = StepProfiler(enabled=profile)
+        self._recorder = (
+            None
+            if record_dir is None
+            else TrajectoryRecorder(record_dir, stride=record_stride)
+        )
+        self._scenario_bank = (
+            ScenarioBank.load(scenario_bank)
+            if isinstance(scenario_bank, str)
+            else scenario_bank
+        )
+        self._rewards = RewardEngine(
+            n_agents=self.n_agents,
+            rescue_reward=30,
+            truncation_penalty=10,
+            use_conflict_reward=self.use_conflict_reward,
+            shared_floor=-10 * self.n_agents,
+        )
 
     def get_distance(self, pos_a, pos_b):
         return np.sqrt((pos_a[0] - pos_b[0]) ** 2 + (pos_a[1] - pos_b[1]) ** 2)
@@ -142,11 +208,9 @@ class MultiSwarmEnv(gym.Env):
         return obs_array
 
     def state(self) -> ndarray:
-        observations = self._get_obs()
-        state_array = []
-        for agent_id in self.agents:
-            state_array.append(observations[agent_id])
-        return np.array(state_array)
+        # Observations of the last reset or step, without computing them again.
+        # This is the buffer itself, overwritten at the next step
+        return self._obs_builder.buffer
 
     def construct_action(self, action):
         return {
@@ -157,43 +221,11 @@ class MultiSwarmEnv(gym.Env):
         }
 
     def observe(self, agent_id):
-        agent = self._agents[agent_id]
-        lidar = agent.lidar_values()[:-1].astype(np.float32) / LIDAR_MAX_RANGE
-        velocity = agent.measured_velocity().astype(np.float32).flatten()
-        normalized_position = (
-            agent.true_position()[0] / self.map_size[0],
-            agent.true_position()[1] / self.map_size[1],
-        )
-        pose = (
-            np.concatenate((normalized_position, [agent.true_angle()]), axis=0)
-            .astype(np.float32)
-            .flatten()
-        )
-        semantic = np.zeros((1 + self.n_targets + (self.n_agents - 1), 3)).astype(
-            np.float32
-        )
-        center, human, drone = agent.process_special_semantic()
-        semantic[0] = center[0]
-        for i in range(min(len(human), self.n_targets)):
-            semantic[1 + i] = human[i]
-        for i in range(min(len(drone), self.n_agents - 1)):
-            semantic[1 + self.n_targets + i] = drone[i]
-
-        grasper = [1] if len(self._agents[agent_id].grasped_entities()) > 0 else [0]
-
-        # print(lidar.shape, velocity.shape, pose.shape)
-        observation = np.concatenate(
-            [lidar, velocity, pose, semantic.flatten(), grasper],
-            axis=0,
-        ).astype(np.float32)
-
-        return observation
+        return self._obs_builder.buffer[agent_id].copy()
 
     def _get_obs(self):
-        observations = []
-        for idx in self.agents:
-            observations.append(self.observe(agent_id=idx))
-        return observations
+        # The buffer is overwritten at the next step, the caller gets its own copy
+        return self._obs_builder.build(self._agents, self.map_size).copy()
 
     def seed(self, seed=None):
         if seed is None:
@@ -216,7 +248,6 @@ class MultiSwarmEnv(gym.Env):
         self._map.reset_rescue_center()
         self._map.reset_wounded_person()
         self._map.reset_drone()
-        # self.frames = []
 
     def re_init(self):
         self._map = map_dict[self.map_name](
@@ -224,27 +255,47 @@ class MultiSwarmEnv(gym.Env):
         )
         self.map_size = self._map._size_area
         self._playground = self._map.construct_playground(drone_type=MultiAgentDrone)
+        self._map.set_scenario_bank(self._scenario_bank)
+        self._playground.profiler = self.profiler
         self._agents = self._map.drones
-        self.gui = GuiSR(self._playground, self._map)
+        self.gui = None if self.headless else GuiSR(self._playground, self._map)
 
     def reset(self, seed=None, options=None):
-        if (
-            self.ep_count == 0
-        ):  # change to self.ep_count % 1 == 0 to avoid mem leak, but hurt performance
+        # The playground is only built for the first episode, it is reset in place afterwards
+        if self.ep_count == 0:
+            close_playground_window(self._playground)
             del self._map
             del self._agents
             del self._playground
             del self.gui
-            arcade.close_window()
             self.re_init()
-            # gc.collect()
         self.ep_count += 1
-        self._playground.window.switch_to()
+        if seed is not None:
+            # The noise of the sensors and the placements are reproducible from the seed of the episode
+            self._playground.noise_stream.seed(seed)
+            self._map.seed_spawns(seed)
+        activate_playground_context(self._playground)
         self.reset_map()
         self._playground.reset()
+        collect_playground_gl_objects(self._playground)
         self.current_rescue_count = 0
         self.current_step = 0
-        self.frames = []
+        self._frame_buffer.clear()
+        self._rewards.reset(
+            self._agents, self._map._wounded_persons, self._map._rescue_center_pos[0]
+        )
+        if self._recorder is not None:
+            self._recorder.start_episode(
+                self.map_name,
+                self.map_size,
+                self._map.explored_map.map_playground,
+                self._agents,
+                self._map._wounded_persons,
+                self._map._rescue_center_pos[0],
+                self._map._rescue_center.texture.size,
+                action_dim=self.action_space[0].shape[0],
+            )
+        self._obs_builder.reset(self.map_size)
         observation = self._get_obs()
         # info = self._get_info()
         return observation
@@ -257,91 +308,57 @@ class MultiSwarmEnv(gym.Env):
     def get_map(self):
         return self._map
 
-    def reward(self, agent, action):
-        rew = -np.abs(action[2])
-        conflict = 0
-        if agent.is_collided():
-            rew -= 1
-        if agent.touch_human():
-            rew += 1
-        for human in self._map._wounded_persons:
-            magnets = set(human.grasped_by)
-            if len(magnets) > 1 and agent.base.grasper in magnets:
-                if self.use_conflict_reward:
-                    rew -= 1
-                conflict += 1
-                # print("Conflict!!")
-        return rew, conflict
-
     def step(self, actions):
-        self._playground.window.switch_to()
-        frame_skip = 5
+        activate_playground_context(self._playground)
+        frame_skip = self._frame_buffer.stride
         counter = 0
         done = False
         steps = self.fixed_step
-        prev_distances = [0] * self.n_agents
-        for i, person in enumerate(self._map._wounded_persons):
-            position = person.position
-            prev_distances[i] = self.get_distance(
-                (position[0], position[1]),
-                self._map._rescue_center_pos[0],
-            )
+        self.profiler.count("steps")
+        self.profiler.start("reward")
+        self._rewards.begin_step(actions)
+        self.profiler.stop()
         commands = {}
         for i, agent in enumerate(self._agents):
             move = self.construct_action(actions[i])
             commands[agent] = move
 
         terminated, truncated = False, False
-        rewards = [-0.5 for _ in range(self.n_agents)]
 
+        self.profiler.start("physics")
+        # The lidar and the semantic sensor are only computed for the last tick, the one _get_obs() reads
+        self._playground.skip_external_sensors = True
         while counter < steps and not done:
             _, _, _, done = self._playground.step(commands)
 
-            for i, agent in enumerate(self._agents):
-                if agent.reward != 0:
-                    self.current_rescue_count += agent.reward
-                    rewards[i] += 30
+            self.current_rescue_count += self._rewards.record_rescues()
+            if self._recorder is not None:
+                self._recorder.record(actions)
 
             if self.current_rescue_count >= self._map._number_wounded_persons:
                 terminated = True
                 break
 
-            if counter % frame_skip == 0:
-                # self._agent.update_grid()
-                self.frames.append(self._render_frame())
+            if self._frame_buffer.should_capture(counter):
+                self._frame_buffer.append(self._render_frame())
+                self.profiler.count("frames_captured")
+            elif self.render_mode == "human" and counter % frame_skip == 0:
+                self._render_frame()
             counter += 1
+        self._playground.skip_external_sensors = False
+        self._playground.update_external_sensors()
+        collect_playground_gl_objects(self._playground)
+        self.profiler.stop()
 
-        conflicts = [0] * self.n_agents
-        for i, agent in enumerate(self._agents):
-            reward, conflict = self.reward(agent, actions[i])
-            rewards[i] += reward
-            conflicts[i] += conflict
-
+        self.profiler.start("reward")
         self.current_step += 1
         if self.current_step >= self.max_episode_steps:
             truncated = True
-            for i in range(len(rewards)):
-                rewards[i] -= 10
-
-        # SHARED REWARD DEFINITION
-        shared_reward = sum(rewards)
-        if not truncated:
-            shared_reward = max(shared_reward, -10 * self.n_agents)
-
-        delta_distances = 0
-        for i, person in enumerate(self._map._wounded_persons):
-            position = person.position
-            delta_distances += (
-                self.get_distance(
-                    (position[0], position[1]),
-                    self._map._rescue_center_pos[0],
-                )
-                - prev_distances[i]
-            )
-
-        shared_reward -= delta_distances / 5
+        self._rewards.end_step(terminated, truncated)
+        self.profiler.stop()
 
         if self.use_exp_map:
+            self.profiler.start("explored_map")
             current_exp_score = self._map.explored_map.score()
             if self.last_exp_score is not None:
                 delta_exp_score = current_exp_score - self.last_exp_score
@@ -350,21 +367,25 @@ class MultiSwarmEnv(gym.Env):
 
             self.last_exp_score = current_exp_score
 
-            self.gui.update_explore_map()
+            self._map.explored_map.update(self._agents)
+            self.profiler.stop()
             # REWARD
-            shared_reward += 50 * delta_exp_score
+            self._rewards.add_exploration(delta_exp_score)
 
         if self.share_reward:
-            final_rewards = [[shared_reward]] * self.n_agents
+            final_rewards = [[self._rewards.shared]] * self.n_agents
         else:
-            final_rewards = rewards
+            final_rewards = self._rewards.individual.tolist()
         # terminations = [terminated] * self.n_agents
         # truncations = [truncated] * self.n_agents
         dones = [terminated or truncated] * self.n_agents
 
-        observations = self._get_obs()
-        infos = self._get_info()
-        infos["conflict_count"] = conflicts
+        with self.profiler.phase("observation"):
+            observations = self._get_obs()
+        with self.profiler.phase("info"):
+            infos = self._get_info()
+        infos["conflict_count"] = self._rewards.conflicts.tolist()
+        infos["reward_terms"] = self._rewards.info()
 
         # infos["individual_reward"] = rewards
 
@@ -373,8 +394,46 @@ class MultiSwarmEnv(gym.Env):
 
         return observations, final_rewards, dones, infos
 
+    def snapshot(self):
+        """
+        Snapshot of the simulation in the middle of an episode, a binary buffer to give to restore(). Restoring it is
+        much faster than a reset followed by the replay of the actions, see swarm_env.snapshot.
+        """
+        return snapshot_simulation(
+            self._playground,
+            self._map,
+            self._obs_builder,
+            current_step=self.current_step,
+            current_rescue_count=self.current_rescue_count,
+            last_exp_score=self.last_exp_score,
+        )
+
+    def restore(self, snapshot):
+        """Go back to the simulation of a snapshot(), returns the observations of the snapshot"""
+        activate_playground_context(self._playground)
+        counters = restore_simulation(
+            self._playground, self._map, snapshot, self._obs_builder
+        )
+        self.current_step = counters["current_step"]
+        self.current_rescue_count = counters["current_rescue_count"]
+        self.last_exp_score = counters["last_exp_score"]
+        self._rewards.reset(
+            self._agents, self._map._wounded_persons, self._map._rescue_center_pos[0]
+        )
+        collect_playground_gl_objects(self._playground)
+        return self._obs_builder.buffer.copy()
+
     def get_all_frames(self):
-        return self.frames
+        return self._frame_buffer.get_frames()
+
+    def get_video_stats(self):
+        return self._frame_buffer.video_stats()
+
+    def get_trajectory_dir(self):
+        return None if self._recorder is None else self._recorder.episode_dir
+
+    def get_profile(self):
+        return self.profiler.report()
 
     def draw_index(self, image, pos_list):
         for i, pos in enumerate(pos_list):
@@ -395,9 +454,17 @@ class MultiSwarmEnv(gym.Env):
             )
         return image
 
+    def _get_gui(self):
+        # The GUI view is only built when a frame is requested, headless envs never create it otherwise
+        if self.gui is None:
+            self.gui = GuiSR(self._playground, self._map)
+        activate_playground_context(self._playground)
+        return self.gui
+
     def _render_frame(self):
         # Capture the frame
-        image = self.gui.get_playground_image()
+        with self.profiler.phase("rendering"):
+            image = self._get_gui().get_playground_image()
 
         if self.render_mode == "human":
             drone_pos = [agent.true_position() for agent in self._agents]
@@ -421,9 +488,12 @@ class MultiSwarmEnv(gym.Env):
         return actions
 
     def close(self):
+        if self._recorder is not None:
+            self._recorder.close()
+        self._frame_buffer.close()
         gc.collect()
         cv2.destroyAllWindows()
-        arcade.close_window()
+        close_playground_window(self._playground)
 
     def observation_space(self, agent: Any) -> Space:
         return self.observation_spaces[agent]
@@ -5,9 +5,22 @@ import pygame
 import gymnasium as gym
 from gymnasium import spaces
 import cv2
-from swarm_env.env_renderer import GuiSR
+from spg_overlay.utils.step_profiler import StepProfiler
+from swarm_env.env_renderer import (
+    FrameBuffer,
+    GuiSR,
+    activate_playground_context,
+    close_playground_window,
+    collect_playground_gl_objects,
+)
 from spg_overlay.entities.drone_distance_sensors import DroneSemanticSensor
 from swarm_env.multi_env.ma_drone import MultiAgentDrone
+from swarm_env.observation import ObservationBuilder
+from swarm_env.occupancy_mapping import OccupancyGridMapper
+from swarm_env.reward import RewardEngine
+from swarm_env.snapshot import restore_simulation, snapshot_simulation
+from swarm_env.trajectory import TrajectoryRecorder
+from spg_overlay.gui_map.spawn_sampler import ScenarioBank
 import gc
 from custom_maps.intermediate01 import MyMapIntermediate01
 from custom_maps.easy import EasyMap
@@ -69,6 +82,16 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         continuous_action=True,
         fixed_step=20,
         share_reward=True,
+        headless=False,
+        capture_frames=False,
+        frame_stride=5,
+        max_frames=500,
+        video_dir=None,
+        profile=False,
+        occupancy_map=None,
+        record_dir=None,
+        record_stride=1,
+        scenario_bank=None,
     ):
         EzPickle.__init__(
             self,
@@ -79,6 +102,16 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
             max_episode_steps=max_episode_steps,
             continuous_action=continuous_action,
             fixed_step=fixed_step,
+            headless=headless,
+            capture_frames=capture_frames,
+            frame_stride=frame_stride,
+            max_frames=max_frames,
+            video_dir=video_dir,
+            profile=profile,
+            occupancy_map=occupancy_map,
+            record_dir=record_dir,
+            record_stride=record_stride,
+            scenario_bank=scenario_bank,
         )
 
         if map_name in map_dict:
@@ -91,6 +124,7 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         self.continuous_action = continuous_action
         self.share_reward = share_reward
         self.n_agents = n_agents
+        self.headless = headless
 
         self._playground = self._map.construct_playground(drone_type=MultiAgentDrone)
         self._agents = self._playground._agents
@@ -103,6 +137,17 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         self.fixed_step = fixed_step
 
         ### OBSERVATION
+        self._obs_builder = ObservationBuilder(
+            n_agents=self.n_agents,
+            n_humans=MAX_NUM_PERSONS,
+            n_drones=MAX_NUM_DRONES - 1,
+            use_grasper=False,
+            occupancy_mapper=(
+                None
+                if occupancy_map is None
+                else OccupancyGridMapper(self.n_agents, mode=occupancy_map)
+            ),
+        )
         self.observation_spaces = {
             agent_id: spaces.Dict(
                 {
@@ -119,6 +164,12 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
             )
             for agent_id in self.possible_agents
         }
+        if occupancy_map is not None:
+            # occupancy grid: -1 free, 0 unknown, 1 occupied
+            for space in self.observation_spaces.values():
+                space.spaces["map"] = spaces.Box(
+                    low=-1, high=1, shape=self._obs_builder.occupancy_mapper.obs_shape
+                )
 
         # forward, lateral, rotation, grasper
         self.action_spaces = {
@@ -133,9 +184,30 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         self.max_episode_steps = max_episode_steps
         self.last_exp_score = None
         self.render_mode = render_mode
-        self.gui = GuiSR(self._playground, self._map)
+        self.gui = None if self.headless else GuiSR(self._playground, self._map)
         self.clock = None
-        self.frames = []
+        self._frame_buffer = FrameBuffer(
+            enabled=capture_frames,
+            stride=frame_stride,
+            max_frames=max_frames,
+            video_dir=video_dir,
+        )
+        self.profiler = StepProfiler(enabled=profile)
+        self._recorder = (
+            None
+            if record_dir is None
+            else TrajectoryRecorder(record_dir, stride=record_stride)
+        )
+        self._scenario_bank = (
+            ScenarioBank.load(scenario_bank)
+            if isinstance(scenario_bank, str)
+            else scenario_bank
+        )
+        self._map.set_scenario_bank(self._scenario_bank)
+        self._rewards = RewardEngine(
+            n_agents=self.n_agents, rescue_reward=50, truncation_penalty=20
+        )
+        self._playground.profiler = self.profiler
 
     def get_distance(self, pos_a, pos_b):
         return np.sqrt((pos_a[0] - pos_b[0]) ** 2 + (pos_a[1] - pos_b[1]) ** 2)
@@ -147,12 +219,9 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         return obs_array
 
     def state(self) -> ndarray:
-        observations = self._get_obs()
-        state_array = []
-        for agent_id in self.agents:
-            obs_array = self.flatten_obs(observations[agent_id])
-            state_array.append(obs_array)
-        return np.array(state_array)
+        # Observations of the last reset or step, without computing them again.
+        # This is the buffer itself, overwritten at the next step
+        return self._obs_builder.buffer
 
     def construct_action(self, action):
         return {
@@ -163,39 +232,16 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         }
 
     def observe(self, agent_id):
-        agent = self.name_to_agent[agent_id]
-        observation = {}
-        observation["lidar"] = (
-            agent.lidar_values()[:-1].astype(np.float32) / LIDAR_MAX_RANGE
-        )
-        observation["velocity"] = agent.measured_velocity().astype(np.float32)
-        normalized_position = (
-            agent.true_position()[0] / self.map_size[0],
-            agent.true_position()[1] / self.map_size[1],
-        )
-        observation["pose"] = np.concatenate(
-            (normalized_position, [agent.true_angle()]), axis=0
-        ).astype(np.float32)
-        semantic = np.zeros((1 + MAX_NUM_PERSONS + (MAX_NUM_DRONES - 1), 3)).astype(
-            np.float32
-        )
-        center, human, drone = agent.process_special_semantic()
-
-        semantic[0] = center[0]
-        for i in range(min(len(human), MAX_NUM_PERSONS)):
-            semantic[1 + i] = human[i]
-
-        for i in range(min(len(drone), MAX_NUM_DRONES - 1)):
-            semantic[1 + MAX_NUM_PERSONS + i] = drone[i]
-
-        observation["semantic"] = semantic
-        return observation
+        view = self._obs_builder.views[self.possible_agents.index(agent_id)]
+        return {key: value.copy() for key, value in view.items()}
 
     def _get_obs(self):
-        observations = {}
-        for name in self.possible_agents:
-            observations[name] = self.observe(agent_id=name)
-        return observations
+        # The buffer is overwritten at the next step, the caller gets its own copy
+        self._obs_builder.build(self._agents, self.map_size)
+        return {
+            name: {key: value.copy() for key, value in self._obs_builder.views[i].items()}
+            for i, name in enumerate(self.possible_agents)
+        }
 
     def get_agent_info(self, agent_id):
         info = {}
@@ -220,14 +266,32 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         self._map.reset_drone()
 
     def reset(self, seed=None, options=None):
-        # Reinit GUI
-        gc.collect()
-        self._playground.window.switch_to()
+        if seed is not None:
+            # The noise of the sensors and the placements are reproducible from the seed of the episode
+            self._playground.noise_stream.seed(seed)
+            self._map.seed_spawns(seed)
+        activate_playground_context(self._playground)
         self.reset_map()
         self._playground.reset()
+        collect_playground_gl_objects(self._playground)
         self.current_rescue_count = 0
         self.current_step = 0
-        self.frames = []
+        self._frame_buffer.clear()
+        self._rewards.reset(
+            self._agents, self._map._wounded_persons, self._map._rescue_center_pos[0]
+        )
+        if self._recorder is not None:
+            self._recorder.start_episode(
+                self.map_name,
+                self.map_size,
+                self._map.explored_map.map_playground,
+                self._agents,
+                self._map._wounded_persons,
+                self._map._rescue_center_pos[0],
+                self._map._rescue_center.texture.size,
+                action_dim=self.action_spaces[self.possible_agents[0]].shape[0],
+            )
+        self._obs_builder.reset(self.map_size)
         observation = self._get_obs()
         info = self._get_info()
         return observation, info
@@ -236,27 +300,16 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         if self.render_mode == "rgb_array":
             return self._render_frame()
 
-    def reward(self, agent, action):
-        rew = -np.abs(action[2])
-        if agent.is_collided():
-            rew -= 1
-        if agent.touch_human():
-            rew += 1
-        return rew
-
     def step(self, actions):
-        self._playground.window.switch_to()
-        frame_skip = 5
+        activate_playground_context(self._playground)
+        frame_skip = self._frame_buffer.stride
         counter = 0
         done = False
         steps = self.fixed_step  # 25 + int(action[4]) if self.fixed_step == 0 else
-        prev_distances = [0] * self.n_agents
-        for i, person in enumerate(self._map._wounded_persons):
-            position = person.position
-            prev_distances[i] = self.get_distance(
-                (position[0], position[1]),
-                self._map._rescue_center_pos[0],
-            )
+        self.profiler.count("steps")
+        self.profiler.start("reward")
+        self._rewards.begin_step([actions[name] for name in self.possible_agents])
+        self.profiler.stop()
 
         # rotate value from -1 to 1, do this to discourage it from rotate to much
 
@@ -267,51 +320,39 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
             commands[agent] = move
 
         terminated, truncated = False, False
-        rewards = {name: -0.5 for name in self.possible_agents}
 
+        self.profiler.start("physics")
+        # The lidar and the semantic sensor are only computed for the last tick, the one _get_obs() reads
+        self._playground.skip_external_sensors = True
         while counter < steps and not done:
             _, _, _, done = self._playground.step(commands)
-            for name in self.possible_agents:
-                agent = self.name_to_agent[name]
-                if agent.reward != 0:
-                    self.current_rescue_count += agent.reward
-                    rewards[name] += 50
+            self.current_rescue_count += self._rewards.record_rescues()
+            if self._recorder is not None:
+                self._recorder.record([actions[name] for name in self.possible_agents])
 
             if self.current_rescue_count >= self._map._number_wounded_persons:
                 terminated = True
                 break
 
-            if counter % frame_skip == 0:
-                # self._agent.update_grid()
-                self.frames.append(self._render_frame())
+            if self._frame_buffer.should_capture(counter):
+                self._frame_buffer.append(self._render_frame())
+                self.profiler.count("frames_captured")
+            elif self.render_mode == "human" and counter % frame_skip == 0:
+                self._render_frame()
             counter += 1
+        self._playground.skip_external_sensors = False
+        self._playground.update_external_sensors()
+        collect_playground_gl_objects(self._playground)
+        self.profiler.stop()
 
-        for name in self.possible_agents:
-            agent = self.name_to_agent[name]
-            rewards[name] += self.reward(agent, actions[name])
-
+        self.profiler.start("reward")
         self.current_step += 1
         if self.current_step >= self.max_episode_steps:
             truncated = True
-            for agent in rewards.keys():
-                rewards[agent] -= 20
-
-        # SHARED REWARD DEFINITION
-        shared_reward = sum(rewards.values())
-
-        delta_distances = 0
-        for i, person in enumerate(self._map._wounded_persons):
-            position = person.position
-            delta_distances += (
-                self.get_distance(
-                    (position[0], position[1]),
-                    self._map._rescue_center_pos[0],
-                )
-                - prev_distances[i]
-            )
-
-        shared_reward -= delta_distances / 5
+        self._rewards.end_step(terminated, truncated)
+        self.profiler.stop()
 
+        self.profiler.start("explored_map")
         current_exp_score = self._map.explored_map.score()
         if self.last_exp_score is not None:
             delta_exp_score = current_exp_score - self.last_exp_score
@@ -320,11 +361,14 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
 
         self.last_exp_score = current_exp_score
         # print(f"score {delta_exp_score}, {current_exp_score}")
-        self.gui.update_explore_map()
+        self._map.explored_map.update(self._agents)
+        self.profiler.stop()
 
         # REWARD
-        shared_reward += 50 * delta_exp_score
+        self._rewards.add_exploration(delta_exp_score)
 
+        shared_reward = self._rewards.shared
+        rewards = dict(zip(self.possible_agents, self._rewards.individual.tolist()))
         if self.share_reward:
             final_rewards = {
                 agent_id: shared_reward for agent_id in self.possible_agents
@@ -334,22 +378,77 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         terminations = {agent_id: terminated for agent_id in self.possible_agents}
         truncations = {agent_id: truncated for agent_id in self.possible_agents}
 
-        observations = self._get_obs()
-        infos = self._get_info()
-        for agent_id in self.possible_agents:
+        with self.profiler.phase("observation"):
+            observations = self._get_obs()
+        with self.profiler.phase("info"):
+            infos = self._get_info()
+        for i, agent_id in enumerate(self.possible_agents):
             infos[agent_id]["individual_reward"] = rewards[agent_id]
+            infos[agent_id]["reward_terms"] = self._rewards.info(i)
 
         if self.render_mode == "human":
             self._render_frame()
 
-        if terminated or truncated:
-            infos["ep_frames"] = self.frames
+        if (terminated or truncated) and self._frame_buffer.enabled:
+            infos["ep_frames"] = self.get_all_frames()
 
         return observations, final_rewards, terminations, truncations, infos
 
+    def snapshot(self):
+        """
+        Snapshot of the simulation in the middle of an episode, a binary buffer to give to restore(). Restoring it is
+        much faster than a reset followed by the replay of the actions, see swarm_env.snapshot.
+        """
+        return snapshot_simulation(
+            self._playground,
+            self._map,
+            self._obs_builder,
+            current_step=self.current_step,
+            current_rescue_count=self.current_rescue_count,
+            last_exp_score=self.last_exp_score,
+        )
+
+    def restore(self, snapshot):
+        """Go back to the simulation of a snapshot(), returns the observations of the snapshot"""
+        activate_playground_context(self._playground)
+        counters = restore_simulation(
+            self._playground, self._map, snapshot, self._obs_builder
+        )
+        self.current_step = counters["current_step"]
+        self.current_rescue_count = counters["current_rescue_count"]
+        self.last_exp_score = counters["last_exp_score"]
+        self._rewards.reset(
+            self._agents, self._map._wounded_persons, self._map._rescue_center_pos[0]
+        )
+        collect_playground_gl_objects(self._playground)
+        return {
+            name: {key: value.copy() for key, value in self._obs_builder.views[i].items()}
+            for i, name in enumerate(self.possible_agents)
+        }
+
+    def get_all_frames(self):
+        return self._frame_buffer.get_frames()
+
+    def get_video_stats(self):
+        return self._frame_buffer.video_stats()
+
+    def get_trajectory_dir(self):
+        return None if self._recorder is None else self._recorder.episode_dir
+
+    def get_profile(self):
+        return self.profiler.report()
+
+    def _get_gui(self):
+        # The GUI view is only built when a frame is requested, headless envs never create it otherwise
+        if self.gui is None:
+            self.gui = GuiSR(self._playground, self._map)
+        activate_playground_context(self._playground)
+        return self.gui
+
     def _render_frame(self):
         # Capture the frame
-        image = self.gui.get_playground_image()
+        with self.profiler.phase("rendering"):
+            image = self._get_gui().get_playground_image()
 
         if self.render_mode == "human":
             for name in self.agents:
@@ -388,8 +487,12 @@ class MultiSwarmEnv(ParallelEnv, EzPickle):
         return actions
 
     def close(self):
+        if self._recorder is not None:
+            self._recorder.close()
+        self._frame_buffer.close()
         gc.collect()
         cv2.destroyAllWindows()
+        close_playground_window(self._playground)
 
     def observation_space(self, agent: Any) -> Space:
         return self.observation_spaces[agent]
@@ -0,0 +1,176 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from swarm_env.multi_env.ma_drone import MultiAgentDrone
+from swarm_env.occupancy_mapping import OccupancyGridMapper
+from swarm_env.constants import *
+
+LIDAR_DIM = 180
+VELOCITY_DIM = 2
+POSE_DIM = 3
+SEMANTIC_ITEM_DIM = 3
+
+
+class ObservationBuilder:
+    """
+    The ObservationBuilder class builds the observations of all the agents of a multi agent environment in one
+    preallocated (n_agents, obs_dim) float32 buffer. Each call of build() writes the lidar, velocity, pose, semantic,
+    grasper and message slices of every row in place, so no array is allocated per step.
+
+    Layout of a row:
+    Lidar: 180, velocity: 2, pose: 3 (x / map width, y / map height, angle),
+    semantic: (1 + n_humans + n_drones) * 3 (rescue center, nearest humans, nearest drones),
+    grasper: 1 (if use_grasper), messages: n_agents * message_dim (if message_dim > 0),
+    map: obs_shape[0] * obs_shape[1] (if occupancy_mapper), the occupancy grid downsampled by the OccupancyGridMapper
+
+    The buffer is overwritten by the next call of build(): the arrays it returns must be copied to be kept.
+
+    Example Usage
+        builder = ObservationBuilder(n_agents=2, n_humans=1, n_drones=1, use_grasper=True)
+        observations = builder.build(drones, map_size)
+        lidar_of_first_agent = builder.views[0]["lidar"]
+
+    With an occupancy_mapper, build() integrates the lidar of the agents in the occupancy grids before writing the map
+    slice, and reset() must be called at the start of each episode to clear the grids.
+    """
+
+    def __init__(
+        self,
+        n_agents: int,
+        n_humans: int,
+        n_drones: int,
+        use_grasper: bool = True,
+        message_dim: int = 0,
+        occupancy_mapper: Optional[OccupancyGridMapper] = None,
+    ):
+        self.n_agents = n_agents
+        self.n_humans = n_humans
+        self.n_drones = n_drones
+        self.use_grasper = use_grasper
+        self.message_dim = message_dim
+        self.occupancy_mapper = occupancy_mapper
+
+        n_semantic = 1 + n_humans + n_drones
+        sizes = [
+            ("lidar", LIDAR_DIM),
+            ("velocity", VELOCITY_DIM),
+            ("pose", POSE_DIM),
+            ("semantic", n_semantic * SEMANTIC_ITEM_DIM),
+        ]
+        if use_grasper:
+            sizes.append(("grasper", 1))
+        if message_dim > 0:
+            sizes.append(("message", n_agents * message_dim))
+        if occupancy_mapper is not None:
+            map_shape = occupancy_mapper.obs_shape
+            sizes.append(("map", map_shape[0] * map_shape[1]))
+
+        self.slices = {}
+        start = 0
+        for name, size in sizes:
+            self.slices[name] = slice(start, start + size)
+            start += size
+        self.obs_dim = start
+
+        self.buffer = np.zeros((n_agents, self.obs_dim), dtype=np.float32)
+
+        # Views on the buffer, reshaped as the per agent arrays they replace
+        self._lidar = self.buffer[:, self.slices["lidar"]]
+        self._velocity = self.buffer[:, self.slices["velocity"]]
+        self._pose = self.buffer[:, self.slices["pose"]]
+        self._semantic = self.buffer[:, self.slices["semantic"]].reshape(
+            (n_agents, n_semantic, SEMANTIC_ITEM_DIM)
+        )
+        self._grasper = self.buffer[:, self.slices["grasper"]] if use_grasper else None
+        self._message = (
+            self.buffer[:, self.slices["message"]].reshape(
+                (n_agents, n_agents, message_dim)
+            )
+            if message_dim > 0
+            else None
+        )
+        self._occupancy = (
+            self.buffer[:, self.slices["map"]] if occupancy_mapper is not None else None
+        )
+
+        self.views = [
+            {
+                "lidar": self._lidar[i],
+                "velocity": self._velocity[i],
+                "pose": self._pose[i],
+                "semantic": self._semantic[i],
+            }
+            for i in range(n_agents)
+        ]
+        for i in range(n_agents):
+            if use_grasper:
+                self.views[i]["grasper"] = self._grasper[i]
+            if message_dim > 0:
+                self.views[i]["message"] = self._message[i]
+            if occupancy_mapper is not None:
+                self.views[i]["map"] = self._occupancy[i].reshape(occupancy_mapper.obs_shape)
+
+    def reset(self, map_size: Tuple[int, int]):
+        """Clear the occupancy grids, at the start of an episode"""
+        if self.occupancy_mapper is not None:
+            self.occupancy_mapper.reset(map_size)
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """The last observations and the occupancy grids, which build() integrates into"""
+        state = {"buffer": self.buffer.copy()}
+        if self.occupancy_mapper is not None:
+            state.update({"occupancy." + name: value for name, value in self.occupancy_mapper.get_state().items()})
+        return state
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        """Restores a state given by get_state(), the buffer holds the observations again"""
+        self.buffer[:] = state["buffer"]
+        if self.occupancy_mapper is not None:
+            prefix = "occupancy."
+            self.occupancy_mapper.set_state(
+                {name[len(prefix):]: value for name, value in state.items() if name.startswith(prefix)}
+            )
+
+    def build(
+        self, agents: List[MultiAgentDrone], map_size: Tuple[int, int]
+    ) -> np.ndarray:
+        """
+        Write the observations of all the agents in the buffer and return it.
+        The messages are read from agent.state["message"], every agent sees the messages of all the agents.
+        """
+        self._semantic.fill(0)
+
+        for i, agent in enumerate(agents):
+            self._lidar[i] = agent.lidar_values()[:-1]
+            self._velocity[i] = agent.measured_velocity()
+
+            position = agent.true_position()
+            pose = self._pose[i]
+            pose[0] = position[0] / map_size[0]
+            pose[1] = position[1] / map_size[1]
+            pose[2] = agent.true_angle()
+
+            semantic = self._semantic[i]
+            center, human, drone = agent.process_special_semantic()
+            n_human = min(len(human), self.n_humans)
+            n_drone = min(len(drone), self.n_drones)
+            semantic[0] = center[0]
+            semantic[1:1 + n_human] = human[:n_human]
+            semantic[1 + self.n_humans:1 + self.n_humans + n_drone] = drone[:n_drone]
+
+            if self.use_grasper:
+                self._grasper[i] = 1 if len(agent.grasped_entities()) > 0 else 0
+
+            if self.message_dim > 0:
+                # Column i of every row: the message sent by agent i
+                self._message[:, i] = agent.state["message"]
+
+        # Normalized in place, in float32 as the lidar values were converted before
+        self._lidar /= LIDAR_MAX_RANGE
+
+        if self.occupancy_mapper is not None:
+            self.occupancy_mapper.update(agents)
+            self._occupancy[:] = self.occupancy_mapper.observations()
+
+        return self.buffer
@@ -0,0 +1,250 @@
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from spg_overlay.utils.constants import MAX_RANGE_LIDAR_SENSOR
+from spg_overlay.utils.grid import Grid
+from spg_overlay.utils.tiled_grid import TiledGrid
+from spg_overlay.utils.utils import bresenham_batch
+
+# Log-odds added to the cells crossed by a ray, and to the cell hit by a ray
+LOG_ODDS_FREE = -0.4
+LOG_ODDS_OCCUPIED = 2.0
+# The log-odds are clipped to [-LOG_ODDS_CLIP, LOG_ODDS_CLIP]
+LOG_ODDS_CLIP = 40.0
+# The last pixels of a ray, just before the obstacle, are not set free
+FREE_MARGIN = 10.0
+# The rays longer than MAX_RANGE_LIDAR_SENSOR - HIT_MARGIN hit nothing
+HIT_MARGIN = 5.0
+
+OCCUPANCY_MODES = ("drone", "swarm")
+
+
+class OccupancyGridMapper:
+    """
+    The OccupancyGridMapper class integrates the lidar of all the drones of an environment into log-odds occupancy
+    grids, in one vectorized pass per step: the rays of all the drones are rasterized at once with bresenham_batch()
+    and the log-odds of all the grids are updated with two np.add.at calls on flat indices. The directions of the rays are rotated
+    from a table of the sin and cos of the angles of the lidar rays, computed once.
+
+    With mode "drone" each drone has its own grid, with mode "swarm" all the drones share one grid. Each grid is a
+    Grid whose grid array is a view on the log_odds array, so Grid.display() and Grid.get_rgb_img() can show it.
+
+    With tiled=True the grids are TiledGrid instead, and there is no log_odds array: each grid only allocates the
+    tiles its drone has seen, which is what a grid per drone at a fine resolution on a large map needs. The values
+    are the same as with the dense grids.
+
+    The observation of a drone is its grid downsampled to obs_shape and scaled to [-1, 1]: -1 is free, 1 is occupied
+    and 0 is unknown.
+
+    Example Usage
+        mapper = OccupancyGridMapper(n_agents=16, mode="swarm")
+        mapper = OccupancyGridMapper(n_agents=16, mode="drone", resolution=2, tiled=True)
+        mapper.reset(map_size)
+        mapper.update(drones)
+        observations = mapper.observations()  # (16, 16 * 16)
+
+    Fields
+        n_agents: number of drones.
+        mode: "drone" or "swarm".
+        resolution: size of a cell of the grids, in pixels.
+        obs_shape: shape of the downsampled grids of the observations.
+        tiled: if the grids are TiledGrid.
+        grids: one Grid per drone, or one Grid for the swarm.
+        log_odds: (n_grids, x_max_grid, y_max_grid) float32 array of the log-odds of the grids, None if tiled.
+    """
+
+    def __init__(self, n_agents: int, mode: str = "drone", resolution: float = 8,
+                 obs_shape: Tuple[int, int] = (16, 16), tiled: bool = False):
+        if mode not in OCCUPANCY_MODES:
+            raise ValueError(f"Invalid occupancy mode {mode}, expected one of {OCCUPANCY_MODES}")
+
+        self.n_agents = n_agents
+        self.mode = mode
+        self.resolution = resolution
+        self.obs_shape = obs_shape
+        self.tiled = tiled
+
+        self.grids: List[Grid] = []
+        self.log_odds: Optional[np.ndarray] = None
+        self._size_area = None
+        # Area weights of the downsampling of the tiled grids, along x and along y
+        self._area_x = None
+        self._area_y = None
+        # Index of the grid of each drone
+        self._grid_index = np.zeros(n_agents, dtype=np.int64) if mode == "swarm" else np.arange(n_agents)
+        self._cos_rays = None
+        self._sin_rays = None
+        self._observations = np.zeros((n_agents, obs_shape[0] * obs_shape[1]), dtype=np.float32)
+
+    def reset(self, size_area: Tuple[int, int]):
+        """Clear the grids, they are allocated again only when the size of the map changes"""
+        if self._size_area != tuple(size_area):
+            self._size_area = tuple(size_area)
+            n_grids = 1 if self.mode == "swarm" else self.n_agents
+            grid_class = TiledGrid if self.tiled else Grid
+            self.grids = [grid_class(size_area_world=size_area, resolution=self.resolution, dtype=np.float32)
+                          for _ in range(n_grids)]
+            if self.tiled:
+                self._area_x = _area_weights(self.grids[0].x_max_grid, self.obs_shape[0])
+                self._area_y = _area_weights(self.grids[0].y_max_grid, self.obs_shape[1])
+            else:
+                self.log_odds = np.zeros((n_grids, self.grids[0].x_max_grid, self.grids[0].y_max_grid),
+                                         dtype=np.float32)
+                for grid, log_odds in zip(self.grids, self.log_odds):
+                    grid.grid = log_odds
+        elif self.tiled:
+            for grid in self.grids:
+                grid.clear()
+        else:
+            self.log_odds.fill(0)
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """
+        A copy of the log-odds of the grids: the dense stack, or the allocated tiles with the index of their grid and
+        their (x, y) index in the grid
+        """
+        if not self.grids:
+            return {}
+        if not self.tiled:
+            return {"log_odds": self.log_odds.copy()}
+        tiles = [(g, index, tile) for g, grid in enumerate(self.grids) for index, tile in grid.tiles.items()]
+        size = self.grids[0].tile_size
+        return {
+            "tile_grid": np.array([g for g, _, _ in tiles], dtype=np.int64),
+            "tile_index": np.array([index for _, index, _ in tiles], dtype=np.int64).reshape(-1, 2),
+            "tiles": np.array([tile for _, _, tile in tiles], dtype=np.float32).reshape(-1, size, size),
+        }
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        """Restores a state given by get_state(), of grids of the same size"""
+        if "log_odds" in state:
+            self.log_odds[:] = state["log_odds"]
+        if "tiles" in state:
+            for grid in self.grids:
+                grid.clear()
+            for g, (i, j), tile in zip(state["tile_grid"], state["tile_index"], state["tiles"]):
+                self.grids[g].tiles[(int(i), int(j))] = tile.copy()
+
+    def update(self, agents):
+        """Integrate the current lidar values of the drones in the grids"""
+        drones = [i for i, agent in enumerate(agents) if agent.lidar_values() is not None]
+        if not drones:
+            return
+
+        if self._cos_rays is None:
+            ray_angles = np.asarray(agents[drones[0]].lidar_rays_angles(), dtype=np.float64)
+            self._cos_rays = np.cos(ray_angles)
+            self._sin_rays = np.sin(ray_angles)
+
+        positions = np.array([agents[i].true_position() for i in drones], dtype=np.float64)
+        angles = np.array([agents[i].true_angle() for i in drones], dtype=np.float64)
+        distances = np.array([agents[i].lidar_values() for i in drones], dtype=np.float64)
+
+        # cos and sin of the angle of each ray in the world, from the table of the rays: (n_drones, n_rays)
+        cos_angles, sin_angles = np.cos(angles)[:, None], np.sin(angles)[:, None]
+        cos_world = cos_angles * self._cos_rays - sin_angles * self._sin_rays
+        sin_world = sin_angles * self._cos_rays + cos_angles * self._sin_rays
+
+        x_0 = np.broadcast_to(positions[:, 0:1], distances.shape)
+        y_0 = np.broadcast_to(positions[:, 1:2], distances.shape)
+        grid_index = np.broadcast_to(self._grid_index[drones][:, None], distances.shape)
+
+        # Free cells, along the rays up to the obstacle
+        free_distances = np.maximum(distances - FREE_MARGIN, 0)
+        self._add_lines(grid_index, x_0, y_0, x_0 + free_distances * cos_world, y_0 + free_distances * sin_world)
+
+        # Occupied cells, at the end of the rays which hit an obstacle
+        hit = distances < MAX_RANGE_LIDAR_SENSOR - HIT_MARGIN
+        self._add_points(grid_index[hit], (x_0 + distances * cos_world)[hit], (y_0 + distances * sin_world)[hit])
+
+        if self.tiled:
+            for grid in self.grids:
+                for tile in grid.tiles.values():
+                    np.clip(tile, -LOG_ODDS_CLIP, LOG_ODDS_CLIP, out=tile)
+        else:
+            np.clip(self.log_odds, -LOG_ODDS_CLIP, LOG_ODDS_CLIP, out=self.log_odds)
+
+    def _in_grid(self, x_px: np.ndarray, y_px: np.ndarray) -> np.ndarray:
+        grid = self.grids[0]
+        return (x_px >= 0) & (x_px < grid.x_max_grid) & (y_px >= 0) & (y_px < grid.y_max_grid)
+
+    def _add_lines(self, grid_index, x_0, y_0, x_1, y_1):
+        """The same as Grid.add_values_along_lines(), for the lines of all the grids at once"""
+        grid_index, x_0, y_0, x_1, y_1 = (np.ravel(a) for a in (grid_index, x_0, y_0, x_1, y_1))
+        select = ~(np.isnan(x_0) | np.isnan(y_0) | np.isnan(x_1) | np.isnan(y_1))
+
+        x_start, y_start = self.grids[0]._conv_world_to_grid(x_0[select], y_0[select])
+        x_end, y_end = self.grids[0]._conv_world_to_grid(x_1[select], y_1[select])
+        inside = self._in_grid(x_start, y_start) & self._in_grid(x_end, y_end)
+
+        points, line_index = bresenham_batch(np.stack((x_start[inside], y_start[inside]), axis=1),
+                                             np.stack((x_end[inside], y_end[inside]), axis=1))
+        grids = grid_index[select][inside][line_index]
+        self._add_to_cells(grids, points[:, 0], points[:, 1], LOG_ODDS_FREE)
+
+    def _add_points(self, grid_index, points_x, points_y):
+        """The same as Grid.add_points(), for the points of all the grids at once"""
+        select = ~(np.isnan(points_x) | np.isnan(points_y))
+        x_px, y_px = self.grids[0]._conv_world_to_grid(points_x[select], points_y[select])
+        inside = self._in_grid(x_px, y_px)
+        self._add_to_cells(grid_index[select][inside], x_px[inside], y_px[inside], LOG_ODDS_OCCUPIED)
+
+    def _add_to_cells(self, grids, x_px, y_px, val):
+        """Add a value to the cells, once per occurrence, np.add.at is much faster on flat indices"""
+        if self.tiled:
+            vals = np.full(len(grids), val, dtype=np.float32)
+            for index in np.unique(grids):
+                select = grids == index
+                self.grids[index]._accumulate_cells(x_px[select], y_px[select], vals[select])
+            return
+        cells = np.ravel_multi_index((grids, x_px, y_px), self.log_odds.shape)
+        np.add.at(self.log_odds.reshape(-1), cells, np.float32(val))
+
+    def observations(self) -> np.ndarray:
+        """
+        The grid of each drone downsampled to obs_shape and scaled to [-1, 1], flattened: (n_agents, h * w).
+        The array is overwritten by the next call.
+        """
+        if not self.grids:
+            return self._observations
+        if self.tiled:
+            downsampled = [self._downsample_tiles(grid) for grid in self.grids]
+        else:
+            # cv2 takes the size as (columns, rows)
+            downsampled = [cv2.resize(log_odds, (self.obs_shape[1], self.obs_shape[0]), interpolation=cv2.INTER_AREA)
+                           for log_odds in self.log_odds]
+        downsampled = np.array(downsampled).reshape((len(downsampled), -1)) / LOG_ODDS_CLIP
+        self._observations[:] = downsampled[self._grid_index]
+        return self._observations
+
+    def _downsample_tiles(self, grid: TiledGrid) -> np.ndarray:
+        """
+        The same as cv2.resize() with INTER_AREA of the dense grid, tile by tile: the area weights are separable, so
+        the downsampled grid is the sum of area_x @ tile @ area_y.T over the allocated tiles
+        """
+        if self._area_x is None or self._area_y is None:
+            # The grid is smaller than the observation, INTER_AREA is not an area average then
+            return cv2.resize(grid.to_dense(), (self.obs_shape[1], self.obs_shape[0]), interpolation=cv2.INTER_AREA)
+        downsampled = np.zeros(self.obs_shape, dtype=np.float64)
+        size = grid.tile_size
+        for (i, j), tile in grid.tiles.items():
+            x, y = i * size, j * size
+            area_x, area_y = self._area_x[:, x:x + size], self._area_y[:, y:y + size]
+            downsampled += area_x @ tile[:area_x.shape[1], :area_y.shape[1]] @ area_y.T
+        return downsampled.astype(np.float32)
+
+
+def _area_weights(n_cells: int, n_out: int) -> Optional[np.ndarray]:
+    """
+    (n_out, n_cells) weights of the cells in each downsampled cell, as INTER_AREA computes them: the part of the cell
+    inside the downsampled cell, over the size of the downsampled cell. None if there are fewer cells than n_out
+    """
+    if n_cells < n_out:
+        return None
+    scale = n_cells / n_out
+    low = np.arange(n_out)[:, None] * scale
+    cells = np.arange(n_cells)[None, :]
+    overlap = np.minimum(low + scale, cells + 1) - np.maximum(low, cells)
+    return np.clip(overlap, 0, None) / scale
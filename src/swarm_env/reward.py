@@ -0,0 +1,193 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Terms with one value per agent, their sum is the individual reward of the agent
+AGENT_REWARD_TERMS = ("step_cost", "rotation", "collision", "touch", "rescue", "conflict", "order", "truncation")
+# Terms shared by all the agents, added to the shared reward only
+SHARED_REWARD_TERMS = ("delivery", "exploration")
+
+
+class RewardEngine:
+    """
+    The RewardEngine class computes the rewards of all the environments, term by term, for all the agents at once.
+    The wounded persons, the drones and the rescue center are read into numpy arrays once per step, and each term is
+    a (n_agents,) array computed in batch: the cost of a step no longer grows with n_agents * n_targets. The
+    collisions, touches and grasp conflicts are read from the counters of the drones, updated by the collision
+    handlers at every physics tick of the step (see DroneAbstract), so the contacts in the middle of a step count.
+
+    Terms of each agent, summed in individual:
+    step_cost: -step_cost at every step,
+    rotation: -|rotation command|,
+    collision: -1 if the drone hit a wall, a box or another drone during the step,
+    touch: +1 if the drone touched a wounded person it does not carry during the step,
+    rescue: rescue_reward for each physics tick where the drone brought a person to the rescue center, and
+        completion_reward when all the persons are rescued,
+    conflict: -1 if the drone carried a person also grasped by another drone during the step, if use_conflict_reward,
+    order: +1 per person the drone was ordered to take and grasps (market environment),
+    truncation: -truncation_penalty at the last step of an episode.
+
+    Terms shared by the agents, added to shared:
+    delivery: -delivery_scale * the variation of the distance of the persons to the rescue center,
+    exploration: exploration_scale * the variation of the score of the explored map.
+
+    The shared reward is the sum of the individual rewards, floored at shared_floor unless the episode is truncated,
+    plus the shared terms.
+
+    Example Usage
+        engine = RewardEngine(n_agents=4, rescue_reward=50, use_conflict_reward=True, shared_floor=-40)
+        engine.reset(drones, wounded_persons, rescue_center_position)
+
+        engine.begin_step(actions)
+        for _ in range(20):
+            playground.step(commands)
+            rescued += engine.record_rescues()
+        engine.end_step(terminated, truncated)
+        engine.add_exploration(delta_exp_score)
+
+        rewards, shared_reward = engine.individual, engine.shared
+        infos["reward_terms"] = engine.info()
+
+    Fields
+        n_agents: number of drones.
+        terms: the (n_agents,) array of each term of the agents, by name.
+        shared_terms: the value of each shared term, by name.
+        conflicts: 1 for the drones which carried a person also grasped by another drone during the step, whether or
+            not it is rewarded.
+    """
+
+    def __init__(self,
+                 n_agents: int,
+                 step_cost: float = 0.5,
+                 rescue_reward: float = 50.0,
+                 completion_reward: float = 0.0,
+                 truncation_penalty: float = 20.0,
+                 use_conflict_reward: bool = False,
+                 shared_floor: Optional[float] = None,
+                 delivery_scale: float = 0.2,
+                 exploration_scale: float = 50.0):
+        self.n_agents = n_agents
+        self.step_cost = step_cost
+        self.rescue_reward = rescue_reward
+        self.completion_reward = completion_reward
+        self.truncation_penalty = truncation_penalty
+        self.use_conflict_reward = use_conflict_reward
+        self.shared_floor = shared_floor
+        self.delivery_scale = delivery_scale
+        self.exploration_scale = exploration_scale
+
+        self.terms: Dict[str, np.ndarray] = {name: np.zeros(n_agents) for name in AGENT_REWARD_TERMS}
+        self.shared_terms: Dict[str, float] = {name: 0.0 for name in SHARED_REWARD_TERMS}
+        self.conflicts = np.zeros(n_agents, dtype=np.int64)
+
+        self._agents: List = []
+        self._persons: List = []
+        self._rescue_center = np.zeros(2)
+        self._person_index = {}
+        # Distances of the persons to the rescue center at the start of the step, one per person
+        self._prev_distances = np.zeros(0)
+        self._truncated = False
+
+    def reset(self, agents: Sequence, persons: Sequence, rescue_center_position):
+        """Take the drones, the wounded persons and the position of the rescue center of a new episode"""
+        self._agents = list(agents)
+        self._persons = list(persons)
+        self._rescue_center = np.asarray(rescue_center_position, dtype=np.float64)
+        self._person_index = {id(person): j for j, person in enumerate(self._persons)}
+        self._prev_distances = self._distances_to_rescue_center()
+        self._clear()
+
+    def _clear(self):
+        for values in self.terms.values():
+            values.fill(0)
+        for name in self.shared_terms:
+            self.shared_terms[name] = 0.0
+        self.conflicts.fill(0)
+        self._truncated = False
+
+    def _distances_to_rescue_center(self) -> np.ndarray:
+        if not self._persons:
+            return np.zeros(0)
+        positions = np.array([tuple(person.position) for person in self._persons], dtype=np.float64)
+        return np.hypot(positions[:, 0] - self._rescue_center[0], positions[:, 1] - self._rescue_center[1])
+
+    def _counters(self, name: str) -> np.ndarray:
+        return np.fromiter((getattr(agent, name) for agent in self._agents), dtype=np.int64, count=self.n_agents)
+
+    def begin_step(self, actions):
+        """
+        Clear the terms and the contact counters of the drones, and record the distances of the persons before the
+        physics ticks of the step
+        """
+        self._clear()
+        for agent in self._agents:
+            agent.reset_contact_counters()
+        self.terms["step_cost"].fill(-self.step_cost)
+        actions = np.asarray(actions, dtype=np.float64).reshape(self.n_agents, -1)
+        self.terms["rotation"][:] = -np.abs(actions[:, 2])
+        self._prev_distances = self._distances_to_rescue_center()
+
+    def record_rescues(self) -> float:
+        """
+        Reward the drones which brought a person to the rescue center during the last physics tick, returns the sum of
+        the rewards of the rescue center, the number of persons rescued
+        """
+        rescued = np.fromiter((agent.reward for agent in self._agents), dtype=np.float64, count=self.n_agents)
+        self.terms["rescue"] += self.rescue_reward * (rescued != 0)
+        return float(rescued.sum())
+
+    def end_step(self, terminated: bool, truncated: bool, order: Optional[np.ndarray] = None):
+        """
+        Compute the terms read after the physics ticks of the step. order gives, for each person, the index of the
+        drone ordered to take it (market environment).
+        """
+        self.terms["collision"][:] = np.where(self._counters("collision_count") > 0, -1.0, 0.0)
+        self.terms["touch"][:] = self._counters("touch_count") > 0
+        self.conflicts[:] = self._counters("grasp_conflict_count") > 0
+        if self.use_conflict_reward:
+            self.terms["conflict"][:] = np.where(self.conflicts > 0, -1.0, 0.0)
+
+        if order is not None:
+            order = np.asarray(order, dtype=np.int64)
+            for i, agent in enumerate(self._agents):
+                for entity in agent.grasped_entities():
+                    j = self._person_index.get(id(entity))
+                    if j is not None and j < len(order) and order[j] == i:
+                        self.terms["order"][i] += 1
+
+        if terminated:
+            self.terms["rescue"] += self.completion_reward
+
+        self._truncated = truncated
+        if truncated:
+            self.terms["truncation"].fill(-self.truncation_penalty)
+
+        delta_distances = self._distances_to_rescue_center() - self._prev_distances
+        self.shared_terms["delivery"] = -float(delta_distances.sum()) * self.delivery_scale
+
+    def add_exploration(self, delta_exp_score: float):
+        self.shared_terms["exploration"] = self.exploration_scale * delta_exp_score
+
+    @property
+    def individual(self) -> np.ndarray:
+        """(n_agents,) array of the reward of each agent, the sum of its terms"""
+        return sum(self.terms.values())
+
+    @property
+    def shared(self) -> float:
+        shared = float(self.individual.sum())
+        if self.shared_floor is not None and not self._truncated:
+            shared = max(shared, self.shared_floor)
+        return shared + sum(self.shared_terms.values())
+
+    def info(self, agent: Optional[int] = None) -> dict:
+        """
+        The terms of the last step: for each term of the agents, the list of the values of the agents, or the value of
+        the agent of index agent when it is given
+        """
+        if agent is None:
+            info = {name: values.tolist() for name, values in self.terms.items()}
+        else:
+            info = {name: float(values[agent]) for name, values in self.terms.items()}
+        info.update(self.shared_terms)
+        return info
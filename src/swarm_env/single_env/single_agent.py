@@ -3,7 +3,18 @@ import pygame
 import gymnasium as gym
 from gymnasium import spaces
 import cv2
-from swarm_env.env_renderer import GuiSR
+from spg_overlay.utils.step_profiler import StepProfiler
+from swarm_env.env_renderer import (
+    FrameBuffer,
+    GuiSR,
+    activate_playground_context,
+    close_playground_window,
+    collect_playground_gl_objects,
+)
+from swarm_env.reward import RewardEngine
+from swarm_env.snapshot import restore_simulation, snapshot_simulation
+from swarm_env.trajectory import TrajectoryRecorder
+from spg_overlay.gui_map.spawn_sampler import ScenarioBank
 from swarm_env.single_env.single_drone import SwarmDrone
 import gc
 from custom_maps.intermediate01 import MyMapIntermediate01
@@ -12,7 +23,6 @@ from custom_maps.corridor import Corridor
 from custom_maps.multiple_rooms import MultiRoom
 from custom_maps.easy import EasyMap
 from swarm_env.constants import *
-import arcade
 import time
 
 """
@@ -35,6 +45,15 @@ class SwarmEnv(gym.Env):
     - max_steps: total timesteps to run before terminate the episdoe
     - fixed_steps: number of steps to step the playground per command produce by the agent
     - map_name: select the maps to run in.
+    - headless: only build the GUI view when a frame is requested (render() or capture_frames).
+    - capture_frames: keep one frame every frame_stride physics ticks, in a ring buffer of max_frames frames.
+    - video_dir: encode the captured frames of each episode into a video of this directory in the background,
+      instead of keeping them, see get_video_stats().
+    - profile: record the time spent in each phase of the steps and the work done, returned by get_profile().
+    - record_dir: record the state of the playground every record_stride physics ticks in this directory, one
+      directory per episode, given by get_trajectory_dir() and replayed by TrajectoryReplayer.
+    - scenario_bank: a ScenarioBank, or the path of a saved one, giving the placements of the entities at the resets
+      instead of drawing them.
 
     Oservation Space:
     - Pose: true_position and angle.
@@ -70,6 +89,15 @@ class SwarmEnv(gym.Env):
         fixed_step: int = 20,
         use_exp_map: bool = False,
         size_area: tuple = (300, 300),
+        headless: bool = False,
+        capture_frames: bool = False,
+        frame_stride: int = 5,
+        max_frames: int = 500,
+        video_dir: str = None,
+        profile: bool = False,
+        record_dir: str = None,
+        record_stride: int = 1,
+        scenario_bank=None,
     ):
         if map_name in map_dict:
             self.map_name = map_name
@@ -86,7 +114,26 @@ class SwarmEnv(gym.Env):
         self._playground = None
         self._agent = None
         self.n_targets = n_targets
-        self.frames = []
+        self._frame_buffer = FrameBuffer(
+            enabled=capture_frames,
+            stride=frame_stride,
+            max_frames=max_frames,
+            video_dir=video_dir,
+        )
+        self.profiler = StepProfiler(enabled=profile)
+        self._recorder = (
+            None
+            if record_dir is None
+            else TrajectoryRecorder(record_dir, stride=record_stride)
+        )
+        self._scenario_bank = (
+            ScenarioBank.load(scenario_bank)
+            if isinstance(scenario_bank, str)
+            else scenario_bank
+        )
+        self._rewards = RewardEngine(
+            n_agents=1, rescue_reward=0, completion_reward=50, truncation_penalty=20
+        )
 
         self.fixed_step = fixed_step
         self.total_rescued = 0
@@ -114,6 +161,7 @@ class SwarmEnv(gym.Env):
         self.max_steps = max_steps
         self.last_exp_score = None
         self.use_exp_map = use_exp_map
+        self.headless = headless
         self.ep_count = 0
 
         self.render_mode = render_mode
@@ -180,7 +228,7 @@ class SwarmEnv(gym.Env):
         self._map.reset_rescue_center()
         self._map.reset_wounded_person()
         self._map.reset_drone()
-        self.frames = []
+        self._frame_buffer.clear()
 
     def re_init(self):
         self._map = self._map = map_dict[self.map_name](
@@ -188,26 +236,46 @@ class SwarmEnv(gym.Env):
         )
         self.map_size = self._map._size_area
         self._playground = self._map.construct_playground(drone_type=SwarmDrone)
+        self._map.set_scenario_bank(self._scenario_bank)
+        self._playground.profiler = self.profiler
         self._agent = self._playground._agents[0]
-        self.gui = GuiSR(self._playground, self._map)
+        self.gui = None if self.headless else GuiSR(self._playground, self._map)
 
     def reset(self, seed=None, options=None):
-        if (
-            self.ep_count % 1 == 0
-        ):  # change to self.ep_count == 0 to boost performance, warning: mem leak
+        # The playground is only built for the first episode, it is reset in place afterwards
+        if self.ep_count == 0:
+            close_playground_window(self._playground)
             del self._map
             del self._agent
             del self._playground
             del self.gui
-            arcade.close_window()
             self.re_init()
 
         self.ep_count += 1
-        self._playground.window.switch_to()
+        if seed is not None:
+            # The noise of the sensors and the placements are reproducible from the seed of the episode
+            self._playground.noise_stream.seed(seed)
+            self._map.seed_spawns(seed)
+        activate_playground_context(self._playground)
         self.reset_map()
         self._playground.reset()
+        collect_playground_gl_objects(self._playground)
         self.current_step = 0
         self.total_rescued = 0
+        self._rewards.reset(
+            [self._agent], self._map._wounded_persons, self._map._rescue_center_pos[0]
+        )
+        if self._recorder is not None:
+            self._recorder.start_episode(
+                self.map_name,
+                self.map_size,
+                self._map.explored_map.map_playground,
+                [self._agent],
+                self._map._wounded_persons,
+                self._map._rescue_center_pos[0],
+                self._map._rescue_center.texture.size,
+                action_dim=self.action_space.shape[0],
+            )
         observation = self._get_obs()
         info = self._get_info()
         return observation, info
@@ -216,89 +284,129 @@ class SwarmEnv(gym.Env):
         if self.render_mode == "rgb_array":
             return self._render_frame()
 
+    def snapshot(self):
+        """
+        Snapshot of the simulation in the middle of an episode, a binary buffer to give to restore(). Restoring it is
+        much faster than a reset followed by the replay of the actions, see swarm_env.snapshot.
+        """
+        return snapshot_simulation(
+            self._playground,
+            self._map,
+            current_step=self.current_step,
+            total_rescued=self.total_rescued,
+            last_exp_score=self.last_exp_score,
+        )
+
+    def restore(self, snapshot):
+        """Go back to the simulation of a snapshot(), returns the observations of the snapshot"""
+        activate_playground_context(self._playground)
+        counters = restore_simulation(self._playground, self._map, snapshot)
+        self.current_step = counters["current_step"]
+        self.total_rescued = counters["total_rescued"]
+        self.last_exp_score = counters["last_exp_score"]
+        self._rewards.reset(
+            [self._agent], self._map._wounded_persons, self._map._rescue_center_pos[0]
+        )
+        collect_playground_gl_objects(self._playground)
+        return self._get_obs()
+
     def get_all_frames(self):
-        return self.frames
+        return self._frame_buffer.get_frames()
+
+    def get_video_stats(self):
+        return self._frame_buffer.video_stats()
+
+    def get_trajectory_dir(self):
+        return None if self._recorder is None else self._recorder.episode_dir
+
+    def get_profile(self):
+        return self.profiler.report()
 
     def step(self, action):
-        self._playground.window.switch_to()
+        activate_playground_context(self._playground)
 
-        frame_skip = 5
+        frame_skip = self._frame_buffer.stride
         counter = 0
         done = False
 
         terminated, truncated = False, False
 
-        # ROTATION PENALTY
-        reward = -0.5 - np.abs(
-            action[2]
-        )  # to discourage the drone from angualar movement
-
-        prev_distances = [0] * self.n_targets
-        for i, person in enumerate(self._map._wounded_persons):
-            position = person.position
-            prev_distances[i] = self.get_distance(
-                (position[0], position[1]),
-                self._map._rescue_center_pos[0],
-            )
+        self.profiler.count("steps")
+        self.profiler.start("reward")
+        # The rotation is penalized, to discourage the drone from angular movement
+        self._rewards.begin_step([action])
+        self.profiler.stop()
 
+        self.profiler.start("physics")
+        # The lidar and the semantic sensor are only computed for the last tick, the one _get_obs() reads
+        self._playground.skip_external_sensors = True
         while counter < self.fixed_step and not done:
             cmd = {self._agent: self.construct_action(action)}
             _, _, _, done = self._playground.step(cmd)
 
-            if self._agent.reward != 0:
-                self.total_rescued += self._agent.reward
+            self.total_rescued += self._rewards.record_rescues()
+            if self._recorder is not None:
+                self._recorder.record([action])
             if self.total_rescued == self._map._number_wounded_persons:
-                reward += 50
                 terminated = True
                 break
-            if counter % frame_skip == 0:
-                self.frames.append(self._render_frame())
+            if self._frame_buffer.should_capture(counter):
+                self._frame_buffer.append(self._render_frame())
+                self.profiler.count("frames_captured")
+            elif self.render_mode == "human" and counter % frame_skip == 0:
+                self._render_frame()
             counter += 1
+        self._playground.skip_external_sensors = False
+        self._playground.update_external_sensors()
+        collect_playground_gl_objects(self._playground)
+        self.profiler.stop()
 
-        reward = reward - self._agent.is_collided() + self._agent.touch_human()
-
-        delta_distances = 0
-        for i, person in enumerate(self._map._wounded_persons):
-            position = person.position
-            delta_distances += (
-                self.get_distance(
-                    (position[0], position[1]),
-                    self._map._rescue_center_pos[0],
-                )
-                - prev_distances[i]
-            )
-
-        # REWARDED WHEN MOVE PERSON CLOSER TO RECUE CENTER
-        reward -= delta_distances / 5
+        self.profiler.start("reward")
         self.current_step += 1
+        if self.current_step >= self.max_steps:
+            truncated = True
+        # REWARDED WHEN MOVE PERSON CLOSER TO RECUE CENTER, PENALIZED WHEN COLLIDED
+        self._rewards.end_step(terminated, truncated)
+        self.profiler.stop()
 
         # REWARDED WHEN EXPLORE MORE
         if self.use_exp_map:
+            self.profiler.start("explored_map")
             current_exp_score = self._map.explored_map.score()
             if self.last_exp_score is not None:
                 delta_score = current_exp_score - self.last_exp_score
             else:
                 delta_score = 0
-            reward += 50 * delta_score
+            self._rewards.add_exploration(delta_score)
 
             self.last_exp_score = current_exp_score
-            self.gui.update_explore_map()
+            self._map.explored_map.update([self._agent])
+            self.profiler.stop()
 
-        if self.current_step >= self.max_steps:
-            truncated = True
-            reward -= 20
+        reward = self._rewards.shared
 
-        observation = self._get_obs()
-        info = self._get_info()
+        with self.profiler.phase("observation"):
+            observation = self._get_obs()
+        with self.profiler.phase("info"):
+            info = self._get_info()
         info["reward"] = reward
+        info["reward_terms"] = self._rewards.info(0)
         info["done"] = truncated or terminated
-        if info["done"]:
+        if info["done"] and self._frame_buffer.enabled:
             info["ep_frames"] = self.get_all_frames()
 
         return observation, reward, terminated, truncated, info
 
+    def _get_gui(self):
+        # The GUI view is only built when a frame is requested, headless envs never create it otherwise
+        if self.gui is None:
+            self.gui = GuiSR(self._playground, self._map)
+        activate_playground_context(self._playground)
+        return self.gui
+
     def _render_frame(self):
-        image = self.gui.get_playground_image()
+        with self.profiler.phase("rendering"):
+            image = self._get_gui().get_playground_image()
 
         if self.render_mode == "human":
             if self.clock is None:
@@ -309,6 +417,9 @@ class SwarmEnv(gym.Env):
         return image
 
     def close(self):
+        if self._recorder is not None:
+            self._recorder.close()
+        self._frame_buffer.close()
         gc.collect()
         cv2.destroyAllWindows()
-        arcade.close_window()
+        close_playground_window(self._playground)
@@ -4,6 +4,7 @@
 from typing import Optional, Dict, Any, Tuple
 import numpy as np
 from spg_overlay.entities.drone_abstract import DroneAbstract
+from spg_overlay.entities.drone_distance_sensors import DroneSemanticSensor
 from spg_overlay.utils.misc_data import MiscData
 
 from spg_overlay.utils.constants import (
@@ -16,6 +17,8 @@ from spg_overlay.utils.constants import (
 )
 from swarm_env import constants
 
+TypeEntity = DroneSemanticSensor.TypeEntity
+
 
 class Color:
     BLACK = "\033[30m"
@@ -66,6 +69,8 @@ class SwarmDrone(DroneAbstract):
         self.show_log_warning = False
         self.show_log_error = False
         self.semantic_data = None
+        # (detections of the semantic sensor, items computed from them), computed once per physics tick
+        self._semantic_items = (None, None)
 
         self.log_info("Drone is initialized")
 
@@ -90,9 +95,9 @@ class SwarmDrone(DroneAbstract):
         if len(semantic) == 0:
             return dist < 30
 
-        idx = np.argmin([x.distance for x in semantic])
+        idx = np.argmin(semantic.distance)
 
-        if dist < 30 and str(semantic[idx].entity_type) != "TypeEntity.WOUNDED_PERSON":
+        if dist < 30 and semantic.entity_type[idx] != TypeEntity.WOUNDED_PERSON:
             collided = True
         return collided
 
@@ -102,11 +107,8 @@ class SwarmDrone(DroneAbstract):
         if semantic is None:
             return False
 
-        for x in semantic:
-            if x.distance < 30 and str(x.entity_type) == "TypeEntity.WOUNDED_PERSON":
-                return True
-
-        return False
+        touched = (semantic.distance < 30) & (semantic.entity_type == TypeEntity.WOUNDED_PERSON)
+        return bool(np.any(touched))
 
     def get_distance(self, pos_a, pos_b):
         return np.sqrt((pos_a[0] - pos_b[0]) ** 2 + (pos_a[1] - pos_b[1]) ** 2)
@@ -121,29 +123,30 @@ class SwarmDrone(DroneAbstract):
     def process_special_semantic(self):
         """Special semantic that also gives the identifier of the entity
         to give one semantic data only per entity.
+        Returns the rescue center (zeros if not detected) followed by the humans sorted by distance.
+        The result is cached until the next physics tick and must not be modified.
         """
-        semantic = self.semantic().special_semantic()
-        data = {}
-        for k, v, _ in semantic:
-            if k in data or str(v.entity_type) == "TypeEntity.WALL":
-                continue
-            data[k] = v
-
-        center = []
-        human = []
-        for d in data.values():
-            item = np.zeros((3,), dtype=np.float32)
-            item[0] = d.distance / constants.LIDAR_MAX_RANGE
-            item[1] = d.angle
-            item[2] = d.grasped
-            if str(d.entity_type) == "TypeEntity.RESCUE_CENTER":
-                center.append(item)
-            elif str(d.entity_type) == "TypeEntity.WOUNDED_PERSON":
-                human.append(item)
+        detections = self.semantic().special_semantic()
+        if self._semantic_items[0] is detections:
+            return self._semantic_items[1]
+
+        _, first = np.unique(detections.uid, return_index=True)
+        semantic = detections[np.sort(first)]
+
+        items = np.empty((len(semantic), 3), dtype=np.float32)
+        items[:, 0] = semantic.distance / constants.LIDAR_MAX_RANGE
+        items[:, 1] = semantic.angle
+        items[:, 2] = semantic.grasped
+
+        center = items[semantic.entity_type == TypeEntity.RESCUE_CENTER][:1]
         if len(center) == 0:
-            center = [np.zeros((3,))]
-        human = sorted(human, key=lambda i: i[0])
-        return center + human
+            center = np.zeros((1, 3), dtype=np.float32)
+        human = items[semantic.entity_type == TypeEntity.WOUNDED_PERSON]
+        human = human[np.argsort(human[:, 0], kind="stable")]
+
+        items = np.concatenate((center, human), axis=0)
+        self._semantic_items = (detections, items)
+        return items
 
     def log_info(self, log=""):
         if self.show_log_info:
@@ -0,0 +1,107 @@
+import io
+from typing import Dict, Optional
+
+import numpy as np
+
+from spg_overlay.gui_map.closed_playground import ClosedPlayground
+from swarm_env.observation import ObservationBuilder
+
+"""
+Snapshot and restore of the simulation of an environment in the middle of an episode
+"""
+
+
+def pack_snapshot(state: Dict[str, np.ndarray], compress: bool = False) -> bytes:
+    """The arrays of a state in one binary buffer, a .npz file in memory"""
+    buffer = io.BytesIO()
+    if compress:
+        np.savez_compressed(buffer, **state)
+    else:
+        np.savez(buffer, **state)
+    return buffer.getvalue()
+
+
+def unpack_snapshot(snapshot: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(snapshot), allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def _prefixed(state: Dict[str, np.ndarray], prefix: str) -> Dict[str, np.ndarray]:
+    return {prefix + name: value for name, value in state.items()}
+
+
+def _unprefixed(state: Dict[str, np.ndarray], prefix: str) -> Dict[str, np.ndarray]:
+    return {name[len(prefix):]: value for name, value in state.items() if name.startswith(prefix)}
+
+
+def _map_state(the_map) -> Dict[str, np.ndarray]:
+    """The placement of the rescue center and of the persons, drawn again at each reset of the map"""
+    (x, y), angle = the_map._rescue_center_pos
+    persons = [person.initial_coordinates for person in the_map._wounded_persons]
+    return {
+        "rescue_center": np.array((x, y, angle), dtype=np.float64),
+        "persons": np.array([(px, py, pangle) for (px, py), pangle in persons], dtype=np.float64).reshape(-1, 3),
+    }
+
+
+def _set_map_state(the_map, state: Dict[str, np.ndarray]):
+    x, y, angle = state["rescue_center"]
+    the_map._rescue_center_pos = ((x, y), angle)
+    the_map._rescue_center.initial_coordinates = the_map._rescue_center_pos
+    if not the_map._rescue_center.removed:
+        the_map._rescue_center.move_to(the_map._rescue_center_pos)
+
+    for i, (person, (px, py, pangle)) in enumerate(zip(the_map._wounded_persons, state["persons"])):
+        person.initial_coordinates = ((px, py), pangle)
+        if i < len(the_map._wounded_persons_pos):
+            the_map._wounded_persons_pos[i] = person.initial_coordinates
+
+
+def snapshot_simulation(playground: ClosedPlayground,
+                        the_map,
+                        obs_builder: Optional[ObservationBuilder] = None,
+                        compress: bool = False,
+                        **counters) -> bytes:
+    """
+    Snapshot of the simulation of an environment: the playground (bodies, grasps, sensors and their noise, see
+    ClosedPlayground.get_state()), the placement of the map, the explored map, the observations and occupancy grids
+    of obs_builder, and the counters of the environment given as keyword arguments (None is kept).
+
+    Example Usage
+        snapshot = snapshot_simulation(playground, the_map, obs_builder, current_step=12, last_exp_score=None)
+        ...
+        counters = restore_simulation(playground, the_map, snapshot, obs_builder)
+        current_step = counters["current_step"]
+    """
+    state = _prefixed(playground.get_state(), "playground.")
+    state.update(_prefixed(_map_state(the_map), "map."))
+    if the_map.explored_map.initialized:
+        state.update(_prefixed(the_map.explored_map.get_state(the_map.drones), "explored_map."))
+    if obs_builder is not None:
+        state.update(_prefixed(obs_builder.get_state(), "observation."))
+    for name, value in counters.items():
+        state["counter." + name] = np.zeros(0) if value is None else np.array(value)
+    return pack_snapshot(state, compress)
+
+
+def restore_simulation(playground: ClosedPlayground,
+                       the_map,
+                       snapshot: bytes,
+                       obs_builder: Optional[ObservationBuilder] = None) -> Dict[str, object]:
+    """
+    Restores a snapshot given by snapshot_simulation() for the same playground and map, in the same episode or in
+    another one. Returns the counters of the environment. The GL context of the playground must be the active one.
+    """
+    state = unpack_snapshot(snapshot)
+    _set_map_state(the_map, _unprefixed(state, "map."))
+    playground.set_state(_unprefixed(state, "playground."))
+    explored_map_state = _unprefixed(state, "explored_map.")
+    if explored_map_state:
+        the_map.explored_map.set_state(explored_map_state, the_map.drones)
+    if obs_builder is not None:
+        obs_builder.set_state(_unprefixed(state, "observation."))
+
+    counters = {}
+    for name, value in _unprefixed(state, "counter.").items():
+        counters[name] = None if value.size == 0 else value.item()
+    return counters
@@ -0,0 +1,328 @@
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+"""
+Compact recording of the episodes, one state per physics tick, and replay of the frames from the recorded states
+"""
+
+TRAJECTORY_META_FILE = "meta.json"
+TRAJECTORY_VERSION = 1
+
+# Radius of the drones and of the wounded persons, in pixels, as drawn by the replayer
+DRONE_RADIUS = 10
+PERSON_RADIUS = 12
+
+# Colors of the frames of the replayer (RGB)
+COLOR_BACKGROUND = (255, 255, 255)
+COLOR_WALLS = (96, 96, 96)
+COLOR_RESCUE_CENTER = (180, 220, 255)
+COLOR_PERSON = (0, 170, 0)
+COLOR_DRONE = (220, 0, 0)
+COLOR_GRASP = (0, 0, 0)
+COLOR_INDEX = (255, 0, 0)
+
+
+def trajectory_dtype(n_drones: int, n_persons: int, action_dim: int) -> np.dtype:
+    """
+    dtype of the state of one tick:
+    tick: index of the physics tick in the episode,
+    drones: (n_drones, 6) x, y, angle, vx, vy, angular velocity of each drone,
+    persons: (n_persons, 3) x, y and 1 if the person is still in the playground, 0 once rescued,
+    grasped: (n_drones,) index of the person grasped by each drone, -1 if none,
+    actions: (n_drones, action_dim) action of each drone during the step.
+    """
+    return np.dtype([
+        ("tick", np.int32),
+        ("drones", np.float32, (n_drones, 6)),
+        ("persons", np.float32, (n_persons, 3)),
+        ("grasped", np.int16, (n_drones,)),
+        ("actions", np.float32, (n_drones, action_dim)),
+    ])
+
+
+def _chunk_file(index: int) -> str:
+    return f"chunk_{index:05d}.npy"
+
+
+class TrajectoryRecorder:
+    """
+    The TrajectoryRecorder class records the episodes of an environment as the state of the playground at each physics
+    tick, instead of images: the pose and velocity of the drones, the position of the wounded persons, the person
+    grasped by each drone and the actions. A tick of 4 drones and 4 persons takes 220 bytes, against 5.6 MB for a
+    1660 x 1122 RGB frame, and no rendering is done during the episode. TrajectoryReplayer draws the frames from
+    the recorded states afterwards.
+
+    Each episode is written in its own directory, episode_00000, episode_00001..., in chunks of chunk_ticks ticks:
+    each chunk is a .npy file of records of trajectory_dtype(), written through a memory map, so the memory used does
+    not grow with the length of the episode. meta.json gives the map, the rescue center and the number of ticks of
+    each chunk, it is written when the episode ends (next start_episode() or close()). The image of the walls of each
+    map is written once, in the directory of the recorder.
+
+    Example Usage
+        recorder = TrajectoryRecorder("trajectories", stride=5)
+        recorder.start_episode(map_name, map_size, walls, drones, wounded_persons, rescue_center_pos,
+                               rescue_center_size, action_dim=4)
+        for step in range(100):
+            for tick in range(20):
+                playground.step(commands)
+                recorder.record(actions)
+        recorder.close()
+
+        replayer = TrajectoryReplayer(recorder.episode_dir)
+        frame = replayer.frame(len(replayer) - 1)
+
+    Inputs
+        directory: directory of the episodes, it is created if needed.
+        chunk_ticks: number of ticks of a chunk file.
+        stride: one tick out of stride is recorded.
+
+    Fields
+        episode_dir: directory of the current episode, None before the first one.
+        n_ticks: number of ticks recorded in the current episode.
+    """
+
+    def __init__(self, directory: str, chunk_ticks: int = 4096, stride: int = 1):
+        if chunk_ticks <= 0:
+            raise ValueError("chunk_ticks must be a positive integer.")
+        if stride <= 0:
+            raise ValueError("stride must be a positive integer.")
+
+        self.directory = directory
+        self.chunk_ticks = chunk_ticks
+        self.stride = stride
+        os.makedirs(directory, exist_ok=True)
+
+        self.episode_dir: Optional[str] = None
+        self.n_ticks = 0
+        self._episode_count = 0
+        self._meta: Dict = {}
+        self._agents: List = []
+        self._persons: List = []
+        self._person_index: Dict[int, int] = {}
+        self._dtype: Optional[np.dtype] = None
+        self._chunk: Optional[np.memmap] = None
+        self._chunk_sizes: List[int] = []
+        self._row = 0
+        self._tick = 0
+
+    def start_episode(self,
+                      map_name: str,
+                      map_size: Tuple[int, int],
+                      walls: np.ndarray,
+                      agents: Sequence,
+                      persons: Sequence,
+                      rescue_center_position,
+                      rescue_center_size: Tuple[int, int],
+                      action_dim: int):
+        """Ends the current episode, if any, and starts recording a new one"""
+        self.end_episode()
+
+        walls_file = f"walls_{map_name}_{map_size[0]}x{map_size[1]}.npy"
+        walls_path = os.path.join(self.directory, walls_file)
+        if not os.path.isfile(walls_path):
+            np.save(walls_path, walls)
+
+        self.episode_dir = os.path.join(self.directory, f"episode_{self._episode_count:05d}")
+        self._episode_count += 1
+        os.makedirs(self.episode_dir, exist_ok=True)
+
+        self._agents = list(agents)
+        self._persons = list(persons)
+        self._person_index = {id(person): j for j, person in enumerate(self._persons)}
+        self._dtype = trajectory_dtype(len(self._agents), len(self._persons), action_dim)
+        self._meta = {
+            "version": TRAJECTORY_VERSION,
+            "map_name": map_name,
+            "map_size": [int(v) for v in map_size],
+            "walls": os.path.join("..", walls_file),
+            "n_drones": len(self._agents),
+            "n_persons": len(self._persons),
+            "action_dim": action_dim,
+            # The rescue center does not move during an episode, it is recorded once
+            "rescue_center_position": [float(v) for v in rescue_center_position],
+            "rescue_center_size": [int(v) for v in rescue_center_size],
+            "stride": self.stride,
+        }
+        self.n_ticks = 0
+        self._chunk_sizes = []
+        self._chunk = None
+        self._row = 0
+        self._tick = 0
+
+    def _next_chunk(self):
+        self._flush_chunk()
+        path = os.path.join(self.episode_dir, _chunk_file(len(self._chunk_sizes)))
+        # The file is allocated at its full size, the pages are only written as the ticks are recorded
+        self._chunk = np.lib.format.open_memmap(path, mode="w+", dtype=self._dtype, shape=(self.chunk_ticks,))
+        self._chunk_sizes.append(0)
+        self._row = 0
+
+    def _flush_chunk(self):
+        if self._chunk is not None:
+            self._chunk.flush()
+            self._chunk = None
+
+    def record(self, actions):
+        """Records the state of the playground after a physics tick, actions are the actions of the current step"""
+        if self.episode_dir is None:
+            raise RuntimeError("start_episode() must be called before record()")
+        tick = self._tick
+        self._tick += 1
+        if tick % self.stride != 0:
+            return
+        if self._chunk is None or self._row == self.chunk_ticks:
+            self._next_chunk()
+
+        row = self._row
+        self._chunk["tick"][row] = tick
+        self._chunk["drones"][row] = [(*agent.true_position(), agent.true_angle(), *agent.true_velocity(),
+                                       agent.true_angular_velocity()) for agent in self._agents]
+        if self._persons:
+            self._chunk["persons"][row] = [(*person.position, not person.removed) for person in self._persons]
+        self._chunk["grasped"][row] = [self._grasped_person(agent) for agent in self._agents]
+        self._chunk["actions"][row] = np.asarray(actions, dtype=np.float32).reshape(len(self._agents), -1)
+
+        self._row += 1
+        self._chunk_sizes[-1] = self._row
+        self.n_ticks += 1
+
+    def _grasped_person(self, agent) -> int:
+        for entity in agent.grasped_entities():
+            j = self._person_index.get(id(entity))
+            if j is not None:
+                return j
+        return -1
+
+    def end_episode(self):
+        """Flushes the last chunk and writes meta.json of the current episode"""
+        if self.episode_dir is None or not self._meta:
+            return
+        self._flush_chunk()
+        meta = dict(self._meta, n_ticks=self.n_ticks, chunk_ticks=self.chunk_ticks,
+                    chunks=[[_chunk_file(i), size] for i, size in enumerate(self._chunk_sizes)])
+        with open(os.path.join(self.episode_dir, TRAJECTORY_META_FILE), "w") as f:
+            json.dump(meta, f, indent=1)
+        self._meta = {}
+
+    def close(self):
+        self.end_episode()
+
+
+class TrajectoryReplayer:
+    """
+    The TrajectoryReplayer class reads an episode recorded by TrajectoryRecorder, and draws its frames on demand from
+    the image of the walls of the map and the recorded states. The chunks are memory mapped read only: an episode is
+    never loaded as a whole.
+
+    The frames are RGB images of the size of the map, as returned by the environments: the walls, the rescue center,
+    the wounded persons still in the playground, and the drones with their heading and their index. A line joins a
+    drone to the person it grasps.
+
+    Example Usage
+        replayer = TrajectoryReplayer("trajectories/episode_00003")
+        state = replayer.state(10)
+        print(state["drones"][:, :2])
+        for frame in replayer.frames(step=20):
+            cv2.imshow("replay", cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            cv2.waitKey(30)
+
+    Inputs
+        episode_dir: directory of the episode.
+        background: (height, width, 3) uint8 RGB image drawn under the states, instead of the image of the walls.
+    """
+
+    def __init__(self, episode_dir: str, background: Optional[np.ndarray] = None):
+        self.episode_dir = episode_dir
+        with open(os.path.join(episode_dir, TRAJECTORY_META_FILE)) as f:
+            self.meta = json.load(f)
+
+        self._chunks = [np.load(os.path.join(episode_dir, name), mmap_mode="r")[:size]
+                        for name, size in self.meta["chunks"]]
+        self._offsets = np.cumsum([0] + [size for _, size in self.meta["chunks"]])
+
+        self.map_size = tuple(self.meta["map_size"])
+        self.rescue_center_position = np.array(self.meta["rescue_center_position"], dtype=np.float64)
+        self.rescue_center_size = tuple(self.meta["rescue_center_size"])
+        self._background = background
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    def _record(self, i: int):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Tick {i} out of range, the episode has {len(self)} recorded ticks")
+        chunk = int(np.searchsorted(self._offsets, i, side="right")) - 1
+        return self._chunks[chunk][i - self._offsets[chunk]]
+
+    def state(self, i: int) -> Dict[str, np.ndarray]:
+        """The i-th recorded state, by field of trajectory_dtype()"""
+        record = self._record(i)
+        return {name: np.array(record[name]) for name in record.dtype.names}
+
+    def field(self, name: str) -> np.ndarray:
+        """The values of a field of trajectory_dtype() for all the recorded ticks, e.g. field("drones")[:, :, :2]"""
+        if not self._chunks:
+            return np.zeros((0,) + self._field_shape(name))
+        return np.concatenate([chunk[name] for chunk in self._chunks])
+
+    def _field_shape(self, name: str) -> tuple:
+        dtype = trajectory_dtype(self.meta["n_drones"], self.meta["n_persons"], self.meta["action_dim"])
+        return dtype[name].shape
+
+    def background(self) -> np.ndarray:
+        """The image drawn under the states: the walls of the map, loaded once"""
+        if self._background is None:
+            walls = np.load(os.path.normpath(os.path.join(self.episode_dir, self.meta["walls"])))
+            background = np.empty(walls.shape + (3,), dtype=np.uint8)
+            background[:] = COLOR_BACKGROUND
+            background[walls > 0] = COLOR_WALLS
+            self._background = background
+        return self._background
+
+    def _to_pixels(self, positions: np.ndarray) -> np.ndarray:
+        """Positions in the playground, centered, to (column, row) in the image, whose y axis points down"""
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        pixels = np.empty(positions.shape, dtype=np.int64)
+        pixels[:, 0] = np.round(positions[:, 0] + self.map_size[0] / 2)
+        pixels[:, 1] = np.round(self.map_size[1] / 2 - positions[:, 1])
+        return pixels
+
+    def frame(self, i: int) -> np.ndarray:
+        """Draws the i-th recorded state, returns a (height, width, 3) uint8 RGB image"""
+        record = self._record(i)
+        image = self.background().copy()
+
+        center = self._to_pixels(self.rescue_center_position)[0]
+        half_size = np.array(self.rescue_center_size) // 2
+        cv2.rectangle(image, tuple(map(int, center - half_size)), tuple(map(int, center + half_size)),
+                      COLOR_RESCUE_CENTER, thickness=-1)
+
+        persons = record["persons"]
+        person_pixels = self._to_pixels(persons[:, :2])
+        for (x, y), present in zip(person_pixels, persons[:, 2]):
+            if present:
+                cv2.circle(image, (int(x), int(y)), PERSON_RADIUS, COLOR_PERSON, thickness=-1)
+
+        drones = record["drones"]
+        drone_pixels = self._to_pixels(drones[:, :2])
+        for k, ((x, y), angle, grasped) in enumerate(zip(drone_pixels, drones[:, 2], record["grasped"])):
+            if grasped >= 0:
+                cv2.line(image, (int(x), int(y)), tuple(map(int, person_pixels[grasped])), COLOR_GRASP, 2)
+            cv2.circle(image, (int(x), int(y)), DRONE_RADIUS, COLOR_DRONE, thickness=-1)
+            heading = (int(round(x + 2 * DRONE_RADIUS * np.cos(angle))),
+                       int(round(y - 2 * DRONE_RADIUS * np.sin(angle))))
+            cv2.line(image, (int(x), int(y)), heading, COLOR_DRONE, 2)
+            cv2.putText(image, str(k), (int(x) + DRONE_RADIUS, int(y) - DRONE_RADIUS), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.4, COLOR_INDEX, 1)
+        return image
+
+    def frames(self, start: int = 0, stop: Optional[int] = None, step: int = 1) -> Iterator[np.ndarray]:
+        """Draws the recorded states from start to stop, one out of step"""
+        for i in range(*slice(start, stop, step).indices(len(self))):
+            yield self.frame(i)
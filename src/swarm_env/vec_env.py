@@ -0,0 +1,330 @@
+import multiprocessing as mp
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, List, Optional, Sequence, Type
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import (
+    CloudpickleWrapper,
+    VecEnv,
+    VecEnvIndices,
+    VecEnvObs,
+    VecEnvStepReturn,
+)
+
+"""
+Vectorized environment running the multi agent swarm environments in a pool of processes
+"""
+
+
+class _MultiAgentAdapter:
+    """
+    Gives the same interface to the gym multi agent environments (list of actions, list of rewards) and to the
+    pettingzoo ParallelEnv (dictionaries indexed by agent name). Runs in the worker process.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.n_agents = env.n_agents
+        self.is_parallel_env = hasattr(env, "possible_agents")
+        if self.is_parallel_env:
+            self.names = list(env.possible_agents)
+            self.observation_space = env.observation_spaces[self.names[0]]
+            self.action_space = env.action_spaces[self.names[0]]
+        else:
+            self.names = None
+            self.observation_space = env.observation_space[0]
+            self.action_space = env.action_space[0]
+
+    def spec(self):
+        return {
+            "n_agents": self.n_agents,
+            "obs_dim": self.env._obs_builder.obs_dim,
+            "obs_slices": self.env._obs_builder.slices,
+            "observation_space": self.observation_space,
+            "action_space": self.action_space,
+        }
+
+    def reset(self, seed=None, options=None) -> List[dict]:
+        if self.is_parallel_env:
+            _, infos = self.env.reset(seed=seed, options=options)
+            return [infos[name] for name in self.names]
+        self.env.reset(seed=seed, options=options)
+        return [{} for _ in range(self.n_agents)]
+
+    def step(self, actions: np.ndarray):
+        """
+        Returns the rewards, terminated and truncated flags of each agent, and their infos
+        """
+        if self.is_parallel_env:
+            _, rewards, terminations, truncations, infos = self.env.step(
+                {name: actions[i] for i, name in enumerate(self.names)}
+            )
+            rewards = [rewards[name] for name in self.names]
+            terminated = [terminations[name] for name in self.names]
+            truncated = [truncations[name] for name in self.names]
+            infos = [infos[name] for name in self.names]
+        else:
+            _, rewards, dones, info = self.env.step(list(actions))
+            # The gym environments do not tell the truncations apart
+            terminated = dones
+            truncated = [False] * self.n_agents
+            infos = [info] * self.n_agents
+        rewards = np.asarray(rewards, dtype=np.float32).reshape(self.n_agents)
+        return rewards, terminated, truncated, infos
+
+    def render(self):
+        return self.env.render()
+
+
+def _worker(remote, parent_remote, env_fn_wrapper: CloudpickleWrapper) -> None:
+    parent_remote.close()
+    adapter = _MultiAgentAdapter(env_fn_wrapper.var())
+    remote.send(adapter.spec())
+
+    names, offset = remote.recv()
+    blocks = {key: shared_memory.SharedMemory(name=name) for key, name in names.items()}
+    n = adapter.n_agents
+    obs_dim = adapter.env._obs_builder.obs_dim
+    action_dim = int(np.prod(adapter.action_space.shape))
+    obs = np.ndarray((offset + n, obs_dim), np.float32, blocks["obs"].buf)[offset:]
+    actions = np.ndarray((offset + n, action_dim), np.float32, blocks["actions"].buf)[offset:]
+    rewards = np.ndarray((offset + n,), np.float32, blocks["rewards"].buf)[offset:]
+    dones = np.ndarray((offset + n,), np.bool_, blocks["dones"].buf)[offset:]
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                step_rewards, terminated, truncated, infos = adapter.step(actions)
+                rewards[:] = step_rewards
+                dones[:] = np.logical_or(terminated, truncated)
+                obs[:] = adapter.env.state()
+                if dones.any():
+                    terminal_obs = obs.copy()
+                    infos = [
+                        dict(
+                            info,
+                            terminal_observation=terminal_obs[i],
+                            **{"TimeLimit.truncated": truncated[i] and not terminated[i]},
+                        )
+                        for i, info in enumerate(infos)
+                    ]
+                    adapter.reset()
+                    obs[:] = adapter.env.state()
+                remote.send(infos)
+            elif cmd == "reset":
+                seed, options = data
+                infos = adapter.reset(seed=seed, options=options)
+                obs[:] = adapter.env.state()
+                remote.send(infos)
+            elif cmd == "render":
+                remote.send(adapter.render())
+            elif cmd == "get_attr":
+                remote.send(getattr(adapter.env, data))
+            elif cmd == "set_attr":
+                remote.send(setattr(adapter.env, data[0], data[1]))
+            elif cmd == "env_method":
+                method = getattr(adapter.env, data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "is_wrapped":
+                remote.send(isinstance(adapter.env, data))
+            elif cmd == "close":
+                break
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        adapter.env.close()
+        del obs, actions, rewards, dones
+        for shm in blocks.values():
+            shm.close()
+        remote.close()
+
+
+class SwarmVecEnv(VecEnv):
+    """
+    The SwarmVecEnv class runs several multi agent swarm environments, one per worker process, and exposes them as a
+    stable-baselines3 VecEnv where each agent of each environment is one sub-environment.
+    The observations, actions, rewards and done flags are exchanged through shared memory numpy buffers: only the
+    commands and the infos go through the pipes. The observations are the buffers filled by the ObservationBuilder of
+    each environment, they are returned as flat arrays, or as dictionaries for the pettingzoo environment.
+
+    An environment is reset automatically when its episode is done, the last observation of each agent is then in
+    info["terminal_observation"].
+
+    Example Usage
+        env_fns = [partial(MultiSwarmEnv, map_name="Easy", n_agents=2, n_targets=2, headless=True)
+                   for _ in range(8)]
+        vec_env = SwarmVecEnv(env_fns)
+        model = PPO("MultiInputPolicy", vec_env)
+        model.learn(total_timesteps=500_000)
+        vec_env.close()
+
+    Inputs
+        env_fns: functions creating the environments, they are called in the workers.
+        start_method: start method of the processes, "forkserver" by default when available, "spawn" otherwise.
+    """
+
+    def __init__(
+        self,
+        env_fns: List[Callable[[], Any]],
+        start_method: Optional[str] = None,
+    ):
+        self.waiting = False
+        self.closed = False
+        self.n_envs = len(env_fns)
+
+        if start_method is None:
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = mp.get_context(start_method)
+        # The workers share the resource tracker of the main process, which unlinks the shared memory in close()
+        resource_tracker.ensure_running()
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(self.n_envs)])
+        self.processes = []
+        for work_remote, remote, env_fn in zip(self.work_remotes, self.remotes, env_fns):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn))
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        specs = [remote.recv() for remote in self.remotes]
+        spec = specs[0]
+        self.n_agents = [s["n_agents"] for s in specs]
+        self._offsets = np.concatenate(([0], np.cumsum(self.n_agents)))
+        num_envs = int(self._offsets[-1])
+        if any(s["obs_dim"] != spec["obs_dim"] for s in specs):
+            raise ValueError("All the environments must have the same observation size.")
+
+        self._obs_slices = spec["obs_slices"]
+        observation_space = spec["observation_space"]
+        action_space = spec["action_space"]
+        action_dim = int(np.prod(action_space.shape))
+
+        self._blocks = {}
+        self._buffers = {}
+        for key, shape, dtype in [
+            ("obs", (num_envs, spec["obs_dim"]), np.float32),
+            ("actions", (num_envs, action_dim), np.float32),
+            ("rewards", (num_envs,), np.float32),
+            ("dones", (num_envs,), np.bool_),
+        ]:
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            self._blocks[key] = shared_memory.SharedMemory(create=True, size=size)
+            self._buffers[key] = np.ndarray(shape, dtype, self._blocks[key].buf)
+            self._buffers[key].fill(0)
+
+        names = {key: shm.name for key, shm in self._blocks.items()}
+        for remote, offset in zip(self.remotes, self._offsets[:-1]):
+            remote.send((names, int(offset)))
+
+        super().__init__(num_envs, observation_space, action_space)
+
+    def _env_index(self, index: int) -> int:
+        """Index of the environment of a sub-environment (one agent of an environment)"""
+        return int(np.searchsorted(self._offsets, index, side="right") - 1)
+
+    def _unflatten(self, obs: np.ndarray) -> VecEnvObs:
+        """Copy the flat observations, as a dictionary if the observation space is a Dict"""
+        if not isinstance(self.observation_space, spaces.Dict):
+            return obs.copy()
+        return {
+            key: obs[..., self._obs_slices[key]].reshape(obs.shape[:-1] + space.shape).copy()
+            for key, space in self.observation_space.spaces.items()
+        }
+
+    def _gather_infos(self, env_infos: List[List[dict]]) -> List[dict]:
+        infos = []
+        for agent_infos in env_infos:
+            for info in agent_infos:
+                if "terminal_observation" in info and isinstance(self.observation_space, spaces.Dict):
+                    info = dict(info, terminal_observation=self._unflatten(info["terminal_observation"]))
+                infos.append(info)
+        return infos
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._buffers["actions"][:] = np.asarray(actions, dtype=np.float32).reshape(
+            self._buffers["actions"].shape
+        )
+        for remote in self.remotes:
+            remote.send(("step", None))
+        self.waiting = True
+
+    def step_wait(self) -> VecEnvStepReturn:
+        env_infos = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        return (
+            self._unflatten(self._buffers["obs"]),
+            self._buffers["rewards"].copy(),
+            self._buffers["dones"].copy(),
+            self._gather_infos(env_infos),
+        )
+
+    def reset(self) -> VecEnvObs:
+        for env_idx, remote in enumerate(self.remotes):
+            first = int(self._offsets[env_idx])
+            remote.send(("reset", (self._seeds[first], self._options[first])))
+        env_infos = [remote.recv() for remote in self.remotes]
+        self.reset_infos = self._gather_infos(env_infos)
+        # Seeds and options are only used once
+        self._reset_seeds()
+        self._reset_options()
+        return self._unflatten(self._buffers["obs"])
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self._buffers = {}
+        for shm in self._blocks.values():
+            shm.close()
+            shm.unlink()
+        self.closed = True
+
+    def get_images(self) -> Sequence[Optional[np.ndarray]]:
+        for remote in self.remotes:
+            remote.send(("render", None))
+        return [remote.recv() for remote in self.remotes]
+
+    def _call_envs(self, indices: VecEnvIndices, cmd: str, data) -> List[Any]:
+        """
+        Send a command once to each environment of the sub-environments, and return one result per sub-environment
+        """
+        env_indexes = [self._env_index(i) for i in self._get_indices(indices)]
+        targets = sorted(set(env_indexes))
+        for env_idx in targets:
+            self.remotes[env_idx].send((cmd, data))
+        results = {env_idx: self.remotes[env_idx].recv() for env_idx in targets}
+        return [results[env_idx] for env_idx in env_indexes]
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return self._call_envs(indices, "get_attr", attr_name)
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        self._call_envs(indices, "set_attr", (attr_name, value))
+
+    def env_method(
+        self,
+        method_name: str,
+        *method_args,
+        indices: VecEnvIndices = None,
+        **method_kwargs,
+    ) -> List[Any]:
+        return self._call_envs(indices, "env_method", (method_name, method_args, method_kwargs))
+
+    def env_is_wrapped(
+        self, wrapper_class: Type[gym.Wrapper], indices: VecEnvIndices = None
+    ) -> List[bool]:
+        return self._call_envs(indices, "is_wrapped", wrapper_class)
@@ -7,12 +7,13 @@ import gymnasium as gym
 from stable_baselines3 import PPO, SAC, A2C
 import gymnasium as gym
 from swarm_env.multi_env.multi_agent_pettingzoo import MultiSwarmEnv
+from swarm_env.vec_env import SwarmVecEnv
 from stable_baselines3.common.callbacks import CheckpointCallback, CallbackList
 import numpy as np
 import torch.nn as nn
 from sb3_contrib import RecurrentPPO
-import supersuit as ss
 from datetime import datetime
+from functools import partial
 from training.utils import DummyRun
 
 use_wandb = False
@@ -46,60 +47,61 @@ kwargs_PPO = {
 }
 
 
-env = MultiSwarmEnv(**env_config)
-env = ss.pettingzoo_env_to_vec_env_v1(env)
-envs = ss.concat_vec_envs_v1(env, 4, num_cpus=1, base_class="stable_baselines3")
+if __name__ == "__main__":
+    # One process per environment, the workers import this script again
+    envs = SwarmVecEnv(
+        [partial(MultiSwarmEnv, **env_config) for _ in range(config["num_envs"])]
+    )
+
+    if use_wandb:
+        run = wandb.init(
+            project="multi-agent",
+            config=config,
+            sync_tensorboard=True,
+            monitor_gym=True,
+            save_code=True,
+        )
+    else:
+        run = DummyRun()
+
+    date = datetime.now()
+    formatted_date = date.strftime("%d-%m")
+
+    wandbcallback = (
+        WandbCallback(
+            gradient_save_freq=0,
+            model_save_path=f"models/ma/{formatted_date}/{run.id}",
+            verbose=2,
+        )
+        if use_wandb
+        else None
+    )
 
-if use_wandb:
-    run = wandb.init(
-        project="multi-agent",
-        config=config,
-        sync_tensorboard=True,
-        monitor_gym=True,
-        save_code=True,
+    checkpoint_callback = CheckpointCallback(
+        save_freq=5_000,
+        save_path=f"./checkpoints/ma/{formatted_date}/{run.id}",
+        name_prefix=f"model_{run.id}",
+        save_replay_buffer=True,
+        save_vecnormalize=True,
     )
-else:
-    run = DummyRun()
 
-date = datetime.now()
-formatted_date = date.strftime("%d-%m")
+    callbacks = [checkpoint_callback]
+    if wandbcallback:
+        callbacks.append(wandbcallback)
 
-wandbcallback = (
-    WandbCallback(
-        gradient_save_freq=0,
-        model_save_path=f"models/ma/{formatted_date}/{run.id}",
-        verbose=2,
+    algo_map = {"PPO": PPO, "SAC": SAC, "A2C": A2C, "R_PPO": RecurrentPPO}
+    model = algo_map[config["algo"]](
+        env=envs, tensorboard_log=f"runs/ma/{formatted_date}/{run.id}", **kwargs_PPO
     )
-    if use_wandb
-    else None
-)
-
-checkpoint_callback = CheckpointCallback(
-    save_freq=5_000,
-    save_path=f"./checkpoints/ma/{formatted_date}/{run.id}",
-    name_prefix=f"model_{run.id}",
-    save_replay_buffer=True,
-    save_vecnormalize=True,
-)
-
-callbacks = [checkpoint_callback]
-if wandbcallback:
-    callbacks.append(wandbcallback)
-
-
-algo_map = {"PPO": PPO, "SAC": SAC, "A2C": A2C, "R_PPO": RecurrentPPO}
-model = algo_map[config["algo"]](
-    env=envs, tensorboard_log=f"runs/ma/{formatted_date}/{run.id}", **kwargs_PPO
-)
-
-print("ALGO ", config["algo"])
-print(model.policy)
-
-model.learn(
-    total_timesteps=config["total_timesteps"],
-    callback=CallbackList(callbacks),
-    progress_bar=True,
-)
-
-env.close()
-run.finish()
+
+    print("ALGO ", config["algo"])
+    print(model.policy)
+
+    model.learn(
+        total_timesteps=config["total_timesteps"],
+        callback=CallbackList(callbacks),
+        progress_bar=True,
+    )
+
+    envs.close()
+    run.finish()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The packages are in src, as installed by setup.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
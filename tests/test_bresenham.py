@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from spg_overlay.utils.grid import Grid
+from spg_overlay.utils.utils import bresenham, bresenham_batch
+
+SIZE_AREA_WORLD = (300, 200)
+
+
+def _segments(rng, n, high):
+    """Random segments, with degenerate, horizontal, vertical and steep ones"""
+    starts = rng.integers(0, high, size=(n, 2))
+    ends = rng.integers(0, high, size=(n, 2))
+    ends[0:5] = starts[0:5]
+    ends[5:10, 0] = starts[5:10, 0]
+    ends[10:15, 1] = starts[10:15, 1]
+    ends[15:20, 0] = starts[15:20, 0] + rng.integers(-2, 3, size=5)
+    ends[20:25] = starts[20:25] + [[1, 1], [-1, -1], [1, -1], [-1, 1], [3, -3]]
+    return starts, ends
+
+
+def test_bresenham_batch_matches_bresenham():
+    rng = np.random.default_rng(0)
+    starts, ends = _segments(rng, 200, 60)
+
+    points, line_index = bresenham_batch(starts, ends)
+
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        expected = bresenham(tuple(start), tuple(end))
+        np.testing.assert_array_equal(points[line_index == i], np.reshape(expected, (-1, 2)))
+
+
+def test_bresenham_batch_empty():
+    points, line_index = bresenham_batch(np.zeros((0, 2)), np.zeros((0, 2)))
+
+    assert points.shape == (0, 2)
+    assert line_index.shape == (0,)
+
+
+@pytest.mark.parametrize("resolution", [1, 2, 8])
+def test_add_values_along_lines_matches_add_value_along_line(resolution):
+    rng = np.random.default_rng(resolution)
+    n = 300
+    # a few lines end outside of the world, they are ignored by both methods
+    x_0, x_1 = rng.uniform(-160, 160, size=(2, n))
+    y_0, y_1 = rng.uniform(-110, 110, size=(2, n))
+    x_1[0:5], y_1[0:5] = x_0[0:5], y_0[0:5]
+    x_1[5:15] = x_0[5:15]
+    y_1[15:25] = y_0[15:25]
+    x_1[25:35] = x_0[25:35] + rng.uniform(-2 * resolution, 2 * resolution, size=10)
+    x_0[35] = np.nan
+    val = rng.uniform(-1, 1, size=n)
+
+    expected = Grid(size_area_world=SIZE_AREA_WORLD, resolution=resolution)
+    for i in range(n):
+        expected.add_value_along_line(float(x_0[i]), float(y_0[i]), float(x_1[i]), float(y_1[i]), val[i])
+    grid = Grid(size_area_world=SIZE_AREA_WORLD, resolution=resolution)
+    grid.add_values_along_lines(x_0, y_0, x_1, y_1, val)
+
+    assert np.count_nonzero(expected.grid) > 0
+    np.testing.assert_allclose(grid.grid, expected.grid)
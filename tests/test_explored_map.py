@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+
+from spg_overlay.reporting.explored_map import ExploredMap
+
+WIDTH, HEIGHT = 600, 400
+
+
+class _Drone:
+    def __init__(self, position):
+        self.position = np.array(position, dtype=np.float64)
+
+    def true_position(self):
+        return self.position
+
+
+def _image_walls():
+    """Color image of a playground, the walls are dark"""
+    image = np.full((HEIGHT, WIDTH, 3), 255, dtype=np.uint8)
+    cv2.rectangle(image, (0, 0), (WIDTH - 1, HEIGHT - 1), (0, 0, 0), 4)
+    cv2.line(image, (300, 0), (300, 250), (0, 0, 0), 6)
+    cv2.rectangle(image, (80, 250), (180, 300), (0, 0, 0), -1)
+    return image
+
+
+def _explored_map(monkeypatch):
+    explored_map = ExploredMap()
+    monkeypatch.setattr(explored_map, "_create_image_walls", lambda playground: _image_walls())
+    explored_map.initialize_walls(None)
+    return explored_map
+
+
+def test_incremental_matches_full_recomputation(monkeypatch):
+    rng = np.random.default_rng(0)
+    incremental = _explored_map(monkeypatch)
+    full = _explored_map(monkeypatch)
+
+    positions = rng.uniform((-WIDTH / 2 + 10, -HEIGHT / 2 + 10), (WIDTH / 2 - 10, HEIGHT / 2 - 10), size=(3, 2))
+    drones = [_Drone(position) for position in positions]
+    for _ in range(60):
+        for drone in drones:
+            step = rng.normal(0, 25, size=2)
+            drone.position = np.clip(drone.position + step, (-WIDTH / 2 + 10, -HEIGHT / 2 + 10),
+                                     (WIDTH / 2 - 10, HEIGHT / 2 - 10))
+        incremental.update(drones)
+        full.update_drones(drones)
+        full._process_positions()
+
+        assert np.array_equal(incremental._map_explo_zones, full._map_explo_zones)
+        assert incremental._count_pixel_explored == full._count_pixel_explored
+        assert incremental.score() == full.score()
+
+    assert incremental._count_pixel_explored > 0
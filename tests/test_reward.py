@@ -0,0 +1,171 @@
+import numpy as np
+
+from swarm_env.reward import RewardEngine
+
+"""
+Regression check of the RewardEngine against the reward code the environments had before it, written out below for
+the gym, market and single agent environments. The drones and the persons are stand-ins with fixed positions and
+counters, as the collision handlers would leave them after the physics ticks of a step.
+"""
+
+
+class _Person:
+    def __init__(self, position):
+        self.position = position
+
+
+class _Drone:
+    def __init__(self):
+        self.reward = 0
+        self.collision_count = 0
+        self.touch_count = 0
+        self.grasp_conflict_count = 0
+        self.grasped = []
+
+    def reset_contact_counters(self):
+        self.collision_count = 0
+        self.touch_count = 0
+        self.grasp_conflict_count = 0
+
+    def grasped_entities(self):
+        return self.grasped
+
+
+RESCUE_CENTER = (100.0, -50.0)
+PERSONS_BEFORE = [(-120.0, 80.0), (30.0, 40.0), (200.0, 10.0)]
+PERSONS_AFTER = [(-100.0, 70.0), (35.0, 20.0), (200.0, 10.0)]
+ACTIONS = np.array([[0.5, 0.0, 0.3, 1.0], [1.0, -0.2, -0.8, 0.0], [0.0, 1.0, 0.0, 1.0]])
+# Events of the step for each drone
+RESCUED = [1, 0, 0]
+COLLIDED = [0, 1, 1]
+TOUCHED = [1, 0, 1]
+CONFLICT = [0, 1, 1]
+
+
+def _distance(a, b):
+    return np.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
+
+
+def _delta_distances():
+    return sum(_distance(after, RESCUE_CENTER) - _distance(before, RESCUE_CENTER)
+               for before, after in zip(PERSONS_BEFORE, PERSONS_AFTER))
+
+
+def _run_engine(engine, n_agents, terminated, truncated, delta_exp_score, order=None, collided=COLLIDED,
+                rescued=RESCUED):
+    drones = [_Drone() for _ in range(n_agents)]
+    persons = [_Person(position) for position in PERSONS_BEFORE]
+    engine.reset(drones, persons, RESCUE_CENTER)
+    engine.begin_step(ACTIONS[:n_agents])
+    for person, position in zip(persons, PERSONS_AFTER):
+        person.position = position
+    for i, drone in enumerate(drones):
+        drone.collision_count = collided[i]
+        drone.touch_count = TOUCHED[i]
+        drone.grasp_conflict_count = CONFLICT[i]
+    # The drone 1 carries the person 0, the drone 2 the person 1
+    if n_agents > 2:
+        drones[1].grasped = [persons[0]]
+        drones[2].grasped = [persons[1]]
+    for i, drone in enumerate(drones):
+        drone.reward = rescued[i]
+    rescued = engine.record_rescues()
+    engine.end_step(terminated, truncated, order=order)
+    engine.add_exploration(delta_exp_score)
+    return rescued
+
+
+def _previous_multi_rewards(rescue_reward, truncation_penalty, use_conflict_reward, truncated, delta_exp_score,
+                            order=None, floor=-10 * len(ACTIONS), collided=COLLIDED, rescued=RESCUED):
+    """The rewards of MultiSwarmEnv and MASwarmMarket before the RewardEngine"""
+    n_agents = len(ACTIONS)
+    rewards = [-0.5 for _ in range(n_agents)]
+    for i in range(n_agents):
+        if rescued[i] != 0:
+            rewards[i] += rescue_reward
+    for i in range(n_agents):
+        rew = -np.abs(ACTIONS[i][2])
+        if collided[i]:
+            rew -= 1
+        if TOUCHED[i]:
+            rew += 1
+        if CONFLICT[i] and use_conflict_reward:
+            rew -= 1
+        if order is not None:
+            carried = {1: 0, 2: 1}
+            for j in range(len(order)):
+                if order[j] == i and carried.get(i) == j:
+                    rew += 1
+        rewards[i] += rew
+    if truncated:
+        for i in range(len(rewards)):
+            rewards[i] -= truncation_penalty
+
+    shared_reward = sum(rewards)
+    if not truncated:
+        shared_reward = max(shared_reward, floor)
+    shared_reward -= _delta_distances() / 5
+    shared_reward += 50 * delta_exp_score
+    return rewards, shared_reward
+
+
+def _previous_single_reward(terminated, truncated, delta_score):
+    """The reward of SwarmEnv before the RewardEngine, for the drone 0"""
+    reward = -0.5 - np.abs(ACTIONS[0][2])
+    if terminated:
+        reward += 50
+    reward = reward - COLLIDED[0] + TOUCHED[0]
+    reward -= _delta_distances() / 5
+    reward += 50 * delta_score
+    if truncated:
+        reward -= 20
+    return reward
+
+
+def test_gym_rewards():
+    for use_conflict_reward in (False, True):
+        for truncated in (False, True):
+            engine = RewardEngine(n_agents=3, rescue_reward=30, truncation_penalty=10,
+                                  use_conflict_reward=use_conflict_reward, shared_floor=-30)
+            rescued = _run_engine(engine, 3, False, truncated, 0.01)
+            rewards, shared = _previous_multi_rewards(30, 10, use_conflict_reward, truncated, 0.01)
+            assert rescued == sum(RESCUED)
+            np.testing.assert_allclose(engine.individual, rewards)
+            np.testing.assert_allclose(engine.shared, shared)
+            assert engine.conflicts.tolist() == CONFLICT
+
+
+def test_gym_contacts_and_floor():
+    # The counters are counts of contacts, a drone hit at several ticks is penalized once, as is_collided() did
+    engine = RewardEngine(n_agents=3, rescue_reward=30, truncation_penalty=10, shared_floor=-30)
+    _run_engine(engine, 3, False, False, 0.0, collided=[40, 0, 7])
+    rewards, shared = _previous_multi_rewards(30, 10, False, False, 0.0, collided=[True, False, True])
+    np.testing.assert_allclose(engine.individual, rewards)
+
+    # The floor of -10 * n_agents is not reached by one step, a higher one checks it is applied the same way
+    for truncated in (False, True):
+        engine = RewardEngine(n_agents=3, rescue_reward=30, truncation_penalty=10, shared_floor=-2)
+        _run_engine(engine, 3, False, truncated, 0.0, rescued=[0, 0, 0])
+        rewards, shared = _previous_multi_rewards(30, 10, False, truncated, 0.0, floor=-2, rescued=[0, 0, 0])
+        assert truncated or sum(rewards) < -2
+        np.testing.assert_allclose(engine.shared, shared)
+
+
+def test_market_rewards():
+    # The drone 1 was ordered to take the person 0 it carries, the drone 0 the persons 1 and 2 it does not carry
+    order = np.array([1, 0, 0])
+    for truncated in (False, True):
+        engine = RewardEngine(n_agents=3, rescue_reward=50, truncation_penalty=20, use_conflict_reward=True,
+                              shared_floor=-30)
+        _run_engine(engine, 3, False, truncated, 0.02, order=order)
+        rewards, shared = _previous_multi_rewards(50, 20, True, truncated, 0.02, order=order)
+        np.testing.assert_allclose(engine.individual, rewards)
+        np.testing.assert_allclose(engine.shared, shared)
+
+
+def test_single_agent_reward():
+    for terminated, truncated in ((False, False), (True, False), (False, True)):
+        engine = RewardEngine(n_agents=1, rescue_reward=0, completion_reward=50, truncation_penalty=20)
+        _run_engine(engine, 1, terminated, truncated, 0.03)
+        np.testing.assert_allclose(engine.shared, _previous_single_reward(terminated, truncated, 0.03))
+
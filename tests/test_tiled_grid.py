@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from spg_overlay.utils.grid import Grid
+from spg_overlay.utils.tiled_grid import TiledGrid
+from swarm_env.occupancy_mapping import OccupancyGridMapper
+
+SIZE_AREA_WORLD = (300, 200)
+
+
+def _lines(rng, n):
+    """Random lines in the world, with degenerate, vertical, horizontal and steep ones, and a few outside"""
+    x_0, x_1 = rng.uniform(-160, 160, size=(2, n))
+    y_0, y_1 = rng.uniform(-110, 110, size=(2, n))
+    x_1[0:5], y_1[0:5] = x_0[0:5], y_0[0:5]
+    x_1[5:15] = x_0[5:15]
+    y_1[15:25] = y_0[15:25]
+    x_1[25:35] = x_0[25:35] + rng.uniform(-4, 4, size=10)
+    return x_0, y_0, x_1, y_1
+
+
+@pytest.mark.parametrize("resolution, tile_size", [(1, 64), (2, 16), (8, 7)])
+def test_tiled_grid_matches_grid(resolution, tile_size):
+    rng = np.random.default_rng(resolution)
+    grid = Grid(size_area_world=SIZE_AREA_WORLD, resolution=resolution, dtype=np.float32)
+    tiled = TiledGrid(size_area_world=SIZE_AREA_WORLD, resolution=resolution, dtype=np.float32, tile_size=tile_size)
+
+    x_0, y_0, x_1, y_1 = _lines(rng, 200)
+    val = rng.uniform(-1, 1, size=len(x_0)).astype(np.float32)
+    for g in (grid, tiled):
+        for i in range(20):
+            g.add_value_along_line(float(x_0[i]), float(y_0[i]), float(x_1[i]), float(y_1[i]), val[i])
+        g.add_values_along_lines(x_0[20:], y_0[20:], x_1[20:], y_1[20:], val[20:])
+        g.add_points(x_1, y_1, 2.0)
+
+    dense = tiled.to_dense()
+    assert np.count_nonzero(grid.grid) > 0
+    np.testing.assert_array_equal(dense, grid.grid)
+
+    x_px = rng.integers(0, grid.x_max_grid, size=500)
+    y_px = rng.integers(0, grid.y_max_grid, size=500)
+    np.testing.assert_array_equal(tiled.get_values(x_px, y_px), grid.grid[x_px, y_px])
+
+    tiled.clear()
+    assert tiled.nbytes == 0
+    assert np.count_nonzero(tiled.to_dense()) == 0
+
+
+class _Drone:
+    def __init__(self, rng, size_area):
+        self._position = rng.uniform(-0.45, 0.45, size=2) * size_area
+        self._angle = rng.uniform(-np.pi, np.pi)
+        self._lidar = rng.uniform(0, 300, size=181)
+
+    def lidar_values(self):
+        return self._lidar
+
+    def lidar_rays_angles(self):
+        return np.linspace(-np.pi, np.pi, 181)
+
+    def true_position(self):
+        return self._position
+
+    def true_angle(self):
+        return self._angle
+
+
+@pytest.mark.parametrize("size_area, resolution, mode", [((1113, 750), 2, "drone"),
+                                                         ((1113, 750), 8, "swarm"),
+                                                         ((100, 90), 8, "drone")])
+def test_tiled_mapper_matches_dense_mapper(size_area, resolution, mode):
+    rng = np.random.default_rng(0)
+    dense = OccupancyGridMapper(4, mode=mode, resolution=resolution)
+    tiled = OccupancyGridMapper(4, mode=mode, resolution=resolution, tiled=True)
+    dense.reset(size_area)
+    tiled.reset(size_area)
+
+    for _ in range(10):
+        drones = [_Drone(rng, np.array(size_area)) for _ in range(4)]
+        dense.update(drones)
+        tiled.update(drones)
+
+    assert tiled.log_odds is None
+    for grid, tiled_grid in zip(dense.grids, tiled.grids):
+        np.testing.assert_array_equal(tiled_grid.to_dense(), grid.grid)
+    np.testing.assert_allclose(tiled.observations(), dense.observations(), atol=1e-6)